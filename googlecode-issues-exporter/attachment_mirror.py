@@ -0,0 +1,321 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Mirrors the attachments of Google Code issues into a local cache.
+
+Exported issues link to their attachments on Google's mirror of them, at
+issues.ATTACHMENT_URL. Mirroring the attachments into a cache, and putting
+the cache's objects directory on a server of your own, keeps them available
+wherever the issues are.
+
+Each attachment is stored once under the SHA-1 of its content, however many
+comments it is attached to, as objects/<first 2 digits>/<SHA-1><extension>.
+The cache's journal records the object of each mirrored attachment, so an
+interrupted mirror picks up where it left off.
+
+Usage:
+    python attachment_mirror.py --issue_file_path=GoogleCodeProjectHosting.json \\
+        --project_name=my-project --cache_dir=attachments
+
+Then serve attachments/objects at e.g. https://example.com/attachments, and
+pass --attachment_cache=attachments and
+--attachment_url=https://example.com/attachments to github_issue_converter.py.
+"""
+
+import argparse
+import errno
+import hashlib
+import httplib
+import multiprocessing.pool
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import urllib
+
+import httplib2
+
+import github_services
+import issues
+
+# The number of attachments to download at once.
+MIRROR_WORKERS = 16
+# The maximum number of times to try downloading an attachment.
+MAX_DOWNLOAD_ATTEMPTS = 3
+# The time (in seconds) to wait before the first retry of a failed download.
+DOWNLOAD_RETRY_BACKOFF = 1
+# The file in a cache recording the object of each mirrored attachment.
+JOURNAL_FILE_NAME = "journal.txt"
+# The directory in a cache holding the content of the attachments.
+OBJECTS_DIR_NAME = "objects"
+
+# Extensions kept on objects, so that servers know their content types.
+_EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+# Errors raised by httplib2 for downloads that may succeed if tried again.
+_DOWNLOAD_ERRORS = (socket.error, httplib.HTTPException,
+                    httplib2.HttpLib2Error)
+
+
+def GetAttachmentPaths(issue_data, project_name):
+  """Gets the attachments of the issues of a project.
+
+  Args:
+    issue_data: The issue data of the project.
+    project_name: The name of the project.
+
+  Returns:
+    The list of the paths of the attachments, see
+    issues.GoogleCodeComment.GetAttachmentPaths.
+  """
+  attachment_paths = []
+  for issue in issue_data:
+    googlecode_issue = issues.GoogleCodeIssue(issue, project_name, {})
+    # The description of the issue is comment #0, which may have attachments.
+    comments = issue["comments"]["items"][:1] + googlecode_issue.GetComments()
+    for comment in comments:
+      googlecode_comment = issues.GoogleCodeComment(googlecode_issue, comment)
+      attachment_paths.extend(
+          path for _, path in googlecode_comment.GetAttachmentPaths())
+  return attachment_paths
+
+
+def MirrorProjects(cache_dir, project_issue_data,
+                   source_url=issues.ATTACHMENT_URL, workers=MIRROR_WORKERS):
+  """Mirrors the attachments of the issues of projects into a cache.
+
+  Only the attachments not mirrored by an earlier run are downloaded. A
+  warning is printed for each attachment that couldn't be.
+
+  Args:
+    cache_dir: The directory of the cache.
+    project_issue_data: The issue data of each project, by project name.
+    source_url: The URL to download the attachments from.
+    workers: The number of attachments to download at once.
+
+  Returns:
+    The AttachmentCache.
+  """
+  cache = AttachmentCache(cache_dir)
+  attachment_paths = []
+  for project_name, issue_data in sorted(project_issue_data.items()):
+    attachment_paths.extend(GetAttachmentPaths(issue_data, project_name))
+  for attachment_path in cache.Mirror(attachment_paths, source_url, workers):
+    print "Warning: Couldn't mirror attachment %s" % attachment_path
+  return cache
+
+
+class AttachmentCache(object):
+  """A content-addressed cache of attachments."""
+
+  def __init__(self, cache_dir, retry_backoff=DOWNLOAD_RETRY_BACKOFF):
+    """Opens a cache, creating it if needed.
+
+    Args:
+      cache_dir: The directory of the cache.
+      retry_backoff: The time (in seconds) to wait before the first retry of
+          a failed download.
+    """
+    self._cache_dir = cache_dir
+    self._objects_dir = os.path.join(cache_dir, OBJECTS_DIR_NAME)
+    self._journal_path = os.path.join(cache_dir, JOURNAL_FILE_NAME)
+    # The path of each mirrored attachment's object, by attachment path.
+    self._objects = {}
+    # Held while recording a mirrored attachment.
+    self._lock = threading.Lock()
+    self._retry_backoff = retry_backoff
+    # The HTTP instance of each download thread.
+    self._thread_local = threading.local()
+    # Whether the journal ends with an incomplete line.
+    self._journal_torn = False
+
+    if os.path.exists(self._journal_path):
+      with open(self._journal_path) as journal:
+        for line in journal:
+          # The last line is incomplete if the mirror was interrupted, and
+          # is completed by the next mirror.
+          if not line.endswith("\n"):
+            self._journal_torn = True
+            continue
+          fields = line[:-1].decode("utf-8").split("\t", 1)
+          if len(fields) != 2:
+            continue
+          object_path, attachment_path = fields
+          if os.path.exists(os.path.join(self._objects_dir, object_path)):
+            self._objects[attachment_path] = object_path
+
+  def GetObjectPath(self, attachment_path):
+    """Returns the path of an attachment's object, or None if not mirrored.
+
+    The path is relative to the objects directory of the cache.
+    """
+    return self._objects.get(attachment_path)
+
+  def GetObjectFilePath(self, object_path):
+    """Returns the path of the file of an object, given its object path."""
+    return os.path.join(self._objects_dir, object_path)
+
+  def GetLinks(self, attachment_url):
+    """Gets the links to the mirrored attachments.
+
+    Args:
+      attachment_url: The URL the objects directory of the cache is served at.
+
+    Returns:
+      A map from the path of each mirrored attachment to its URL, for use as
+      the attachment_links of an IssueExporter.
+    """
+    attachment_url = attachment_url.rstrip("/")
+    return dict((attachment_path, "%s/%s" % (attachment_url, object_path))
+                for attachment_path, object_path in self._objects.items())
+
+  def Mirror(self, attachment_paths, source_url=issues.ATTACHMENT_URL,
+             workers=MIRROR_WORKERS):
+    """Downloads the attachments that aren't mirrored yet.
+
+    Args:
+      attachment_paths: The paths of the attachments to mirror.
+      source_url: The URL to download the attachments from.
+      workers: The number of attachments to download at once.
+
+    Returns:
+      The list of paths of the attachments that could not be downloaded.
+    """
+    missing_paths = []
+    seen_paths = set(self._objects)
+    for attachment_path in attachment_paths:
+      if attachment_path not in seen_paths:
+        seen_paths.add(attachment_path)
+        missing_paths.append(attachment_path)
+    if not missing_paths:
+      return []
+
+    if not os.path.exists(self._cache_dir):
+      os.makedirs(self._cache_dir)
+    failed_paths = []
+    pool = multiprocessing.pool.ThreadPool(max(1, workers))
+    with open(self._journal_path, "a") as journal:
+      if self._journal_torn:
+        journal.write("\n")
+        self._journal_torn = False
+      try:
+        downloads = pool.imap_unordered(
+            lambda path: (path, self._Download(source_url, path, journal)),
+            missing_paths)
+        for count, (attachment_path, downloaded) in enumerate(downloads, 1):
+          if not downloaded:
+            failed_paths.append(attachment_path)
+          sys.stdout.write("\rMirrored attachment %d/%d        " %
+                           (count, len(missing_paths)))
+          sys.stdout.flush()
+      finally:
+        pool.close()
+        pool.join()
+    print ""  # Advance past the progress line.
+    return failed_paths
+
+  def _Download(self, source_url, attachment_path, journal):
+    """Downloads an attachment into the cache.
+
+    Args:
+      source_url: The URL to download the attachment from.
+      attachment_path: The path of the attachment.
+      journal: The cache's journal, open for appending.
+
+    Returns:
+      Whether the attachment was downloaded.
+    """
+    url = "%s/%s" % (source_url, urllib.quote(attachment_path.encode("utf-8")))
+    for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+      if attempt > 1:
+        github_services.WaitToRetry(attempt - 1, self._retry_backoff)
+      try:
+        response, content = github_services.GetThreadHttp(
+            self._thread_local).request(url, "GET")
+      except _DOWNLOAD_ERRORS:
+        continue
+      if response.status == httplib.OK:
+        self._AddObject(attachment_path, content, journal)
+        return True
+      if response.status < 500:
+        return False
+    return False
+
+  def _AddObject(self, attachment_path, content, journal):
+    """Stores an attachment's content, unless it is stored already.
+
+    Args:
+      attachment_path: The path of the attachment.
+      content: The content of the attachment.
+      journal: The cache's journal, open for appending.
+    """
+    digest = hashlib.sha1(content).hexdigest()
+    extension = os.path.splitext(attachment_path)[1].lower()
+    if not _EXTENSION_RE.match(extension):
+      extension = ""
+    object_dir = os.path.join(self._objects_dir, digest[:2])
+    object_path = "%s/%s%s" % (digest[:2], digest, extension)
+    object_file_path = os.path.join(self._objects_dir, object_path)
+
+    if not os.path.exists(object_file_path):
+      try:
+        os.makedirs(object_dir)
+      except OSError as e:
+        if e.errno != errno.EEXIST:
+          raise
+      # Written next to the object and moved there once complete, so that
+      # objects are never partly written.
+      temp_fd, temp_path = tempfile.mkstemp(dir=object_dir, suffix=".tmp")
+      with os.fdopen(temp_fd, "wb") as object_file:
+        object_file.write(content)
+      os.rename(temp_path, object_file_path)
+
+    with self._lock:
+      journal.write("%s\t%s\n" % (object_path,
+                                  attachment_path.encode("utf-8")))
+      journal.flush()
+      self._objects[attachment_path] = object_path
+
+
+def main(args):
+  """The main function.
+
+  Args:
+    args: The command line arguments.
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--issue_file_path", required=True,
+                      help="The path to the file containing the issues from "
+                      "Google Code.")
+  parser.add_argument("--project_name", required=True,
+                      help="The name of the Google Code project whose "
+                      "attachments to mirror.")
+  parser.add_argument("--cache_dir", required=True,
+                      help="The directory to mirror the attachments into.")
+  parser.add_argument("--workers", required=False, type=int,
+                      default=MIRROR_WORKERS,
+                      help="The number of attachments to download at once.")
+  parsed_args, _ = parser.parse_known_args(args)
+
+  issue_data = issues.LoadIssueData(parsed_args.issue_file_path,
+                                    parsed_args.project_name)
+  MirrorProjects(parsed_args.cache_dir,
+                 {parsed_args.project_name: issue_data},
+                 workers=parsed_args.workers)
+  print "\nMirrored the attachments into %s.\n" % parsed_args.cache_dir
+
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,204 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the attachment mirror."""
+
+# pylint: disable=missing-docstring,protected-access
+
+import BaseHTTPServer
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import urllib
+
+import attachment_mirror
+
+from issues_test import COMMENT_ONE
+from issues_test import COMMENT_TWO
+from issues_test import COMMENT_THREE
+from issues_test import REPO
+
+ISSUE_DATA = [
+    {
+        "id": 1,
+        "comments": {"items": [
+            dict(COMMENT_ONE, attachments=[{"fileName": "screenshot.png"}]),
+            dict(COMMENT_TWO, attachments=[
+                {"fileName": "log file.txt"},
+                {"fileName": "old.log", "isDeleted": True},
+            ]),
+            dict(COMMENT_THREE, deletedBy={"name": "user@email.com"},
+                 attachments=[{"fileName": "deleted.txt"}]),
+        ]},
+    },
+    {
+        "id": 2,
+        "comments": {"items": [
+            COMMENT_ONE,
+            dict(COMMENT_TWO, attachments=[{"fileName": "copy.png"}]),
+        ]},
+    },
+]
+
+ATTACHMENTS = {
+    REPO + "/issue-1/comment-1/screenshot.png": "PNG",
+    REPO + "/issue-1/comment-2/log file.txt": "Log",
+    # The same content as the screenshot.
+    REPO + "/issue-2/comment-2/copy.png": "PNG",
+}
+
+
+class _AttachmentRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Stands in for Google's mirror of the Google Code attachments."""
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    path = urllib.unquote(self.path.lstrip("/"))
+    self.server.requests.append(path)
+    # Fails the first requests for flaky attachments, as overloaded servers do.
+    if self.server.failures.get(path):
+      self.server.failures[path] -= 1
+      self.send_response(503)
+      self.end_headers()
+      return
+    content = self.server.attachments.get(path)
+    if content is None:
+      self.send_response(404)
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def log_message(self, *args):
+    pass
+
+
+class AttachmentMirrorTest(unittest.TestCase):
+  """Tests for the AttachmentCache."""
+
+  def setUp(self):
+    self.server = BaseHTTPServer.HTTPServer(
+        ("127.0.0.1", 0), _AttachmentRequestHandler)
+    self.server.attachments = ATTACHMENTS
+    self.server.requests = []
+    self.server.failures = {}
+    self.server_thread = threading.Thread(target=self.server.serve_forever)
+    self.server_thread.daemon = True
+    self.server_thread.start()
+    self.source_url = "http://127.0.0.1:%d" % self.server.server_address[1]
+    self.cache_dir = os.path.join(tempfile.mkdtemp(), "cache")
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.server_thread.join()
+    shutil.rmtree(os.path.dirname(self.cache_dir))
+
+  def _Mirror(self, attachment_paths):
+    cache = attachment_mirror.AttachmentCache(self.cache_dir, retry_backoff=0)
+    return cache, cache.Mirror(attachment_paths, self.source_url, workers=4)
+
+  def testGetAttachmentPaths(self):
+    self.assertEqual(
+        [REPO + "/issue-1/comment-1/screenshot.png",
+         REPO + "/issue-1/comment-2/log file.txt",
+         REPO + "/issue-2/comment-2/copy.png"],
+        attachment_mirror.GetAttachmentPaths(ISSUE_DATA, REPO))
+
+  def testMirror(self):
+    cache, failed_paths = self._Mirror(
+        attachment_mirror.GetAttachmentPaths(ISSUE_DATA, REPO))
+    self.assertEqual([], failed_paths)
+    self.assertItemsEqual(ATTACHMENTS.keys(), self.server.requests)
+
+    # Attachments with the same content share their object.
+    png_object = cache.GetObjectPath(REPO + "/issue-1/comment-1/screenshot.png")
+    self.assertTrue(png_object.endswith(".png"))
+    self.assertEqual(
+        png_object, cache.GetObjectPath(REPO + "/issue-2/comment-2/copy.png"))
+    txt_object = cache.GetObjectPath(REPO + "/issue-1/comment-2/log file.txt")
+    objects_dir = os.path.join(self.cache_dir, attachment_mirror.OBJECTS_DIR_NAME)
+    self.assertEqual(2, sum(len(files) for _, _, files in os.walk(objects_dir)))
+    with open(os.path.join(objects_dir, txt_object)) as object_file:
+      self.assertEqual("Log", object_file.read())
+
+    self.assertEqual(
+        {REPO + "/issue-1/comment-1/screenshot.png":
+             "https://example.com/attachments/" + png_object,
+         REPO + "/issue-1/comment-2/log file.txt":
+             "https://example.com/attachments/" + txt_object,
+         REPO + "/issue-2/comment-2/copy.png":
+             "https://example.com/attachments/" + png_object},
+        cache.GetLinks("https://example.com/attachments/"))
+
+  def testMirror_Resume(self):
+    self._Mirror([REPO + "/issue-1/comment-1/screenshot.png"])
+    # An interrupted write leaves an incomplete line in the journal.
+    with open(os.path.join(self.cache_dir, attachment_mirror.JOURNAL_FILE_NAME),
+              "a") as journal:
+      journal.write("ab/abcdef")
+
+    self.server.requests = []
+    cache, failed_paths = self._Mirror(ATTACHMENTS.keys())
+    self.assertEqual([], failed_paths)
+    self.assertItemsEqual(
+        [REPO + "/issue-1/comment-2/log file.txt",
+         REPO + "/issue-2/comment-2/copy.png"], self.server.requests)
+    self.assertEqual(3, len(cache.GetLinks("https://example.com")))
+
+    self.server.requests = []
+    self._Mirror(ATTACHMENTS.keys())
+    self.assertEqual([], self.server.requests)
+
+  def testMirror_Missing(self):
+    missing_path = REPO + "/issue-3/comment-1/missing.txt"
+    cache, failed_paths = self._Mirror(
+        [missing_path, REPO + "/issue-1/comment-2/log file.txt"])
+    self.assertEqual([missing_path], failed_paths)
+    # Missing attachments aren't tried again.
+    self.assertEqual(2, len(self.server.requests))
+    self.assertIsNone(cache.GetObjectPath(missing_path))
+
+  def testMirror_Retry(self):
+    flaky_path = REPO + "/issue-1/comment-2/log file.txt"
+    down_path = REPO + "/issue-1/comment-1/screenshot.png"
+    self.server.failures = {
+        flaky_path: 1,
+        down_path: attachment_mirror.MAX_DOWNLOAD_ATTEMPTS,
+    }
+    cache, failed_paths = self._Mirror([flaky_path, down_path])
+    self.assertEqual([down_path], failed_paths)
+    self.assertIsNotNone(cache.GetObjectPath(flaky_path))
+    self.assertEqual(2, self.server.requests.count(flaky_path))
+    self.assertEqual(attachment_mirror.MAX_DOWNLOAD_ATTEMPTS,
+                     self.server.requests.count(down_path))
+
+  def testMirrorProjects(self):
+    missing_issue_data = [{"id": 3, "comments": {"items": [
+        dict(COMMENT_ONE, attachments=[{"fileName": "missing.txt"}])]}}]
+    cache = attachment_mirror.MirrorProjects(
+        self.cache_dir, {REPO: ISSUE_DATA + missing_issue_data},
+        self.source_url, workers=4)
+    self.assertItemsEqual(ATTACHMENTS.keys(),
+                          cache.GetLinks("https://example.com").keys())
+    self.assertIn("Warning: Couldn't mirror attachment %s/issue-3/" % REPO,
+                  sys.stdout.getvalue())
+
+
+if __name__ == "__main__":
+  unittest.main(buffer=True)
@@ -19,14 +19,37 @@ exception of the following:
  - Issue Assignee is called an Owner
  - Issue Reporter is called an Author
  - Comment User is called an Author
+
+The issues are written to a zip archive in the format of BitBucket's issue
+importer, with the issue data in db-1.0.json and the attachments mirrored by
+attachment_mirror.py, if any, under attachments/.
 """
 
 import argparse
 import json
+import os
+import struct
 import sys
+import tempfile
+import time
+import zipfile
+import zlib
 
+import attachment_mirror
 import issues
 
+# The default path of the zip archive to write.
+OUTPUT_PATH = "bitbucket-issues.zip"
+# The name of the issue data in the zip archive.
+ISSUE_DATA_NAME = "db-1.0.json"
+# The directory of the attachments in the zip archive.
+ATTACHMENTS_DIR_NAME = "attachments"
+# About how much of the spooled issue data to copy into the zip archive at a
+# time.
+_COPY_CHUNK_SIZE = 64 * 1024
+# The signature of the data descriptor following a zip member's data.
+_DATA_DESCRIPTOR_SIGNATURE = "PK\x07\x08"
+
 
 def _getKind(kind):
   mapping = {
@@ -66,6 +89,113 @@ def _getTitle(title):
   return title[:250] + "[...]"
 
 
+class _StreamingZipWriter(object):
+  """Writes members to a zip archive as their data is produced.
+
+  Python's zipfile needs the whole data of a member up front, so this writes
+  the member's sizes and CRC in a data descriptor after the data instead.
+  That needs the ZipFile's internals: its file, its checks and its list of
+  members, which are only used here.
+  """
+
+  def __init__(self, zip_file):
+    """Initialize the _StreamingZipWriter.
+
+    Args:
+      zip_file: The ZipFile to write members to, open for writing. Other
+          members can still be written to it directly.
+    """
+    self._zip_file = zip_file
+
+  def WriteMember(self, member_name, chunks):
+    """Writes a member, compressing its data as it is produced.
+
+    Args:
+      member_name: The name of the member.
+      chunks: An iterable of the data of the member, as byte strings.
+
+    Raises:
+      zipfile.LargeZipFile: The member is too large for a zip archive without
+          the ZIP64 extensions.
+    """
+    # pylint: disable=protected-access
+    zip_file = self._zip_file
+    zinfo = zipfile.ZipInfo(member_name, time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0644 << 16
+    # The sizes and CRC follow the data.
+    zinfo.flag_bits = 0x08
+    zinfo.header_offset = zip_file.fp.tell()
+    zinfo.CRC = zinfo.compress_size = zinfo.file_size = 0
+    zip_file._writecheck(zinfo)
+    zip_file._didModify = True
+    zip_file.fp.write(zinfo.FileHeader())
+
+    # Negative window bits make zlib write the raw data zip archives expect.
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    for chunk in chunks:
+      zinfo.CRC = zlib.crc32(chunk, zinfo.CRC) & 0xffffffff
+      zinfo.file_size += len(chunk)
+      data = compressor.compress(chunk)
+      zinfo.compress_size += len(data)
+      zip_file.fp.write(data)
+    data = compressor.flush()
+    zinfo.compress_size += len(data)
+    zip_file.fp.write(data)
+    if max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+      raise zipfile.LargeZipFile("%s is too large" % member_name)
+
+    zip_file.fp.write(struct.pack("<4sLLL", _DATA_DESCRIPTOR_SIGNATURE,
+                                  zinfo.CRC, zinfo.compress_size,
+                                  zinfo.file_size))
+    zip_file.filelist.append(zinfo)
+    zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+class _RecordSpool(object):
+  """JSON records kept in a temporary file until they are written out."""
+
+  def __init__(self):
+    self._file = tempfile.TemporaryFile()
+    self._count = 0
+
+  def Append(self, record):
+    """Adds a record to the end of the spool."""
+    self._file.seek(0, os.SEEK_END)
+    self._file.write(json.dumps(record, sort_keys=True) + "\n")
+    self._count += 1
+
+  def GetRecords(self):
+    """Returns the list of records, decoded. Used by tests."""
+    self._file.seek(0)
+    return [json.loads(line) for line in self._file]
+
+  def GetJsonChunks(self):
+    """Yields the records as the chunks of a JSON list.
+
+    Records are joined into chunks of about _COPY_CHUNK_SIZE.
+    """
+    self._file.seek(0)
+    chunk = ["["]
+    chunk_size = 1
+    separator = "\n"
+    for line in self._file:
+      chunk.append(separator + line[:-1])
+      chunk_size += len(chunk[-1])
+      separator = ",\n"
+      if chunk_size >= _COPY_CHUNK_SIZE:
+        yield "".join(chunk)
+        chunk = []
+        chunk_size = 0
+    chunk.append("\n]")
+    yield "".join(chunk)
+
+  def Close(self):
+    """Closes the spool, deleting its file."""
+    self._file.close()
+
+
 class UserService(issues.UserService):
   """BitBucket user operations.
   """
@@ -82,18 +212,38 @@ class IssueService(issues.IssueService):
   """Abstract issue operations.
 
   Handles creating and updating issues and comments on an user API.
+
+  The issues and comments are spooled to temporary files, since the issue
+  data can only be written to the zip archive once all of it is known.
+  Attachments are copied into the zip archive right away.
   """
-  def __init__(self):
-    self._bitbucket_issues = []
-    self._bitbucket_comments = []
+  def __init__(self, zip_file=None, attachment_cache=None):
+    """Initialize the IssueService.
 
-  def GetIssues(self, state="open"):
+    Args:
+      zip_file: The ZipFile to write attachments and the issue data to, see
+          WriteIssueData.
+      attachment_cache: The AttachmentCache of the mirrored attachments to
+          include in the zip archive, or None to include none.
+    """
+    self._zip_file = zip_file
+    self._zip_writer = _StreamingZipWriter(zip_file) if zip_file else None
+    self._attachment_cache = attachment_cache
+    self._bitbucket_issues = _RecordSpool()
+    self._bitbucket_comments = _RecordSpool()
+    self._bitbucket_attachments = _RecordSpool()
+    # The objects of the attachment cache added to the zip archive so far.
+    self._written_objects = set()
+
+  def GetIssues(self, state="open", since=None):
     """Gets all of the issue for the repository.
 
     Since BitBucket does not have an issue API, always returns an empty list.
 
     Args:
-      state: The state of the repository can be either 'open' or 'closed'.
+      state: The state of the repository can be either 'open', 'closed' or
+          'all'.
+      since: Only get the issues updated at or after this time stamp.
 
     Returns:
       An empty list.
@@ -125,7 +275,8 @@ class IssueService(issues.IssueService):
         "title": _getTitle(googlecode_issue.GetTitle()),
         "updated_on": googlecode_issue.GetUpdatedOn()
     }
-    self._bitbucket_issues.append(bitbucket_issue)
+    self._bitbucket_issues.Append(bitbucket_issue)
+    self._AddAttachments(googlecode_issue.GetDescriptionComment())
     return googlecode_issue.GetId()
 
   def CloseIssue(self, issue_number):
@@ -150,34 +301,87 @@ class IssueService(issues.IssueService):
         "updated_on": googlecode_comment.GetUpdatedOn(),
         "user": googlecode_comment.GetAuthor()
     }
-    self._bitbucket_comments.append(bitbucket_comment)
+    self._bitbucket_comments.Append(bitbucket_comment)
+    self._AddAttachments(googlecode_comment)
+
+  def _AddAttachments(self, googlecode_comment):
+    """Adds the mirrored attachments of a comment to the zip archive.
+
+    Attachments with the same content are only added once.
+
+    Args:
+      googlecode_comment: An instance of GoogleCodeComment
+    """
+    if not self._attachment_cache:
+      return
+    for file_name, attachment_path in googlecode_comment.GetAttachmentPaths():
+      object_path = self._attachment_cache.GetObjectPath(attachment_path)
+      if not object_path:
+        continue
+      member_name = "%s/%s" % (ATTACHMENTS_DIR_NAME, object_path)
+      if object_path not in self._written_objects:
+        self._zip_file.write(
+            self._attachment_cache.GetObjectFilePath(object_path),
+            member_name)
+        self._written_objects.add(object_path)
+      self._bitbucket_attachments.Append({
+          "filename": file_name,
+          "issue": googlecode_comment.GetIssue().GetId(),
+          "path": member_name,
+          "user": googlecode_comment.GetAuthor(),
+      })
 
   def WriteIssueData(self, default_issue_kind):
-    """Writes out the json issue and comments data to db-1.0.json.
+    """Writes out the json issue, comment and attachment data to db-1.0.json.
+
+    The data is copied from the spooled records as it is compressed, so it is
+    never all in memory at once.
+
+    Args:
+      default_issue_kind: The kind of issues without one.
     """
-    issues_data = {
-        "issues": self._bitbucket_issues,
-        "comments": self._bitbucket_comments,
-        "meta": {
-            "default_kind": default_issue_kind
-        }
-    }
-    with open("db-1.0.json", "w") as issues_file:
-      issues_json = json.dumps(issues_data, sort_keys=True, indent=4,
-                               separators=(",", ": "))
-      issues_file.write(issues_json)
+    def GetJsonChunks():
+      for name, spool in (("attachments", self._bitbucket_attachments),
+                          ("comments", self._bitbucket_comments),
+                          ("issues", self._bitbucket_issues)):
+        yield "{\n" if name == "attachments" else ",\n"
+        yield json.dumps(name) + ": "
+        for chunk in spool.GetJsonChunks():
+          yield chunk
+      yield ",\n\"meta\": %s\n}\n" % json.dumps(
+          {"default_kind": default_issue_kind}, sort_keys=True)
+
+    self._zip_writer.WriteMember(ISSUE_DATA_NAME, GetJsonChunks())
+
+  def Close(self):
+    """Deletes the spooled records."""
+    for spool in (self._bitbucket_issues, self._bitbucket_comments,
+                  self._bitbucket_attachments):
+      spool.Close()
 
 
 def ExportIssues(issue_file_path, project_name,
-                 user_file_path, default_issue_kind):
+                 user_file_path, default_issue_kind, output_path=OUTPUT_PATH,
+                 attachment_cache_dir=None):
   """Exports all issues for a given project.
+
+  The zip archive is written next to output_path, and only moved there once
+  it is complete.
   """
-  issue_service = IssueService()
   user_service = UserService()
 
   issue_data = issues.LoadIssueData(issue_file_path, project_name)
   user_map = issues.LoadUserData(user_file_path, user_service)
 
+  attachment_cache = None
+  if attachment_cache_dir:
+    attachment_cache = attachment_mirror.MirrorProjects(
+        attachment_cache_dir, {project_name: issue_data})
+
+  temp_output_path = output_path + ".tmp"
+  zip_file = zipfile.ZipFile(temp_output_path, "w", zipfile.ZIP_DEFLATED,
+                             allowZip64=True)
+  issue_service = IssueService(zip_file, attachment_cache)
   issue_exporter = issues.IssueExporter(
       issue_service, user_service, issue_data, project_name, user_map)
 
@@ -185,11 +389,19 @@ def ExportIssues(issue_file_path, project_name,
     issue_exporter.Init()
     issue_exporter.Start()
     issue_service.WriteIssueData(default_issue_kind)
+    zip_file.close()
+    os.rename(temp_output_path, output_path)
+    print "\nWrote %s.\n" % output_path
     print "\nDone!\n"
   except IOError, e:
     print "[IOError] ERROR: %s" % e
   except issues.InvalidUserError, e:
     print "[InvalidUserError] ERROR: %s" % e
+  finally:
+    issue_service.Close()
+    zip_file.close()
+    if os.path.exists(temp_output_path):
+      os.remove(temp_output_path)
 
 
 def main(args):
@@ -215,6 +427,13 @@ def main(args):
                       help="A non-null string containing one of the following"
                       "values: bug, enhancement, proposal, task. Defaults to"
                       "bug")
+  parser.add_argument("--output_path", required=False, default=OUTPUT_PATH,
+                      help="Where to write the zip archive to import into "
+                      "BitBucket.")
+  parser.add_argument("--attachment_cache", required=False,
+                      help="A directory to mirror the attachments of the "
+                      "issues into, see attachment_mirror.py, to include "
+                      "them in the zip archive.")
   parsed_args, _ = parser.parse_known_args(args)
 
   # Default value.
@@ -224,7 +443,8 @@ def main(args):
 
   ExportIssues(
     parsed_args.issue_file_path, parsed_args.project_name,
-    parsed_args.user_file_path, parsed_args.default_issue_kind)
+    parsed_args.user_file_path, parsed_args.default_issue_kind,
+    parsed_args.output_path, parsed_args.attachment_cache)
 
 
 if __name__ == "__main__":
@@ -16,12 +16,20 @@
 
 # pylint: disable=missing-docstring,protected-access
 
+import json
+import os
+import shutil
+import StringIO
+import tempfile
 import unittest
+import zipfile
 
+import attachment_mirror
 import bitbucket_issue_converter
 import issues
 
 from issues_test import DEFAULT_USERNAME
+from issues_test import ISSUE_JSON
 from issues_test import SINGLE_COMMENT
 from issues_test import SINGLE_ISSUE
 from issues_test import COMMENT_ONE
@@ -29,6 +37,7 @@ from issues_test import COMMENT_TWO
 from issues_test import COMMENT_THREE
 from issues_test import COMMENTS_DATA
 from issues_test import NO_ISSUE_DATA
+from issues_test import REPO
 from issues_test import USER_MAP
 
 
@@ -79,7 +88,7 @@ class TestIssueService(unittest.TestCase):
     }
     issue_number = self._bitbucket_issue_service.CreateIssue(SINGLE_ISSUE)
     self.assertEqual(1, issue_number)
-    actual = self._bitbucket_issue_service._bitbucket_issues[0]
+    actual = self._bitbucket_issue_service._bitbucket_issues.GetRecords()[0]
     # The comment body gets rewritten to preserve the origin ID.
     issue_body["content"] = (
         "Originally reported on Google Code with ID 1\n" + issue_body["content"])
@@ -90,7 +99,6 @@ class TestIssueService(unittest.TestCase):
     # no-op
     self._bitbucket_issue_service.CloseIssue(123)
 
-  # TODO(chris): Add testcase for an issue comment  with attachments.
   def testCreateComment(self):
     comment_body = {
         "content": (
@@ -105,10 +113,109 @@ class TestIssueService(unittest.TestCase):
     }
     self._bitbucket_issue_service.CreateComment(
         1, SINGLE_COMMENT)
-    actual = self._bitbucket_issue_service._bitbucket_comments[0]
+    actual = self._bitbucket_issue_service._bitbucket_comments.GetRecords()[0]
     self.assertEqual(comment_body, actual)
 
 
+class TestIssueData(unittest.TestCase):
+  """Tests for writing the zip archive to import."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.zip_path = os.path.join(self.temp_dir, "issues.zip")
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _ReadZip(self, zip_path=None):
+    with zipfile.ZipFile(zip_path or self.zip_path) as zip_file:
+      self.assertIsNone(zip_file.testzip())
+      return dict((name, zip_file.read(name)) for name in zip_file.namelist())
+
+  def testWriteIssueData(self):
+    zip_file = zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED)
+    issue_service = bitbucket_issue_converter.IssueService(zip_file)
+    issue_service.CreateIssue(SINGLE_ISSUE)
+    issue_service.CreateComment(1, SINGLE_COMMENT)
+    issue_service.CreateComment(1, SINGLE_COMMENT)
+    issue_service.WriteIssueData("task")
+    issue_service.Close()
+    zip_file.close()
+
+    issue_data = json.loads(self._ReadZip()["db-1.0.json"])
+    self.assertEqual(
+        ["attachments", "comments", "issues", "meta"], sorted(issue_data))
+    self.assertEqual([], issue_data["attachments"])
+    self.assertEqual(2, len(issue_data["comments"]))
+    self.assertEqual([1], [issue["id"] for issue in issue_data["issues"]])
+    self.assertEqual({"default_kind": "task"}, issue_data["meta"])
+
+  def testWriteIssueData_Attachments(self):
+    cache = attachment_mirror.AttachmentCache(
+        os.path.join(self.temp_dir, "cache"))
+    journal = StringIO.StringIO()
+    cache._AddObject(REPO + "/issue-1/comment-1/a.png", "PNG", journal)
+    cache._AddObject(REPO + "/issue-1/comment-2/b.png", "PNG", journal)
+    object_path = cache.GetObjectPath(REPO + "/issue-1/comment-1/a.png")
+
+    issue_json = dict(ISSUE_JSON, comments={"items": [
+        dict(COMMENT_ONE, attachments=[{"fileName": "a.png"},
+                                       {"fileName": "missing.txt"}]),
+        dict(COMMENT_TWO, attachments=[{"fileName": "b.png"}]),
+    ]})
+    googlecode_issue = issues.GoogleCodeIssue(issue_json, REPO, USER_MAP)
+    zip_file = zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED)
+    issue_service = bitbucket_issue_converter.IssueService(zip_file, cache)
+    issue_service.CreateIssue(googlecode_issue)
+    issue_service.CreateComment(1, issues.GoogleCodeComment(
+        googlecode_issue, googlecode_issue.GetComments()[0]))
+    issue_service.WriteIssueData("bug")
+    issue_service.Close()
+    zip_file.close()
+
+    # Attachments with the same content are only included once.
+    members = self._ReadZip()
+    self.assertEqual(["attachments/" + object_path, "db-1.0.json"],
+                     sorted(members))
+    self.assertEqual("PNG", members["attachments/" + object_path])
+    self.assertEqual(
+        [{"filename": "a.png", "issue": 1,
+          "path": "attachments/" + object_path, "user": "a_uthor"},
+         {"filename": "b.png", "issue": 1,
+          "path": "attachments/" + object_path, "user": "w_riter"}],
+        json.loads(members["db-1.0.json"])["attachments"])
+
+  def testExportIssues(self):
+    issue_file_path = os.path.join(self.temp_dir, "takeout.json")
+    with open(issue_file_path, "w") as issue_file:
+      json.dump({"projects": [{"name": REPO, "issues": {"items": [
+          dict(ISSUE_JSON, comments={"items": [COMMENT_ONE, COMMENT_TWO]}),
+      ]}}]}, issue_file)
+
+    bitbucket_issue_converter.ExportIssues(
+        issue_file_path, REPO, None, "bug", self.zip_path)
+    self.assertEqual(["issues.zip", "takeout.json"],
+                     sorted(os.listdir(self.temp_dir)))
+    issue_data = json.loads(self._ReadZip()["db-1.0.json"])
+    self.assertEqual(1, len(issue_data["issues"]))
+    self.assertEqual(1, len(issue_data["comments"]))
+
+  def testStreamingZipWriter(self):
+    chunk_size = bitbucket_issue_converter._COPY_CHUNK_SIZE
+    # Random data doesn't compress, so the member stays large in the archive.
+    data = os.urandom(3 * chunk_size + 1)
+    with zipfile.ZipFile(self.zip_path, "w") as zip_file:
+      zip_file.writestr("before.txt", "Before")
+      writer = bitbucket_issue_converter._StreamingZipWriter(zip_file)
+      writer.WriteMember("large.bin", (data[i:i + 1000]
+                                       for i in range(0, len(data), 1000)))
+      writer.WriteMember("empty.txt", [])
+      zip_file.writestr("after.txt", "After")
+    self.assertEqual(
+        {"before.txt": "Before", "large.bin": data, "empty.txt": "",
+         "after.txt": "After"}, self._ReadZip())
+
+
 class TestIssueExporter(unittest.TestCase):
   """Tests for the IssueService."""
 
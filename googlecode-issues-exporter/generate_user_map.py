@@ -70,21 +70,7 @@ def _CreateUsersDict(issue_data, project_name):
 
 def Generate(issue_file_path, project_name):
   """Generates a user map for the specified issues. """
-  issue_data = None
-
-  user_file = open(issue_file_path)
-  user_data = json.load(user_file)
-  user_projects = user_data["projects"]
-
-  for project in user_projects:
-    if project_name in project["name"]:
-      issue_data = project["issues"]["items"]
-      break
-
-  if issue_data is None:
-    raise issues.ProjectNotFoundError(
-        "Project %s not found" % project_name)
-
+  issue_data = issues.LoadIssueData(issue_file_path, project_name)
   users = _CreateUsersDict(issue_data, project_name)
 
   with open("users.json", "w") as users_file:
@@ -20,23 +20,47 @@
 
   To use this tool see the documentation available at:
   https://code.google.com/p/support-tools/wiki/IssueExporterTool
+
+  To export several projects from one Takeout file, pass --projects_config
+  instead of --project_name and the GitHub repository, see ExportProjects.
 """
 
 import argparse
+import json
+import multiprocessing.pool
+import os
 import sys
+import threading
 
+import attachment_mirror
 import github_services
 import issues
 
+# The number of projects to export at once.
+PROJECT_WORKERS = 4
+# The keys each project in a projects configuration must have.
+_REQUIRED_PROJECT_KEYS = ("project_name", "github_owner_username",
+                          "github_repo_name")
+
+
+class InvalidConfigError(issues.Error):
+  """Error for an invalid projects configuration."""
+
 
 def ExportIssues(github_owner_username, github_repo_name, github_oauth_token,
                  issue_file_path, project_name, user_file_path, rate_limit,
-                 rewrite_comments):
+                 rewrite_comments, issue_map_file_path=None,
+                 issue_import=False, comment_workers=1,
+                 sync_state_file_path=None, attachment_cache_dir=None,
+                 attachment_url=None):
   """Exports all issues for a given project."""
   github_service = github_services.GitHubService(
       github_owner_username, github_repo_name, github_oauth_token,
       rate_limit)
-  issue_service = github_services.IssueService(github_service)
+  if issue_import:
+    issue_service = github_services.IssueImportService(github_service)
+  else:
+    issue_service = github_services.IssueService(github_service)
   user_service = github_services.UserService(github_service)
 
   issue_data = issues.LoadIssueData(issue_file_path, project_name)
@@ -45,12 +69,30 @@ def ExportIssues(github_owner_username, github_repo_name, github_oauth_token,
   # Add a special "user_requesting_export" user, which comes in handy.
   user_map["user_requesting_export"] = github_owner_username
 
+  sync_state = None
+  if sync_state_file_path:
+    sync_state = issues.LoadSyncState(sync_state_file_path)
+
+  attachment_links = None
+  if attachment_cache_dir:
+    attachment_links = attachment_mirror.MirrorProjects(
+        attachment_cache_dir,
+        {project_name: issue_data}).GetLinks(attachment_url)
+
   issue_exporter = issues.IssueExporter(
-      issue_service, user_service, issue_data, project_name, user_map)
+      issue_service, user_service, issue_data, project_name, user_map,
+      comment_workers, sync_state, attachment_links=attachment_links)
 
   try:
     issue_exporter.Init(rewrite_comments)
     issue_exporter.Start(rewrite_comments)
+    if sync_state_file_path:
+      issues.WriteSyncState(sync_state_file_path,
+                            issue_exporter.GetSyncState())
+    if issue_map_file_path:
+      issues.WriteIssueMap(issue_map_file_path,
+                           issue_exporter.GetExportedIssueNumbers(),
+                           issue_service.GetIssueUrlPrefix())
     print "\nDone!\n"
   except IOError, e:
     print "[IOError] ERROR: %s" % e
@@ -58,6 +100,252 @@ def ExportIssues(github_owner_username, github_repo_name, github_oauth_token,
     print "[InvalidUserError] ERROR: %s" % e
 
 
+def LoadProjectsConfig(config_file_path, user_file_path=None):
+  """Loads the configuration of a multi-project export.
+
+  The configuration is a JSON file mapping each Google Code project to a
+  GitHub repository:
+
+    {
+      "projects": [
+        {
+          "project_name": "my-project",
+          "github_owner_username": "my-org",
+          "github_repo_name": "my-repo",
+          "user_file_path": "users.json",
+          "issue_map_file": "my-project-issues.txt",
+          "sync_state_file": "my-project-sync.json"
+        }
+      ]
+    }
+
+  The last three are optional. Relative paths are relative to the
+  configuration file. The sync_state_file is the project's journal of what
+  was exported, so that an interrupted export picks up where it left off.
+  It defaults to a file named after the project next to the configuration.
+
+  Args:
+    config_file_path: The path to the configuration file.
+    user_file_path: The user file to use for projects without one of their
+        own, or None.
+
+  Returns:
+    The list of projects, each a dictionary with all of the keys above, set
+    to None if not given.
+
+  Raises:
+    InvalidConfigError: A project is missing a required key, or is listed
+        twice.
+  """
+  with open(config_file_path) as config_file:
+    config = json.load(config_file)
+  config_dir = os.path.dirname(config_file_path)
+
+  def GetPath(project, key, default):
+    path = project.get(key, default)
+    return path and os.path.join(config_dir, path)
+
+  projects = []
+  project_names = set()
+  for project in config.get("projects", []):
+    for key in _REQUIRED_PROJECT_KEYS:
+      if not project.get(key):
+        raise InvalidConfigError("Project %s has no %s" % (
+            project.get("project_name", len(projects) + 1), key))
+    project_name = project["project_name"]
+    if project_name in project_names:
+      raise InvalidConfigError("Project %s is listed twice" % project_name)
+    project_names.add(project_name)
+
+    projects.append({
+        "project_name": project_name,
+        "github_owner_username": project["github_owner_username"],
+        "github_repo_name": project["github_repo_name"],
+        "user_file_path": (GetPath(project, "user_file_path", None) or
+                           user_file_path),
+        "issue_map_file": GetPath(project, "issue_map_file", None),
+        "sync_state_file": GetPath(project, "sync_state_file",
+                                   "%s-sync.json" % project_name),
+    })
+  return projects
+
+
+class _ProgressView(object):
+  """Shows the progress of every project being exported, on one line."""
+
+  def __init__(self, project_names):
+    """Initialize the _ProgressView.
+
+    Args:
+      project_names: The names of the projects, in the order to show them.
+    """
+    self._lock = threading.Lock()
+    self._project_names = project_names
+    self._statuses = dict((name, "waiting") for name in project_names)
+
+  def SetStatus(self, project_name, status):
+    """Sets the status shown for a project."""
+    with self._lock:
+      self._statuses[project_name] = status
+      sys.stdout.write("\r%s        " % " | ".join(
+          "%s: %s" % (name, self._statuses[name])
+          for name in self._project_names))
+      sys.stdout.flush()
+
+  def GetProgressMethod(self, project_name):
+    """Returns a progress_method for the IssueExporter of a project."""
+    def ShowProgress(issue_number, issue_total, unused_comment_number,
+                     unused_comment_total):
+      self.SetStatus(project_name, "%d/%d" % (issue_number, issue_total))
+    return ShowProgress
+
+
+def _ExportProject(project, issue_data, issue_service, user_service,
+                   rewrite_comments, comment_pool, progress_view,
+                   attachment_links=None):
+  """Exports the issues of one project of a multi-project export.
+
+  Args:
+    project: The project, from LoadProjectsConfig.
+    issue_data: The issue data of the project.
+    issue_service: The IssueService of the project's repository.
+    user_service: The UserService of the project's repository.
+    rewrite_comments: Whether to rewrite the comments of exported issues.
+    comment_pool: The ThreadPool shared by all projects to post comments
+        with, or None to post them from the project's thread.
+    progress_view: The _ProgressView of the export.
+    attachment_links: A map from the path of each mirrored attachment to its
+        URL, or None to link to the attachments on Google's mirror.
+
+  Returns:
+    Whether the project was exported.
+  """
+  project_name = project["project_name"]
+  progress_view.SetStatus(project_name, "starting")
+  try:
+    user_map = issues.LoadUserData(project["user_file_path"], user_service)
+    user_map["user_requesting_export"] = project["github_owner_username"]
+    issue_exporter = issues.IssueExporter(
+        issue_service, user_service, issue_data, project_name, user_map,
+        sync_state=issues.LoadSyncState(project["sync_state_file"]),
+        comment_pool=comment_pool,
+        progress_method=progress_view.GetProgressMethod(project_name),
+        attachment_links=attachment_links)
+    issue_exporter.Init(rewrite_comments)
+    issue_exporter.Start(rewrite_comments)
+    issues.WriteSyncState(project["sync_state_file"],
+                          issue_exporter.GetSyncState())
+    if project["issue_map_file"]:
+      issues.WriteIssueMap(project["issue_map_file"],
+                           issue_exporter.GetExportedIssueNumbers(),
+                           issue_service.GetIssueUrlPrefix())
+  # Any error only fails its own project, so that the other projects are
+  # still exported and reported on.
+  except Exception, e:  # pylint: disable=broad-except
+    progress_view.SetStatus(project_name, "failed")
+    print "\n[%s] ERROR in %s: %s" % (type(e).__name__, project_name, e)
+    return False
+  progress_view.SetStatus(project_name, "done")
+  return True
+
+
+def _ScheduleProjects(projects, project_issue_data, create_services,
+                      rewrite_comments, comment_workers, project_workers,
+                      attachment_links=None):
+  """Exports several projects at once.
+
+  Args:
+    projects: The projects, from LoadProjectsConfig.
+    project_issue_data: The issue data of each project, by project name.
+    create_services: A function that returns a tuple of the IssueService and
+        UserService to export a project with, given the project.
+    rewrite_comments: Whether to rewrite the comments of exported issues.
+    comment_workers: The number of issues to post comments to at once, over
+        all projects.
+    project_workers: The number of projects to export at once.
+    attachment_links: A map from the path of each mirrored attachment to its
+        URL, for all projects, or None to link to Google's mirror.
+
+  Returns:
+    A dictionary of whether each project was exported, by project name.
+  """
+  progress_view = _ProgressView(
+      [project["project_name"] for project in projects])
+  comment_pool = None
+  if comment_workers > 1:
+    comment_pool = multiprocessing.pool.ThreadPool(comment_workers)
+  project_pool = multiprocessing.pool.ThreadPool(
+      max(1, min(project_workers, len(projects))))
+
+  results = []
+  for project in projects:
+    issue_service, user_service = create_services(project)
+    results.append((project["project_name"], project_pool.apply_async(
+        _ExportProject,
+        (project, project_issue_data[project["project_name"]],
+         issue_service, user_service, rewrite_comments, comment_pool,
+         progress_view, attachment_links))))
+  project_pool.close()
+  project_pool.join()
+  if comment_pool:
+    comment_pool.close()
+    comment_pool.join()
+  return dict((project_name, result.get())
+              for project_name, result in results)
+
+
+def ExportProjects(config_file_path, github_oauth_token, issue_file_path,
+                   user_file_path, rate_limit, rewrite_comments,
+                   issue_import=False, comment_workers=1,
+                   project_workers=PROJECT_WORKERS, attachment_cache_dir=None,
+                   attachment_url=None):
+  """Exports the issues of several projects, reading the Takeout file once.
+
+  All projects share one budget of GitHub requests, since GitHub limits the
+  requests of each user over all repositories, and one pool of threads to
+  post comments with. Each project keeps a journal of what was exported, see
+  LoadProjectsConfig. The attachments of all projects are mirrored into one
+  cache before any project is exported.
+  """
+  try:
+    projects = LoadProjectsConfig(config_file_path, user_file_path)
+  except InvalidConfigError, e:
+    print "[InvalidConfigError] ERROR: %s" % e
+    return
+  try:
+    project_issue_data = issues.LoadIssueDataForProjects(
+        issue_file_path, [project["project_name"] for project in projects])
+  except issues.ProjectNotFoundError, e:
+    print "[ProjectNotFoundError] ERROR: %s" % e
+    return
+
+  attachment_links = None
+  if attachment_cache_dir:
+    attachment_links = attachment_mirror.MirrorProjects(
+        attachment_cache_dir, project_issue_data).GetLinks(attachment_url)
+  request_budget = github_services.RequestBudget()
+
+  def CreateServices(project):
+    github_service = github_services.GitHubService(
+        project["github_owner_username"], project["github_repo_name"],
+        github_oauth_token, rate_limit, request_budget=request_budget)
+    if issue_import:
+      issue_service = github_services.IssueImportService(github_service)
+    else:
+      issue_service = github_services.IssueService(github_service)
+    return issue_service, github_services.UserService(github_service)
+
+  exported = _ScheduleProjects(
+      projects, project_issue_data, CreateServices, rewrite_comments,
+      comment_workers, project_workers, attachment_links)
+  failed = [project["project_name"] for project in projects
+            if not exported[project["project_name"]]]
+  if failed:
+    print "\n\nFailed to export %s.\n" % ", ".join(failed)
+  else:
+    print "\n\nDone!\n"
+
+
 def main(args):
   """The main function.
 
@@ -71,17 +359,25 @@ def main(args):
   parser.add_argument("--github_oauth_token", required=True,
                       help="You can generate an oauth token here: "
                       "https://github.com/settings/applications")
-  parser.add_argument("--github_owner_username", required=True,
+  parser.add_argument("--github_owner_username", required=False,
                       help="The project owner's GitHub username")
-  parser.add_argument("--github_repo_name", required=True,
+  parser.add_argument("--github_repo_name", required=False,
                       help="The GitHub repository you wish to add the issues"
                       "to.")
   parser.add_argument("--issue_file_path", required=True,
                       help="The path to the file containing the issues from"
                       "Google Code.")
-  parser.add_argument("--project_name", required=True,
+  parser.add_argument("--project_name", required=False,
                       help="The name of the Google Code project you wish to"
                       "export")
+  parser.add_argument("--projects_config", required=False,
+                      help="The path to a JSON file mapping several Google "
+                      "Code projects to GitHub repositories, to export them "
+                      "all instead of --project_name. See ExportProjects.")
+  parser.add_argument("--project_workers", required=False, type=int,
+                      default=PROJECT_WORKERS,
+                      help="The number of projects to export at once, with "
+                      "--projects_config.")
   parser.add_argument("--user_file_path", required=False,
                       help="The path to the file containing a mapping from"
                       "email address to github username.")
@@ -90,13 +386,62 @@ def main(args):
                      "anti-abuse limits.")
   parser.add_argument("--rewrite_comments", required=False, action='store_true',
                      help="Rewrite comments, such as remapping issue IDs.")
+  parser.add_argument("--issue_map_file", required=False,
+                      help="Where to write a map from Google Code issue IDs "
+                      "to GitHub issues, for use by wiki2gfm.")
+  parser.add_argument("--issue_import", required=False, action="store_true",
+                      help="Import each issue with all of its comments in a "
+                      "single request, using GitHub's issue import API. "
+                      "This keeps the original comment dates, and is much "
+                      "faster for issues with many comments.")
+  parser.add_argument("--comment_workers", required=False, type=int,
+                      default=4,
+                      help="The number of issues to post comments to at "
+                      "once. The comments of each issue are still posted in "
+                      "order.")
+  parser.add_argument("--sync_state_file", required=False,
+                      help="Where to record what was exported. The next run "
+                      "with the same file only checks the issues changed "
+                      "since, on Google Code or GitHub.")
+  parser.add_argument("--attachment_cache", required=False,
+                      help="A directory to mirror the attachments of the "
+                      "issues into, see attachment_mirror.py. Links to the "
+                      "attachments then point to --attachment_url.")
+  parser.add_argument("--attachment_url", required=False,
+                      help="The URL the objects directory of the "
+                      "--attachment_cache is served at.")
   parsed_args, _ = parser.parse_known_args(args)
 
+  if bool(parsed_args.attachment_cache) != bool(parsed_args.attachment_url):
+    parser.error("--attachment_cache and --attachment_url must be given "
+                 "together")
+  if parsed_args.projects_config:
+    # Each project of a projects configuration has its own journals.
+    if parsed_args.issue_map_file or parsed_args.sync_state_file:
+      parser.error("--issue_map_file and --sync_state_file can't be used with "
+                   "--projects_config, set issue_map_file and "
+                   "sync_state_file for each project in it instead")
+    ExportProjects(
+        parsed_args.projects_config, parsed_args.github_oauth_token,
+        parsed_args.issue_file_path, parsed_args.user_file_path,
+        parsed_args.rate_limit, parsed_args.rewrite_comments,
+        parsed_args.issue_import, parsed_args.comment_workers,
+        parsed_args.project_workers, parsed_args.attachment_cache,
+        parsed_args.attachment_url)
+    return
+  if not (parsed_args.github_owner_username and parsed_args.github_repo_name
+          and parsed_args.project_name):
+    parser.error("--github_owner_username, --github_repo_name and "
+                 "--project_name are required without --projects_config")
+
   ExportIssues(
       parsed_args.github_owner_username, parsed_args.github_repo_name,
       parsed_args.github_oauth_token, parsed_args.issue_file_path,
       parsed_args.project_name, parsed_args.user_file_path,
-      parsed_args.rate_limit, parsed_args.rewrite_comments)
+      parsed_args.rate_limit, parsed_args.rewrite_comments,
+      parsed_args.issue_map_file, parsed_args.issue_import,
+      parsed_args.comment_workers, parsed_args.sync_state_file,
+      parsed_args.attachment_cache, parsed_args.attachment_url)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks for the GitHub issue converter.
+
+Run from this directory, e.g.:
+    python github_issue_converter_benchmark.py --startup=20
+
+Startup timings include compiling the sources unless they have been compiled
+already, e.g. by "python -m compileall .".
+"""
+import argparse
+import subprocess
+import sys
+
+
+# Run in a fresh interpreter, like running the module under test as a script.
+# It imports the module and writes how long that took to stdout, in
+# microseconds. wiki_to_md/wiki2gfm_benchmark.py breaks startup down by import.
+_IMPORT_TIMER = """
+import time
+_start = time.time()
+import %s
+print int((time.time() - _start) * 1e6)
+"""
+
+
+def BenchmarkStartup(module_name, runs):
+  """Import a module in fresh interpreters, like running it as a script.
+
+  Args:
+    module_name: The name of the module to import.
+    runs: How many interpreters to time the import in.
+  """
+  totals = sorted(
+      int(subprocess.check_output(
+          [sys.executable, "-c", _IMPORT_TIMER % module_name]))
+      for _ in xrange(runs))
+  print u"import {0}: {1:.1f}ms median, {2:.1f}ms best of {3}".format(
+      module_name, totals[len(totals) / 2] / 1e3, totals[0] / 1e3, runs)
+
+
+def main(args):
+  """The main function.
+
+  Args:
+     args: The command line arguments.
+  """
+  parser = argparse.ArgumentParser(
+      description="Benchmarks the GitHub issue converter.")
+  parser.add_argument("--startup", type=int, default=20, metavar="RUNS",
+                      help="How many fresh interpreters to time importing "
+                      "github_issue_converter in")
+  parsed_args, unused_unknown_args = parser.parse_known_args(args)
+
+  BenchmarkStartup("github_issue_converter", parsed_args.startup)
+
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -16,12 +16,19 @@
 
 # pylint: disable=missing-docstring,protected-access
 
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
+import github_issue_converter
 import github_services
 import issues
 
 from issues_test import DEFAULT_USERNAME
+from issues_test import ISSUE_JSON
 from issues_test import SINGLE_ISSUE
 from issues_test import COMMENT_ONE
 from issues_test import COMMENT_TWO
@@ -42,6 +49,76 @@ GITHUB_TOKEN = "oauth_token"
 GITHUB_API_URL = "https://api.github.com"
 
 
+class RecordingIssueService(issues.IssueService):
+  """An issue service that records the calls made to it, from any thread.
+
+  Each comment gets a time stamp a second later than the one before it on the
+  same issue, unless given another in comment_times.
+  """
+
+  def __init__(self, comment_times=None, exported_issues=None):
+    self._lock = threading.Lock()
+    self._comment_times = comment_times or {}
+    self._comment_id = 0
+    self._exported_issues = exported_issues or []
+    self.issue_queries = []
+    self.created_issues = []
+    self.edited_issues = []
+    self.closed_issues = []
+    self.comments = {}
+    self.edited_comments = []
+
+  def GetIssues(self, state="open", since=None):
+    self.issue_queries.append((state, since))
+    return self._exported_issues
+
+  def GetComments(self, issue_number):
+    with self._lock:
+      return [dict(comment) for comment in self.comments.get(issue_number, [])]
+
+  def CreateIssue(self, googlecode_issue):
+    with self._lock:
+      self.created_issues.append(googlecode_issue.GetId())
+      return len(self.created_issues)
+
+  def EditIssue(self, googlecode_issue, issue_number):
+    with self._lock:
+      self.edited_issues.append(issue_number)
+
+  def CloseIssue(self, issue_number):
+    with self._lock:
+      # Record how many comments the issue had when it was closed.
+      self.closed_issues.append(
+          (issue_number, len(self.comments.get(issue_number, []))))
+
+  def CreateComment(self, issue_number, googlecode_comment):
+    with self._lock:
+      comments = self.comments.setdefault(issue_number, [])
+      created_at = self._comment_times.get(
+          (issue_number, len(comments)),
+          "2015-03-01T00:01:%02dZ" % len(comments))
+      self._comment_id += 1
+      comments.append({"id": self._comment_id,
+                       "body": googlecode_comment.GetDescription(),
+                       "created_at": created_at})
+      return created_at
+
+  def EditComment(self, googlecode_issue, googlecode_comment, comment_number):
+    with self._lock:
+      self.edited_comments.append(comment_number)
+      for comments in self.comments.values():
+        for comment in comments:
+          if comment["id"] == comment_number:
+            comment["body"] = googlecode_comment.GetDescription()
+
+
+class FailingIssueService(RecordingIssueService):
+  """An issue service whose requests to GitHub fail."""
+
+  def CreateIssue(self, googlecode_issue):
+    raise issues.ServiceError("Failed to create issue")
+
+
 class TestIssueExporter(unittest.TestCase):
   """Tests for the IssueService."""
 
@@ -52,7 +129,7 @@ class TestIssueExporter(unittest.TestCase):
     self.github_user_service = github_services.UserService(
         self.github_service)
     self.github_issue_service = github_services.IssueService(
-        self.github_service, comment_delay=0)
+        self.github_service)
     self.issue_exporter = issues.IssueExporter(
         self.github_issue_service, self.github_user_service,
         NO_ISSUE_DATA, GITHUB_REPO, USER_MAP)
@@ -127,6 +204,51 @@ class TestIssueExporter(unittest.TestCase):
     self.assertEqual(1, len(index["Title3"]))
     self.assertFalse(index["Title3"][0]["exported"])
 
+  def testGetAllPreviousIssues_OriginalIds(self):
+    # Issue 1 was renamed, and issue 3 given the title of issue 2.
+    open_issues_response = [
+        {"number": 9, "title": "Renamed", "comments": 2,
+         "body": "Originally reported on Google Code with ID 1\nOne"},
+        {"number": 10, "title": "Title2", "comments": 1,
+         "body": "Originally reported on Google Code with ID 3\nThree"},
+    ]
+    closed_issues_response = [
+        {"number": 11, "title": "Title2", "comments": 0,
+         "body": "Originally reported on Google Code with ID 2\nTwo"},
+    ]
+
+    self.issue_exporter._issue_json_data = self.TEST_ISSUE_DATA
+    self.github_service.AddResponse(content=open_issues_response)
+    self.github_service.AddResponse(content=closed_issues_response)
+    self.issue_exporter.Init()
+
+    self.assertEqual({1: 9, 2: 11, 3: 10},
+                     self.issue_exporter.GetExportedIssueNumbers())
+    self.assertEqual(
+        2, self.issue_exporter._GetExportedIssue(
+            issues.GoogleCodeIssue(self.TEST_ISSUE_DATA[0], GITHUB_REPO,
+                                   USER_MAP))["comment_count"])
+
+  def testGetAllPreviousIssues_TitleFallback(self):
+    # Issue 3 was exported without its ID, by an older version of the tool.
+    # Issue 2 was exported twice.
+    open_issues_response = [
+        {"number": 9, "title": "Title2", "comments": 0,
+         "body": "Originally reported on Google Code with ID 2\nTwo"},
+        {"number": 10, "title": "Title2", "comments": 0,
+         "body": "Originally reported on Google Code with ID 2\nTwo"},
+        {"number": 11, "title": "Title3", "comments": 0, "body": "Three"},
+        {"number": 12, "title": "Title1", "comments": 0, "body": None},
+    ]
+
+    self.issue_exporter._issue_json_data = self.TEST_ISSUE_DATA
+    self.github_service.AddResponse(content=open_issues_response)
+    self.github_service.AddResponse(content=[])
+    self.issue_exporter.Init()
+
+    self.assertEqual({1: 12, 2: 9, 3: 11},
+                     self.issue_exporter.GetExportedIssueNumbers())
+
   def testCreateIssue(self):
     self.github_service.AddResponse(content={"number": 1234})
     issue_number = self.issue_exporter._CreateIssue(SINGLE_ISSUE)
@@ -176,6 +298,176 @@ class TestIssueExporter(unittest.TestCase):
     # the issue description.
     self.assertEqual(1, self.issue_exporter._comment_number)
     self.assertEqual(1, self.issue_exporter._comment_total)
+    self.assertEqual({1: 1, 2: 2, 3: 3},
+                     self.issue_exporter.GetExportedIssueNumbers())
+
+  def testStart_IssueImport(self):
+    self.issue_exporter._issue_service = github_services.IssueImportService(
+        self.github_service, check_time=0)
+    # Imports keep the creation time of each issue.
+    self.issue_exporter._issue_json_data = [
+        dict(issue, published="2014-01-01T00:00:00.000Z")
+        for issue in self.TEST_ISSUE_DATA]
+    self.issue_exporter.Init()
+
+    # Each issue is imported with one request, and then all of them are
+    # checked with another.
+    for import_id in (101, 102, 103):
+      self.github_service.AddResponse(
+          content={"id": import_id, "status": "pending",
+                   "created_at": "2015-03-01T00:00:00Z"})
+    self.github_service.AddResponse(content=[
+        {"id": import_id, "status": "imported",
+         "issue_url": "%s/repos/%s/%s/issues/%d" % (
+             GITHUB_API_URL, GITHUB_USERNAME, GITHUB_REPO, import_id - 90)}
+        for import_id in (101, 102, 103)])
+    self.issue_exporter.Start()
+
+    self.assertEqual(3, self.issue_exporter._issue_number)
+    self.assertFalse(self.github_service._action_queue)
+    self.assertEqual({1: 11, 2: 12, 3: 13},
+                     self.issue_exporter.GetExportedIssueNumbers())
+
+  def _GetCommentBodies(self, issue_json):
+    googlecode_issue = issues.GoogleCodeIssue(issue_json, GITHUB_REPO, USER_MAP)
+    return [issues.GoogleCodeComment(googlecode_issue, comment).GetDescription()
+            for comment in googlecode_issue.GetComments()]
+
+  def testStart_CommentWorkers(self):
+    issue_service = RecordingIssueService()
+    issue_exporter = issues.IssueExporter(
+        issue_service, self.github_user_service, self.TEST_ISSUE_DATA,
+        GITHUB_REPO, USER_MAP, comment_workers=3)
+    issue_exporter.Init()
+    issue_exporter.Start()
+
+    # Issues are created in order, and their comments posted in order.
+    self.assertEqual(["1", "2", "3"], issue_service.created_issues)
+    for issue_number, issue_json in enumerate(self.TEST_ISSUE_DATA, 1):
+      self.assertEqual(
+          self._GetCommentBodies(issue_json),
+          [comment["body"]
+           for comment in issue_service.comments.get(issue_number, [])])
+    # Closed issues are closed after all their comments are posted.
+    self.assertItemsEqual([(2, 0), (3, 1)], issue_service.closed_issues)
+    self.assertEqual([], issue_service.edited_comments)
+    self.assertEqual({1: 1, 2: 2, 3: 3},
+                     issue_exporter.GetExportedIssueNumbers())
+
+  def testStart_CommentWorkersProgress(self):
+    progress = []
+    issue_data = [
+        dict(issue_json, id=issue_id, comments={
+            "items": [COMMENT_ONE] + [COMMENT_TWO] * issue_id})
+        for issue_id, issue_json in enumerate(self.TEST_ISSUE_DATA * 3, 1)]
+    issue_exporter = issues.IssueExporter(
+        RecordingIssueService(), self.github_user_service, issue_data,
+        GITHUB_REPO, USER_MAP, comment_workers=4,
+        progress_method=lambda *args: progress.append(args))
+    issue_exporter.Init()
+    issue_exporter.Start()
+
+    # Comments are posted to several issues at once, but the progress shown
+    # is always that of one issue.
+    comment_progress = [(number, total) for _, _, number, total in progress]
+    self.assertTrue(all(0 < number <= total
+                        for number, total in comment_progress if total))
+    # Issue N has N comments besides its description, all of which are shown.
+    for issue_id in range(1, len(issue_data) + 1):
+      self.assertIn((issue_id, issue_id), comment_progress)
+
+  def testStart_RepairCommentOrder(self):
+    # The second comment of issue 1 gets an earlier time stamp than the first.
+    issue_service = RecordingIssueService(
+        comment_times={(1, 1): "2015-03-01T00:00:00Z"})
+    issue_exporter = issues.IssueExporter(
+        issue_service, self.github_user_service, self.TEST_ISSUE_DATA,
+        GITHUB_REPO, USER_MAP)
+    issue_exporter.Init()
+    issue_exporter.Start()
+
+    # Both comments were shown in the wrong place, so both were swapped.
+    self.assertEqual([2, 1], issue_service.edited_comments)
+    shown_comments = sorted(
+        issue_service.comments[1],
+        key=lambda comment: (comment["created_at"], comment["id"]))
+    self.assertEqual(self._GetCommentBodies(self.TEST_ISSUE_DATA[0]),
+                     [comment["body"] for comment in shown_comments])
+
+  def _Sync(self, issue_data, sync_state, exported_issues=None):
+    issue_service = RecordingIssueService(exported_issues=exported_issues)
+    issue_exporter = issues.IssueExporter(
+        issue_service, self.github_user_service, issue_data, GITHUB_REPO,
+        USER_MAP, sync_state=sync_state)
+    issue_exporter.Init()
+    issue_exporter.Start()
+    return issue_service, issue_exporter.GetSyncState()
+
+  def testStart_Sync(self):
+    issue_data = [dict(issue, updated="2015-01-01T00:00:00.000Z")
+                  for issue in self.TEST_ISSUE_DATA]
+    issue_service, sync_state = self._Sync(issue_data, {})
+    self.assertEqual([("open", None), ("closed", None)],
+                     issue_service.issue_queries)
+    self.assertEqual(["1", "2", "3"], issue_service.created_issues)
+    self.assertEqual(
+        {"1": {"updated": "2015-01-01T00:00:00.000Z", "comment_count": 2,
+               "exported_id": 1},
+         "2": {"updated": "2015-01-01T00:00:00.000Z", "comment_count": 0,
+               "exported_id": 2},
+         "3": {"updated": "2015-01-01T00:00:00.000Z", "comment_count": 1,
+               "exported_id": 3}},
+        sync_state["issues"])
+
+    # Nothing changed, so nothing is done.
+    issue_service, next_sync_state = self._Sync(issue_data, sync_state)
+    self.assertEqual([("all", sync_state["synced_at"])],
+                     issue_service.issue_queries)
+    self.assertEqual([], issue_service.created_issues)
+    self.assertEqual({}, issue_service.comments)
+    self.assertEqual([], issue_service.edited_issues)
+    self.assertEqual(sync_state["issues"], next_sync_state["issues"])
+
+    # Issue 2 was updated, and issue 3 got another comment.
+    issue_data[1] = dict(issue_data[1], updated="2015-02-01T00:00:00.000Z")
+    issue_data[2] = dict(
+        issue_data[2], updated="2015-02-01T00:00:00.000Z",
+        comments={"items": [COMMENT_ONE, COMMENT_TWO, COMMENT_THREE]})
+    issue_service, next_sync_state = self._Sync(issue_data, sync_state)
+    self.assertEqual([], issue_service.created_issues)
+    self.assertEqual([2, 3], issue_service.edited_issues)
+    self.assertEqual([(2, 0), (3, 1)], issue_service.closed_issues)
+    self.assertEqual([3], issue_service.comments.keys())
+    self.assertEqual(self._GetCommentBodies(issue_data[2])[1:],
+                     [comment["body"] for comment in issue_service.comments[3]])
+    self.assertEqual(2, next_sync_state["issues"]["3"]["comment_count"])
+
+  def testStart_SyncTouchedIssue(self):
+    issue_data = [dict(issue, updated="2015-01-01T00:00:00.000Z")
+                  for issue in self.TEST_ISSUE_DATA]
+    _, sync_state = self._Sync(issue_data, {})
+
+    # A comment on issue 1 was deleted on GitHub since.
+    issue_service, _ = self._Sync(
+        issue_data, sync_state,
+        exported_issues=[{"number": 1, "title": "Title1", "comments": 1}])
+    self.assertEqual([1], issue_service.comments.keys())
+    self.assertEqual(self._GetCommentBodies(issue_data[0])[1:],
+                     [comment["body"] for comment in issue_service.comments[1]])
+    self.assertEqual([], issue_service.edited_issues)
+
+  def testGetExportedIssueNumbers(self):
+    open_issues_response = [{"number": 9, "title": "Title2", "comments": 2}]
+    closed_issues_response = [{"number": 10, "title": "Title1", "comments": 1}]
+
+    self.issue_exporter._issue_json_data = self.TEST_ISSUE_DATA
+    self.github_service.AddResponse(content=open_issues_response)
+    self.github_service.AddResponse(content=closed_issues_response)
+    self.issue_exporter.Init()
+
+    # Title3 has not been exported, so it is left out.
+    self.assertEqual({1: 10, 2: 9},
+                     self.issue_exporter.GetExportedIssueNumbers())
 
   def testStart_SkipDeletedComments(self):
     comment = {
@@ -260,5 +552,151 @@ class TestIssueExporter(unittest.TestCase):
     self.assertEqual(3, self.issue_exporter._issue_number)
 
 
+class TestExportProjects(unittest.TestCase):
+  """Tests for exporting several projects at once."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.config_file_path = os.path.join(self.temp_dir, "projects.json")
+    self._WriteConfig([
+        {"project_name": "one", "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-one"},
+        {"project_name": "two", "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-two", "user_file_path": "users.json",
+         "sync_state_file": "/tmp/two.json"},
+    ])
+    self.issue_data = [dict(ISSUE_JSON, comments={
+        "items": [COMMENT_ONE, COMMENT_TWO, COMMENT_THREE]})]
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteConfig(self, projects):
+    with open(self.config_file_path, "w") as config_file:
+      json.dump({"projects": projects}, config_file)
+
+  def testLoadProjectsConfig(self):
+    projects = github_issue_converter.LoadProjectsConfig(
+        self.config_file_path, "default-users.json")
+    self.assertEqual([
+        {"project_name": "one", "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-one",
+         "user_file_path": "default-users.json", "issue_map_file": None,
+         "sync_state_file": os.path.join(self.temp_dir, "one-sync.json")},
+        {"project_name": "two", "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-two",
+         "user_file_path": os.path.join(self.temp_dir, "users.json"),
+         "issue_map_file": None, "sync_state_file": "/tmp/two.json"},
+    ], projects)
+
+  def testLoadProjectsConfig_Invalid(self):
+    self._WriteConfig([{"project_name": "one", "github_repo_name": "repo"}])
+    with self.assertRaises(github_issue_converter.InvalidConfigError):
+      github_issue_converter.LoadProjectsConfig(self.config_file_path)
+
+    project = {"project_name": "one", "github_owner_username": GITHUB_USERNAME,
+               "github_repo_name": "repo"}
+    self._WriteConfig([project, project])
+    with self.assertRaises(github_issue_converter.InvalidConfigError):
+      github_issue_converter.LoadProjectsConfig(self.config_file_path)
+
+  def _ScheduleProjects(self, projects, project_workers=2,
+                        failing_projects=(), attachment_links=None):
+    issue_services = {}
+    def CreateServices(project):
+      if project["project_name"] in failing_projects:
+        issue_service = FailingIssueService()
+      else:
+        issue_service = RecordingIssueService()
+      issue_services[project["project_name"]] = issue_service
+      return issue_service, None
+
+    exported = github_issue_converter._ScheduleProjects(
+        projects, {"one": self.issue_data, "two": self.issue_data},
+        CreateServices, False, 3, project_workers, attachment_links)
+    return exported, issue_services
+
+  def testScheduleProjects(self):
+    self._WriteConfig([
+        {"project_name": name, "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-" + name}
+        for name in ("one", "two")])
+    projects = github_issue_converter.LoadProjectsConfig(
+        self.config_file_path)
+
+    exported, issue_services = self._ScheduleProjects(projects)
+    self.assertEqual({"one": True, "two": True}, exported)
+    for project in projects:
+      issue_service = issue_services[project["project_name"]]
+      self.assertEqual([ISSUE_JSON["id"]], issue_service.created_issues)
+      self.assertEqual(2, len(issue_service.comments[1]))
+      sync_state = issues.LoadSyncState(project["sync_state_file"])
+      self.assertEqual([str(ISSUE_JSON["id"])], sync_state["issues"].keys())
+
+    # The journals record what was exported, so nothing is done again.
+    exported, issue_services = self._ScheduleProjects(projects, 1)
+    self.assertEqual({"one": True, "two": True}, exported)
+    for issue_service in issue_services.values():
+      self.assertEqual([], issue_service.created_issues)
+      self.assertEqual({}, issue_service.comments)
+
+  def testScheduleProjects_Failure(self):
+    projects = github_issue_converter.LoadProjectsConfig(
+        self.config_file_path)
+    # The user file of project two is missing, which doesn't stop project one.
+    exported, issue_services = self._ScheduleProjects(projects)
+    self.assertEqual({"one": True, "two": False}, exported)
+    self.assertEqual([ISSUE_JSON["id"]],
+                     issue_services["one"].created_issues)
+    self.assertEqual([], issue_services["two"].created_issues)
+
+  def testScheduleProjects_ServiceError(self):
+    self._WriteConfig([
+        {"project_name": name, "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-" + name}
+        for name in ("one", "two")])
+    projects = github_issue_converter.LoadProjectsConfig(
+        self.config_file_path)
+    exported, issue_services = self._ScheduleProjects(
+        projects, failing_projects=["one"])
+    self.assertEqual({"one": False, "two": True}, exported)
+    self.assertEqual([ISSUE_JSON["id"]],
+                     issue_services["two"].created_issues)
+
+  def testScheduleProjects_AttachmentLinks(self):
+    self._WriteConfig([
+        {"project_name": name, "github_owner_username": GITHUB_USERNAME,
+         "github_repo_name": "repo-" + name}
+        for name in ("one", "two")])
+    projects = github_issue_converter.LoadProjectsConfig(
+        self.config_file_path)
+    self.issue_data = [dict(ISSUE_JSON, comments={"items": [
+        COMMENT_ONE, dict(COMMENT_TWO, attachments=[{"fileName": "a.txt"}])]})]
+    _, issue_services = self._ScheduleProjects(projects, attachment_links={
+        "one/issue-1/comment-2/a.txt": "https://example.com/ab/abcd.txt"})
+    self.assertIn("https://example.com/ab/abcd.txt",
+                  issue_services["one"].comments[1][0]["body"])
+    self.assertNotIn("https://example.com/ab/abcd.txt",
+                     issue_services["two"].comments[1][0]["body"])
+
+  def testMain_ProjectsConfigWithJournalFlags(self):
+    for flag in ("--issue_map_file=map.txt", "--sync_state_file=sync.json"):
+      with self.assertRaises(SystemExit):
+        github_issue_converter.main([
+            "--github_oauth_token=token", "--issue_file_path=issues.json",
+            "--projects_config=" + self.config_file_path, flag])
+
+  def testExportProjects_ProjectNotFound(self):
+    issue_file_path = os.path.join(self.temp_dir, "issues.json")
+    with open(issue_file_path, "w") as issue_file:
+      json.dump({"projects": [{"name": "one", "issues": {"items": []}}]},
+                issue_file)
+    # Project two is missing from the issue file, so nothing is exported.
+    github_issue_converter.ExportProjects(
+        self.config_file_path, "token", issue_file_path, None, False, False)
+    self.assertFalse(
+        os.path.exists(os.path.join(self.temp_dir, "one-sync.json")))
+
+
 if __name__ == "__main__":
   unittest.main(buffer=True)
@@ -15,9 +15,14 @@
 """Wrappers around the GitHub APIs."""
 
 import collections
+import errno
+import hashlib
 import json
+import random
 import re
+import socket
 import sys
+import threading
 import time
 import urllib
 
@@ -28,15 +33,176 @@ import issues
 
 # The URL used for calls to GitHub.
 GITHUB_API_URL = "https://api.github.com"
+# The URL of the GitHub website.
+GITHUB_URL = "https://github.com"
 # The maximum number of retries to make for an HTTP request that has failed.
-MAX_HTTP_REQUESTS = 3
+MAX_HTTP_REQUESTS = 5
+# The time (in seconds) to wait before the first retry of a failed request.
+# Each retry waits twice as long as the one before, up to MAX_RETRY_BACKOFF.
+RETRY_BACKOFF = 1
+MAX_RETRY_BACKOFF = 60
+# How far (in seconds) GitHub's clock may be behind ours. Used when looking for
+# writes that landed despite their request failing.
+CLOCK_SKEW = 60 * 5
 # The time (in seconds) to wait before trying to see if more requests are
 # available.
 REQUEST_CHECK_TIME = 60 * 5
-# GitHub orders the comments based on time alone, and because we upload ours
-# relatively quickly we need a delay to keep things being posted in
-# chronological order.
-COMMENT_DELAY = 0.5
+# The media type needed to use GitHub's issue import API, which is a preview.
+# See: https://gist.github.com/jonmagic/5282384165e0f86ef105
+ISSUE_IMPORT_MEDIA_TYPE = "application/vnd.github.golden-comet-preview+json"
+# The maximum number of issue imports to have pending at once.
+IMPORT_BATCH_SIZE = 100
+# The time (in seconds) to wait between checks of the pending issue imports.
+IMPORT_CHECK_TIME = 5
+
+
+# Kinds of failed HTTP request, see _ClassifyError and _ClassifyResponse.
+# The request never reached GitHub.
+CONNECT_FAILURE = "connect"
+# GitHub failed to handle the request, and may or may not have applied it.
+SERVER_FAILURE = "server"
+# The request was sent, but no response came back.
+TIMEOUT_FAILURE = "timeout"
+
+# Errors raised by httplib2 for requests that may succeed if tried again.
+_RETRYABLE_ERRORS = (socket.error, httplib.HTTPException,
+                     httplib2.ServerNotFoundError)
+# The HTTP statuses GitHub refuses requests with when over a request limit.
+_LIMIT_STATUSES = frozenset([httplib.FORBIDDEN, 429])
+# Socket error numbers that mean a connection could not be made.
+_CONNECT_ERRNOS = frozenset([errno.ECONNREFUSED, errno.EHOSTUNREACH,
+                             errno.ENETUNREACH, errno.EADDRNOTAVAIL])
+
+
+def _ClassifyError(error):
+  """Classifies an error raised making an HTTP request.
+
+  Args:
+    error: One of the _RETRYABLE_ERRORS.
+
+  Returns:
+    CONNECT_FAILURE if the request can't have been sent, or TIMEOUT_FAILURE
+    if it might have been.
+  """
+  if isinstance(error, httplib2.ServerNotFoundError):
+    return CONNECT_FAILURE
+  if (isinstance(error, socket.error) and
+      not isinstance(error, socket.timeout) and
+      error.args and error.args[0] in _CONNECT_ERRNOS):
+    return CONNECT_FAILURE
+  return TIMEOUT_FAILURE
+
+
+def _ClassifyResponse(response):
+  """Classifies an unsuccessful HTTP response.
+
+  Args:
+    response: An HTTP response that contains a mapping from 'status' to an
+              HTTP response code integer.
+
+  Returns:
+    SERVER_FAILURE for server errors, or None for failures that would happen
+    again if the request were retried.
+  """
+  if "status" in response and int(response["status"]) >= 500:
+    return SERVER_FAILURE
+  return None
+
+
+def _IsLimitResponse(response):
+  """Returns whether a response may be GitHub refusing over request limits.
+
+  Only these responses are worth checking the remaining requests for.
+  """
+  return "status" in response and int(response["status"]) in _LIMIT_STATUSES
+
+
+def _DecodeErrorContent(content):
+  """Decodes the content of an unsuccessful response.
+
+  Args:
+    content: The content, which is JSON from GitHub itself, but may be an HTML
+        page from a proxy in front of it when GitHub is down.
+
+  Returns:
+    The decoded JSON, or a dictionary with the content as its "message".
+  """
+  try:
+    return json.loads(content)
+  except ValueError:
+    return {"message": content}
+
+
+def _Fingerprint(text):
+  """Fingerprints the body of an issue or comment.
+
+  Args:
+    text: The body, as posted to or returned by GitHub.
+
+  Returns:
+    A digest of the body that ignores differences GitHub may introduce, like
+    line endings and surrounding whitespace.
+  """
+  if isinstance(text, unicode):
+    text = text.encode("utf-8")
+  return hashlib.sha1(text.replace("\r\n", "\n").strip()).hexdigest()
+
+
+def _FormatTimestamp(seconds):
+  """Formats a time as an ISO 8601 time stamp, as used by the GitHub API.
+
+  Args:
+    seconds: The time in seconds since the epoch.
+
+  Returns:
+    The time stamp, e.g. "2015-03-01T12:34:56Z".
+  """
+  return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+class RequestBudget(object):
+  """The requests GitHub allows a user, shared by all of the user's services.
+
+  GitHub limits the requests of each user over all of their repositories, so
+  the services exporting several projects at once take turns to use them.
+  """
+
+  def __init__(self):
+    # Held while waiting to make a POST request, to rate limit all threads.
+    self.post_lock = threading.Lock()
+    # Held while waiting for the hourly request limit to reset, so that only
+    # one thread checks the limit.
+    self.throttle_lock = threading.Lock()
+
+
+def GetThreadHttp(thread_local):
+  """Gets the HTTP instance of the current thread.
+
+  Connections can't be shared between threads, so each thread gets its own.
+
+  Args:
+    thread_local: The threading.local() holding the instances.
+
+  Returns:
+    The httplib2.Http instance of the current thread.
+  """
+  if not hasattr(thread_local, "http"):
+    thread_local.http = httplib2.Http()
+  return thread_local.http
+
+
+def WaitToRetry(attempts, retry_backoff):
+  """Waits before trying a failed request again.
+
+  The wait doubles with every attempt, and half of it is random so that
+  many failed requests aren't all retried at once.
+
+  Args:
+    attempts: The number of times the request has been tried.
+    retry_backoff: The time (in seconds) to wait before the first retry.
+  """
+  backoff = min(retry_backoff * 2 ** (attempts - 1), MAX_RETRY_BACKOFF)
+  time.sleep(backoff / 2.0 + random.uniform(0, backoff / 2.0))
 
 
 def _CheckSuccessful(response):
@@ -64,7 +230,9 @@ class GitHubService(object):
   """
 
   def __init__(self, github_owner_username, github_repo_name,
-               github_oauth_token, rate_limit, http_instance=None):
+               github_oauth_token, rate_limit, http_instance=None,
+               api_url=GITHUB_API_URL, retry_backoff=RETRY_BACKOFF,
+               request_budget=None):
     """Initialize the GitHubService.
 
     Args:
@@ -72,66 +240,140 @@ class GitHubService(object):
       github_repo_name: The GitHub repository name.
       github_oauth_token: The oauth token to use for the requests.
       http_instance: The HTTP instance to use, if not set a default will be
-          used.
+          used for each thread.
+      api_url: The URL of the GitHub API, e.g. of a local server in tests.
+      retry_backoff: The time (in seconds) to wait before the first retry of
+          a failed request.
+      request_budget: The RequestBudget shared with the other services of the
+          same user, if not set the service has a budget of its own.
     """
     self.github_owner_username = github_owner_username
     self.github_repo_name = github_repo_name
     self._github_oauth_token = github_oauth_token
     self._rate_limit = rate_limit
-    self._http = http_instance if http_instance else httplib2.Http()
-
-  def _PerformHttpRequest(self, method, url, body="{}", params=None):
+    self._http_instance = http_instance
+    self._api_url = api_url
+    self._retry_backoff = retry_backoff
+    # The HTTP instance of each thread, see GetThreadHttp.
+    self._thread_local = threading.local()
+    self._request_budget = request_budget or RequestBudget()
+
+  def _GetHttp(self):
+    """Returns the HTTP instance to use for requests from this thread."""
+    if self._http_instance:
+      return self._http_instance
+    return GetThreadHttp(self._thread_local)
+
+  def _PerformHttpRequest(self, method, url, body="{}", params=None,
+                          headers=None, find_write_method=None):
     """Attemps to make an HTTP request for given method, url, body and params.
 
-    If the request fails try again 'MAX_HTTP_REQUESTS' number of times.  If the
+    If the request fails in a way that may not happen again (it could not
+    connect, timed out or got a server error), try again up to
+    'MAX_HTTP_REQUESTS' times in total, waiting longer each time. If the
     request fails due to the the request limit being hit, wait until more
     requests can be made.
 
+    A POST that timed out or got a server error may still have been applied,
+    so it is only tried again if find_write_method says it wasn't.
+
     Args:
       method: The HTTP request method as a string ('GET', 'POST', etc.).
       url: The URL to make the call to.
       body: The body of the request.
       params: A dictionary of parameters to be used in the http call.
+      headers: A dictionary of extra HTTP headers for the request.
+      find_write_method: A function to call to find out whether a POST that
+          failed was applied anyway. Returns a tuple of an HTTP response and
+          content to use as the result of the POST if so, or None if not.
 
     Returns:
       A tuple of an HTTP response (https://developer.github.com/v3/#schema) and
       its content from the server which is decoded JSON.
     """
-    headers = {"User-Agent": "GoogleCodeIssueExporter/1.0"}
+    request_headers = {"User-Agent": "GoogleCodeIssueExporter/1.0"}
+    if headers:
+      request_headers.update(headers)
+    headers = request_headers
     query = params.copy() if params else {}
     query["access_token"] = self._github_oauth_token
-    request_url = "%s%s?%s" % (GITHUB_API_URL, url, urllib.urlencode(query))
+    request_url = "%s%s?%s" % (self._api_url, url, urllib.urlencode(query))
     requests = 0
-    while requests < MAX_HTTP_REQUESTS:
+    while True:
       requests += 1
-      response, content = self._http.request(request_url, method,
-                                             headers=headers, body=body)
-      if _CheckSuccessful(response):
-        return response, json.loads(content)
-      elif self._RequestLimitReached():
-        requests -= 1
-        self._WaitForApiThrottlingToEnd()
-    return response, json.loads(content)
-
-  def PerformGetRequest(self, url, params=None):
+      try:
+        response, content = self._GetHttp().request(
+            request_url, method, headers=headers, body=body)
+      except _RETRYABLE_ERRORS as error:
+        failure = _ClassifyError(error)
+        if not self._ShouldRetry(method, failure, requests, find_write_method):
+          raise
+      else:
+        if _CheckSuccessful(response):
+          return response, json.loads(content)
+        elif _IsLimitResponse(response) and self._RequestLimitReached():
+          requests -= 1
+          self._WaitForApiThrottlingToEnd()
+          continue
+        failure = _ClassifyResponse(response)
+        if not self._ShouldRetry(method, failure, requests, find_write_method):
+          return response, _DecodeErrorContent(content)
+
+      self._WaitToRetry(requests)
+      if failure != CONNECT_FAILURE and find_write_method:
+        write = find_write_method()
+        if write:
+          return write
+
+  def _ShouldRetry(self, method, failure, requests, find_write_method):
+    """Returns whether to try a failed request again.
+
+    Args:
+      method: The HTTP request method as a string ('GET', 'POST', etc.).
+      failure: The kind of failure, or None if it can't be retried.
+      requests: The number of times the request has been tried.
+      find_write_method: The function to find out whether a POST was applied,
+          or None.
+    """
+    if failure is None or requests >= MAX_HTTP_REQUESTS:
+      return False
+    # Unlike other methods, POSTs aren't idempotent.
+    return (method != "POST" or failure == CONNECT_FAILURE or
+            find_write_method is not None)
+
+  def _WaitToRetry(self, requests):
+    """Waits before trying a failed request again.
+
+    Args:
+      requests: The number of times the request has been tried.
+    """
+    WaitToRetry(requests, self._retry_backoff)
+
+  def PerformGetRequest(self, url, params=None, headers=None):
     """Makes a GET request.
 
     Args:
       url: The URL to make the call to.
       params: A dictionary of parameters to be used in the http call.
+      headers: A dictionary of extra HTTP headers for the request.
 
     Returns:
       A tuple of an HTTP response (https://developer.github.com/v3/#schema) and
       its content from the server which is decoded JSON.
     """
-    return self._PerformHttpRequest("GET", url, params=params)
+    return self._PerformHttpRequest("GET", url, params=params, headers=headers)
 
-  def PerformPostRequest(self, url, body):
+  def PerformPostRequest(self, url, body, headers=None,
+                         find_write_method=None):
     """Makes a POST request.
 
     Args:
       url: The URL to make the call to.
       body: The body of the request.
+      headers: A dictionary of extra HTTP headers for the request.
+      find_write_method: A function to call to find out whether the request
+          was applied despite failing, so it can safely be tried again. See
+          _PerformHttpRequest.
 
     Returns:
       A tuple of an HTTP response (https://developer.github.com/v3/#schema) and
@@ -144,8 +386,10 @@ class GitHubService(object):
       # exact quota is undocumented. So the value below is simply a guess. See:
       # https://developer.github.com/v3/#abuse-rate-limits
       req_min = 15
-      time.sleep(60 / req_min)
-    return self._PerformHttpRequest("POST", url, body)
+      with self._request_budget.post_lock:
+        time.sleep(60 / req_min)
+    return self._PerformHttpRequest("POST", url, body, headers=headers,
+                                    find_write_method=find_write_method)
 
   def PerformPatchRequest(self, url, body):
     """Makes a PATCH request.
@@ -167,12 +411,16 @@ class GitHubService(object):
     the hourly request limit is reached.
 
     Returns:
-      The number of remaining requests.
+      The number of remaining requests, or None if GitHub couldn't tell, e.g.
+      because it is down.
     """
     url = ("%s/rate_limit?access_token=%s" %
-           (GITHUB_API_URL, self._github_oauth_token))
-    _, content = self._http.request(url, "GET")
-    content = json.loads(content)
+           (self._api_url, self._github_oauth_token))
+    try:
+      _, content = self._GetHttp().request(url, "GET")
+      content = json.loads(content)
+    except _RETRYABLE_ERRORS + (ValueError,):
+      return None
     if "rate" in content and "remaining" in content["rate"]:
       return int(content["rate"]["remaining"])
     return 0
@@ -183,14 +431,18 @@ class GitHubService(object):
 
   def _WaitForApiThrottlingToEnd(self):
     """Waits until the user is allowed to make more requests."""
-    sys.stdout.write("Hourly request limit reached. Waiting for new limit, "
-                     "checking every %d minutes" % (REQUEST_CHECK_TIME/60))
-    while True:
-      sys.stdout.write(".")
-      sys.stdout.flush()
-      time.sleep(REQUEST_CHECK_TIME)
+    with self._request_budget.throttle_lock:
+      # Another thread may have waited for the new limit already.
       if not self._RequestLimitReached():
         return
+      sys.stdout.write("Hourly request limit reached. Waiting for new limit, "
+                       "checking every %d minutes" % (REQUEST_CHECK_TIME/60))
+      while True:
+        sys.stdout.write(".")
+        sys.stdout.flush()
+        time.sleep(REQUEST_CHECK_TIME)
+        if not self._RequestLimitReached():
+          return
 
 
 class FakeGitHubService(GitHubService):
@@ -243,36 +495,41 @@ class FakeGitHubService(GitHubService):
     full_response["content"] = content if content else {}
     self._action_queue.append(full_response)
 
-  def _PerformHttpRequest(self, method, url, body="{}", params=None):
+  def _PerformHttpRequest(self, method, url, body="{}", params=None,
+                          headers=None, find_write_method=None):
     if not self._action_queue:
       return {"status": httplib.OK}, {}
 
     full_response = self._action_queue.popleft()
     return (full_response["status"], full_response["content"])
 
-  def PerformGetRequest(self, url, params=None):
+  def PerformGetRequest(self, url, params=None, headers=None):
     """Makes a fake GET request.
 
     Args:
       url: The URL to make the call to.
       params: A dictionary of parameters to be used in the http call.
+      headers: A dictionary of extra HTTP headers for the request.
 
     Returns:
       A tuple of a fake response and fake content.
     """
-    return self._PerformHttpRequest("GET", url, params=params)
+    return self._PerformHttpRequest("GET", url, params=params, headers=headers)
 
-  def PerformPostRequest(self, url, body):
+  def PerformPostRequest(self, url, body, headers=None,
+                         find_write_method=None):
     """Makes a POST request.
 
     Args:
       url: The URL to make the call to.
       body: The body of the request.
+      headers: A dictionary of extra HTTP headers for the request.
+      find_write_method: Unused, as fake requests don't fail unexpectedly.
 
     Returns:
       A tuple of a fake response and content
     """
-    return self._PerformHttpRequest("POST", url, body=body)
+    return self._PerformHttpRequest("POST", url, body=body, headers=headers)
 
   def PerformPatchRequest(self, url, body):
     """Makes a PATCH request.
@@ -287,6 +544,10 @@ class FakeGitHubService(GitHubService):
     return self._PerformHttpRequest("PATCH", url, body=body)
 
 
+class RawContent(str):
+  """Content for the Http2Mock to return as is, e.g. an HTML error page."""
+
+
 class Http2Mock(object):
   """Mock httplib2.Http object.  Only mocks out the request function.
 
@@ -297,6 +558,11 @@ class Http2Mock(object):
     response_failure: Fake failure HTTP response.
     response: The response of the next HTTP request.
     content: The content of the next HTTP request.
+    results: Results of the next HTTP requests, used before response and
+        content. Each is either a tuple of a response and its content, or an
+        exception to raise. Content that is a RawContent is returned as is,
+        rather than as JSON.
+    requests: The method and url of every HTTP request made.
     last_url: The last URL that an HTTP request was made to.
     last_method: The last method that an HTTP request was made to.
     last_body: The last body method that an HTTP request was made to.
@@ -309,6 +575,8 @@ class Http2Mock(object):
     """Initialize the Http2Mock."""
     self.response = self.response_success
     self.content = {}
+    self.results = collections.deque()
+    self.requests = []
     self.last_headers = None
     self.last_url = None
     self.last_method = None
@@ -330,6 +598,15 @@ class Http2Mock(object):
     self.last_method = method
     self.last_headers = headers
     self.last_body = body
+    self.requests.append((method, url))
+    if self.results:
+      result = self.results.popleft()
+      if isinstance(result, Exception):
+        raise result
+      response, content = result
+      if isinstance(content, RawContent):
+        return (response, str(content))
+      return (response, json.dumps(content))
     return (self.response, json.dumps(self.content))
 
 
@@ -381,29 +658,35 @@ class IssueService(issues.IssueService):
   Handles creating and updating issues and comments on the GitHub API.
   """
 
-  def __init__(self, github_service, comment_delay=COMMENT_DELAY):
+  def __init__(self, github_service):
     """Initialize the IssueService.
 
     Args:
       github_service: The GitHub service.
     """
     self._github_service = github_service
-    self._comment_delay = comment_delay
     # If the repo is of the form "login/reponame" then don't inject the
     # username as it (or the organization) is already embedded.
     if '/' in self._github_service.github_repo_name:
-      self._github_issues_url = "/repos/%s/issues" % \
-          self._github_service.github_repo_name
+      self._github_repo_path = self._github_service.github_repo_name
     else:
-      self._github_issues_url = ("/repos/%s/%s/issues" %
-                                 (self._github_service.github_owner_username,
-                                  self._github_service.github_repo_name))
+      self._github_repo_path = "%s/%s" % (
+          self._github_service.github_owner_username,
+          self._github_service.github_repo_name)
+    self._github_issues_url = "/repos/%s/issues" % self._github_repo_path
+
+  def GetIssueUrlPrefix(self):
+    """Returns the web URL of an issue in the repository, minus its number."""
+    return "%s/%s/issues/" % (GITHUB_URL, self._github_repo_path)
 
-  def GetIssues(self, state="open"):
+  def GetIssues(self, state="open", since=None):
     """Gets all of the issue for the GitHub repository.
 
     Args:
-      state: The state of the repository can be either 'open' or 'closed'.
+      state: The state of the repository can be either 'open', 'closed' or
+          'all'.
+      since: Only get the issues updated at or after this ISO 8601 time
+          stamp, if given.
 
     Returns:
       The list of all of the issues for the given repository.
@@ -413,6 +696,8 @@ class IssueService(issues.IssueService):
     """
     github_issues = []
     params = {"state": state, "per_page": 100, "page": 0}
+    if since:
+      params["since"] = since
     while True:
       params["page"] += 1
       response, content = self._github_service.PerformGetRequest(
@@ -431,11 +716,18 @@ class IssueService(issues.IssueService):
   def GetComments(self, issue_number):
     """Gets all comments for a given GitHub issue."""
     url = "%s/%s/comments" % (self._github_issues_url, issue_number)
-    response, content = self._github_service.PerformGetRequest(
-        url, params={})
-    if not _CheckSuccessful(response):
-      raise IOError("Failed to retrieve previous issues.\n\n%s" % content)
-    return content
+    comments = []
+    params = {"per_page": 100, "page": 0}
+    while True:
+      params["page"] += 1
+      response, content = self._github_service.PerformGetRequest(
+          url, params=params)
+      if not _CheckSuccessful(response):
+        raise IOError("Failed to retrieve previous issues.\n\n%s" % content)
+      if not content:
+        break
+      comments += content
+    return comments
 
   def CreateIssue(self, googlecode_issue):
     """Creates a GitHub issue.
@@ -458,8 +750,11 @@ class IssueService(issues.IssueService):
         "assignee": googlecode_issue.GetOwner(),
         "labels": googlecode_issue.GetLabels(),
     }
+    since = _FormatTimestamp(time.time() - CLOCK_SKEW)
     response, content = self._github_service.PerformPostRequest(
-        self._github_issues_url, json.dumps(issue))
+        self._github_issues_url, json.dumps(issue),
+        find_write_method=lambda: self._FindWrite(
+            self._github_issues_url, issue["body"], since, state="all"))
 
     if not _CheckSuccessful(response):
       # Newline character at the beginning of the line to allows for in-place
@@ -515,6 +810,9 @@ class IssueService(issues.IssueService):
       issue_number: The issue number on GitHub to post to.
       googlecode_comment: A GoogleCodeComment instance.
 
+    Returns:
+      The time stamp GitHub gave the comment, which sets its position.
+
     Raises:
       issues.ServiceError: An error occurred creating the comment.
     """
@@ -522,15 +820,17 @@ class IssueService(issues.IssueService):
     comment = googlecode_comment.GetDescription()
 
     json_body = json.dumps({"body": comment})
+    since = _FormatTimestamp(time.time() - CLOCK_SKEW)
     response, content = self._github_service.PerformPostRequest(
-        comment_url, json_body)
+        comment_url, json_body,
+        find_write_method=lambda: self._FindWrite(comment_url, comment, since))
 
     if not _CheckSuccessful(response):
       raise issues.ServiceError(
           "\nFailed to create comment for issue #%d\n\n"
           "Response:\n%s\n\nContent:\n%s\n\n" %
           (issue_number, response, content))
-    time.sleep(self._comment_delay)
+    return content.get("created_at")
 
   def EditComment(self, googlecode_issue, googlecode_comment, comment_number):
     """Edits an existing comment."""
@@ -538,7 +838,7 @@ class IssueService(issues.IssueService):
     comment = googlecode_comment.GetDescription()
 
     json_body = json.dumps({"body": comment})
-    response, content = self._github_service.PerformPostRequest(
+    response, content = self._github_service.PerformPatchRequest(
         comment_url, json_body)
 
     if not _CheckSuccessful(response):
@@ -546,7 +846,39 @@ class IssueService(issues.IssueService):
           "\nFailed to edit comment with number #%d\n\n"
           "Response:\n%s\n\nContent:\n%s\n\n" %
           (comment_number, response, content))
-    time.sleep(self._comment_delay)
+
+  def _FindWrite(self, url, body, since, **params):
+    """Looks for an issue or comment posted by a request that failed.
+
+    Args:
+      url: The URL the issue or comment was posted to.
+      body: The body of the issue or comment.
+      since: Only look at issues or comments updated after this time stamp,
+          from before the request was first made.
+      **params: Further parameters for listing the issues or comments.
+
+    Returns:
+      A tuple of an HTTP response and the issue or comment with the same body,
+      or None if it wasn't posted.
+
+    Raises:
+      IOError: An error occurred retrieving the issues or comments, so it
+          isn't safe to post again.
+    """
+    fingerprint = _Fingerprint(body)
+    params.update({"since": since, "per_page": 100, "page": 0})
+    while True:
+      params["page"] += 1
+      response, content = self._github_service.PerformGetRequest(
+          url, params=params)
+      if not _CheckSuccessful(response):
+        raise IOError("Failed to check whether a failed request to %s was "
+                      "applied.\n\n%s" % (url, content))
+      if not content:
+        return None
+      for posted in content:
+        if _Fingerprint(posted.get("body") or "") == fingerprint:
+          return response, posted
 
   def _GetIssueNumber(self, content):
     """Get the issue number from a newly created GitHub issue.
@@ -559,3 +891,155 @@ class IssueService(issues.IssueService):
     """
     assert "number" in content, "Getting issue number from: %s" % content
     return content["number"]
+
+
+def _ToImportTimestamp(timestamp):
+  """Converts a Google Code time stamp to one the issue import API accepts.
+
+  Args:
+    timestamp: An ISO 8601 time stamp, e.g. "2014-01-01T12:34:56.000Z".
+
+  Returns:
+    The time stamp without fractions of seconds, e.g. "2014-01-01T12:34:56Z".
+  """
+  return re.sub(r"\.\d+Z$", "Z", timestamp)
+
+
+class IssueImportService(IssueService):
+  """GitHub issue operations using the issue import API.
+
+  Each issue is imported with all of its comments, their original creation
+  times and its closed state in a single request, instead of one request per
+  comment and another to close it. Imports finish asynchronously, so their
+  status is checked for many of them at once in WaitForImports.
+
+  Issues that were already exported are still updated through the regular
+  issue API.
+  """
+
+  def __init__(self, github_service, batch_size=IMPORT_BATCH_SIZE,
+               check_time=IMPORT_CHECK_TIME):
+    """Initialize the IssueImportService.
+
+    Args:
+      github_service: The GitHub service.
+      batch_size: The maximum number of imports to have pending at once.
+      check_time: The time (in seconds) to wait between checks of the pending
+          imports.
+    """
+    super(IssueImportService, self).__init__(github_service)
+    self._batch_size = batch_size
+    self._check_time = check_time
+    self._github_import_url = "/repos/%s/import/issues" % self._github_repo_path
+    self._import_headers = {"Accept": ISSUE_IMPORT_MEDIA_TYPE}
+
+    # Mapping from the ID of each pending import to its Google Code issue ID.
+    self._pending_imports = {}
+    # When the oldest pending import was started, according to GitHub.
+    self._pending_since = None
+    # Mapping from Google Code issue ID to the number of each imported issue
+    # not yet returned by WaitForImports.
+    self._imported_issues = {}
+
+  def ImportIssue(self, googlecode_issue, comments):
+    """Starts importing a GitHub issue with its comments.
+
+    Args:
+      googlecode_issue: An instance of GoogleCodeIssue.
+      comments: The list of comments of the issue, as dictionaries.
+
+    Returns:
+      True, as the issue is always imported.
+
+    Raises:
+      issues.ServiceError: An error occurred starting the import.
+    """
+    issue = {
+        "title": googlecode_issue.GetTitle(),
+        "body": googlecode_issue.GetDescription(),
+        "created_at": _ToImportTimestamp(googlecode_issue.GetCreatedOn()),
+        "assignee": googlecode_issue.GetOwner(),
+        "labels": googlecode_issue.GetLabels(),
+        "closed": not googlecode_issue.IsOpen(),
+    }
+    import_comments = []
+    for comment in comments:
+      googlecode_comment = issues.GoogleCodeComment(googlecode_issue, comment)
+      import_comments.append({
+          "body": googlecode_comment.GetDescription(),
+          "created_at": _ToImportTimestamp(googlecode_comment.GetCreatedOn()),
+      })
+
+    response, content = self._github_service.PerformPostRequest(
+        self._github_import_url,
+        json.dumps({"issue": issue, "comments": import_comments}),
+        headers=self._import_headers)
+    if not _CheckSuccessful(response):
+      raise issues.ServiceError(
+          "\nFailed to import issue #%s '%s'.\n\n\n"
+          "Response:\n%s\n\n\nContent:\n%s" % (
+              googlecode_issue.GetId(), issue["title"], response, content))
+
+    self._pending_imports[content["id"]] = googlecode_issue.GetId()
+    if self._pending_since is None:
+      self._pending_since = content.get("created_at")
+
+    # Don't let too many imports pile up on GitHub's side.
+    while len(self._pending_imports) >= self._batch_size:
+      time.sleep(self._check_time)
+      self._CheckImports()
+    return True
+
+  def WaitForImports(self):
+    """Waits for every pending import to finish.
+
+    Returns:
+      A dictionary from Google Code issue ID to GitHub issue number, for the
+      issues imported since the last call.
+
+    Raises:
+      IOError: An error occurred checking the status of the imports.
+      issues.ServiceError: An import failed.
+    """
+    while self._pending_imports:
+      self._CheckImports()
+      if self._pending_imports:
+        time.sleep(self._check_time)
+
+    imported_issues = self._imported_issues
+    self._imported_issues = {}
+    return imported_issues
+
+  def _CheckImports(self):
+    """Checks the status of all pending imports, with a single request.
+
+    Raises:
+      IOError: An error occurred checking the status of the imports.
+      issues.ServiceError: An import failed.
+    """
+    params = {}
+    if self._pending_since:
+      params["since"] = self._pending_since
+    response, content = self._github_service.PerformGetRequest(
+        self._github_import_url, params=params, headers=self._import_headers)
+    if not _CheckSuccessful(response):
+      raise IOError("Failed to check the status of issue imports.\n\n%s" %
+                    content)
+
+    for import_status in content:
+      googlecode_id = self._pending_imports.get(import_status["id"])
+      if googlecode_id is None:
+        continue
+
+      if import_status["status"] == "imported":
+        # The issue URL ends in the issue number.
+        issue_number = int(import_status["issue_url"].rsplit("/", 1)[1])
+        self._imported_issues[googlecode_id] = issue_number
+        del self._pending_imports[import_status["id"]]
+      elif import_status["status"] == "failed":
+        raise issues.ServiceError(
+            "\nFailed to import issue #%s.\n\nContent:\n%s" % (
+                googlecode_id, import_status))
+
+    if not self._pending_imports:
+      self._pending_since = None
@@ -16,10 +16,16 @@
 
 # pylint: disable=missing-docstring,protected-access
 
+import BaseHTTPServer
+import errno
 import json
+import socket
+import threading
 import unittest
 import urlparse
 
+import httplib2
+
 import issues
 import github_services
 
@@ -36,6 +42,17 @@ GITHUB_REPO = REPO
 GITHUB_TOKEN = "oauth_token"
 # The URL used for calls to GitHub.
 GITHUB_API_URL = github_services.GITHUB_API_URL
+# The response to checking the request limit, when it hasn't been reached.
+RATE_LIMIT_RESULT = (github_services.Http2Mock.response_success,
+                     {"rate": {"remaining": 5000}})
+# The response to a request that GitHub failed to handle.
+SERVER_ERROR_RESULT = ({"status": 502}, {"message": "Server Error"})
+# The HTML page a proxy in front of GitHub responds with when GitHub is down.
+BAD_GATEWAY_PAGE = github_services.RawContent(
+    "<html><body><h1>502 Bad Gateway</h1></body></html>")
+BAD_GATEWAY_RESULT = ({"status": 502}, BAD_GATEWAY_PAGE)
+# The response to a request over the request limit.
+FORBIDDEN_RESULT = ({"status": 403}, {"message": "API rate limit exceeded"})
 
 
 class TestGitHubService(unittest.TestCase):
@@ -46,7 +63,8 @@ class TestGitHubService(unittest.TestCase):
     self.github_service = github_services.GitHubService(
         GITHUB_USERNAME, GITHUB_REPO, GITHUB_TOKEN,
         rate_limit=False,
-        http_instance=self.http_mock)
+        http_instance=self.http_mock,
+        retry_backoff=0)
 
   def testSuccessfulRequestSuccess(self):
     success = github_services._CheckSuccessful(
@@ -119,6 +137,117 @@ class TestGitHubService(unittest.TestCase):
     self.assertEqual(expected_fragment, actual_fragment)
     self.assertItemsEqual(expected_query_list, actual_query_list)
 
+  def testHttpRequestRetryServerError(self):
+    self.http_mock.results.extend([
+        SERVER_ERROR_RESULT,
+        (self.http_mock.response_success, {"one": 1})])
+    _, content = self.github_service._PerformHttpRequest("GET", "/test")
+    self.assertEqual({"one": 1}, content)
+    self.assertEqual(["GET", "GET"],
+                     [method for method, _ in self.http_mock.requests])
+
+  def testHttpRequestRetryHtmlServerError(self):
+    self.http_mock.results.extend([
+        BAD_GATEWAY_RESULT, BAD_GATEWAY_RESULT,
+        (self.http_mock.response_success, {"one": 1})])
+    _, content = self.github_service._PerformHttpRequest("GET", "/test")
+    self.assertEqual({"one": 1}, content)
+    self.assertEqual(3, len(self.http_mock.requests))
+
+  def testHttpRequestGiveUpHtmlServerError(self):
+    self.http_mock.results.extend(
+        [BAD_GATEWAY_RESULT] * github_services.MAX_HTTP_REQUESTS)
+    response, content = self.github_service._PerformHttpRequest("GET", "/test")
+    self.assertEqual(502, response["status"])
+    self.assertEqual({"message": BAD_GATEWAY_PAGE}, content)
+    self.assertEqual(github_services.MAX_HTTP_REQUESTS,
+                     len(self.http_mock.requests))
+
+  def testHttpRequestLimitCheckFails(self):
+    # GitHub is down, so checking the request limit fails too.
+    self.http_mock.results.extend([
+        ({"status": 403}, BAD_GATEWAY_PAGE), BAD_GATEWAY_RESULT])
+    response, content = self.github_service._PerformHttpRequest("GET", "/test")
+    self.assertEqual(403, response["status"])
+    self.assertEqual({"message": BAD_GATEWAY_PAGE}, content)
+    self.assertEqual(2, len(self.http_mock.requests))
+
+  def testHttpRequestLimitNotReached(self):
+    self.http_mock.results.extend([FORBIDDEN_RESULT, RATE_LIMIT_RESULT])
+    response, _ = self.github_service._PerformHttpRequest("GET", "/test")
+    self.assertEqual(403, response["status"])
+    self.assertEqual(["/test", "/rate_limit"],
+                     [urlparse.urlparse(url).path
+                      for _, url in self.http_mock.requests])
+
+  def testHttpRequestNoRetryClientError(self):
+    self.http_mock.results.append(
+        (self.http_mock.response_failure, {"message": "Bad"}))
+    response, _ = self.github_service._PerformHttpRequest("PATCH", "/test")
+    self.assertEqual(self.http_mock.response_failure, response)
+    self.assertEqual(1, len(self.http_mock.requests))
+
+  def testHttpRequestRetryPostConnectError(self):
+    # The request was never sent, so it is safe to send it again.
+    self.http_mock.results.extend([
+        socket.error(errno.ECONNREFUSED, "Connection refused"),
+        (self.http_mock.response_success, {"one": 1})])
+    _, content = self.github_service._PerformHttpRequest("POST", "/test")
+    self.assertEqual({"one": 1}, content)
+    self.assertEqual(2, len(self.http_mock.requests))
+
+  def testHttpRequestNoRetryPostTimeout(self):
+    # The request may have been applied, and there's no way to tell.
+    self.http_mock.results.append(socket.timeout("timed out"))
+    with self.assertRaises(socket.timeout):
+      self.github_service._PerformHttpRequest("POST", "/test")
+    self.assertEqual(1, len(self.http_mock.requests))
+
+  def testHttpRequestRetryPostTimeout(self):
+    find_write_results = [None]
+    self.http_mock.results.extend([
+        socket.timeout("timed out"),
+        (self.http_mock.response_success, {"one": 1})])
+    _, content = self.github_service._PerformHttpRequest(
+        "POST", "/test", find_write_method=find_write_results.pop)
+    self.assertEqual({"one": 1}, content)
+    self.assertEqual(2, len(self.http_mock.requests))
+
+  def testHttpRequestPostAlreadyApplied(self):
+    self.http_mock.results.append(SERVER_ERROR_RESULT)
+    write = (self.http_mock.response_success, {"one": 1})
+    self.assertEqual(write, self.github_service._PerformHttpRequest(
+        "POST", "/test", find_write_method=lambda: write))
+    self.assertEqual(1, len(self.http_mock.requests))
+
+  def testHttpRequestGiveUp(self):
+    self.http_mock.results.extend(
+        [socket.timeout("timed out")] * github_services.MAX_HTTP_REQUESTS)
+    with self.assertRaises(socket.timeout):
+      self.github_service._PerformHttpRequest("GET", "/test")
+    self.assertEqual(github_services.MAX_HTTP_REQUESTS,
+                     len(self.http_mock.requests))
+
+  def testClassifyError(self):
+    self.assertEqual(
+        github_services.CONNECT_FAILURE,
+        github_services._ClassifyError(httplib2.ServerNotFoundError("")))
+    self.assertEqual(
+        github_services.CONNECT_FAILURE,
+        github_services._ClassifyError(socket.error(errno.ENETUNREACH, "")))
+    self.assertEqual(
+        github_services.TIMEOUT_FAILURE,
+        github_services._ClassifyError(socket.error(errno.ECONNRESET, "")))
+    self.assertEqual(
+        github_services.TIMEOUT_FAILURE,
+        github_services._ClassifyError(socket.timeout("timed out")))
+
+  def testFingerprint(self):
+    self.assertEqual(github_services._Fingerprint(u"one\ntwo\n"),
+                     github_services._Fingerprint("one\r\ntwo"))
+    self.assertNotEqual(github_services._Fingerprint("one\ntwo"),
+                        github_services._Fingerprint("one\n\ntwo"))
+
   def testGetRequest(self):
     self.github_service.PerformGetRequest("/test")
     self.assertEqual(self.http_mock.last_method, "GET")
@@ -160,9 +289,10 @@ class TestIssueService(unittest.TestCase):
     self.github_service = github_services.GitHubService(
         GITHUB_USERNAME, GITHUB_REPO, GITHUB_TOKEN,
         rate_limit=False,
-        http_instance=self.http_mock)
+        http_instance=self.http_mock,
+        retry_backoff=0)
     self.github_issue_service = github_services.IssueService(
-        self.github_service, comment_delay=0)
+        self.github_service)
 
   def testCreateIssue(self):
     issue_body = {
@@ -201,7 +331,10 @@ class TestIssueService(unittest.TestCase):
         "```\none\n```\n\nReported by `a_uthor` on last year\n"
         "- **Labels added**: added-label\n"
         "- **Labels removed**: removed-label\n")
-    self.github_issue_service.CreateComment(1, SINGLE_COMMENT)
+    self.http_mock.content = {"id": 5, "created_at": "2015-03-01T00:00:00Z"}
+    self.assertEqual(
+        "2015-03-01T00:00:00Z",
+        self.github_issue_service.CreateComment(1, SINGLE_COMMENT))
     self.assertEqual(self.http_mock.last_method, "POST")
     uri = ("%s/repos/%s/%s/issues/%d/comments?access_token=%s" %
            (GITHUB_API_URL, GITHUB_USERNAME, GITHUB_REPO, 1, GITHUB_TOKEN))
@@ -209,22 +342,268 @@ class TestIssueService(unittest.TestCase):
     self.assertEqual(self.http_mock.last_body,
                      json.dumps({"body": comment_body}))
 
+  def testCreateIssueAlreadyCreated(self):
+    self.http_mock.results.extend([
+        socket.timeout("timed out"),
+        (self.http_mock.response_success, [
+            {"number": 6, "body": "Originally reported on Google Code with "
+                                  "ID 2\n"},
+            {"number": 7, "body": SINGLE_ISSUE.GetDescription()},
+        ]),
+    ])
+    self.assertEqual(7, self.github_issue_service.CreateIssue(SINGLE_ISSUE))
+    self.assertEqual(["POST", "GET"],
+                     [method for method, _ in self.http_mock.requests])
+    query = urlparse.parse_qs(urlparse.urlparse(self.http_mock.last_url).query)
+    self.assertEqual(["all"], query["state"])
+    self.assertIn("since", query)
+
+  def testCreateCommentAlreadyCreated(self):
+    comment_body = SINGLE_COMMENT.GetDescription()
+    self.http_mock.results.extend([
+        SERVER_ERROR_RESULT,
+        (self.http_mock.response_success,
+         [{"id": 10, "body": comment_body.replace("\n", "\r\n")}]),
+    ])
+    self.github_issue_service.CreateComment(1, SINGLE_COMMENT)
+    self.assertEqual(["POST", "GET"],
+                     [method for method, _ in self.http_mock.requests])
+
+  def testCreateCommentNotCreated(self):
+    self.http_mock.results.extend([
+        socket.timeout("timed out"),
+        (self.http_mock.response_success, [{"id": 10, "body": "other"}]),
+        (self.http_mock.response_success, []),
+    ])
+    self.github_issue_service.CreateComment(1, SINGLE_COMMENT)
+    self.assertEqual(["POST", "GET", "GET", "POST"],
+                     [method for method, _ in self.http_mock.requests])
+    self.assertEqual(json.dumps({"body": SINGLE_COMMENT.GetDescription()}),
+                     self.http_mock.last_body)
+
+  def testCreateCommentCheckFailed(self):
+    # If it can't tell whether the comment was posted, it doesn't post again.
+    self.http_mock.results.extend([
+        socket.timeout("timed out"),
+        (self.http_mock.response_failure, {"message": "Not Found"}),
+    ])
+    with self.assertRaises(IOError):
+      self.github_issue_service.CreateComment(1, SINGLE_COMMENT)
+    self.assertEqual(1, [method for method, _ in
+                         self.http_mock.requests].count("POST"))
+
+  def testGetIssuesSince(self):
+    self.http_mock.results.extend([
+        (self.http_mock.response_success, [{"number": 1}]),
+        (self.http_mock.response_success, []),
+    ])
+    self.assertEqual([{"number": 1}], self.github_issue_service.GetIssues(
+        "all", since="2015-03-01T00:00:00Z"))
+    query = urlparse.parse_qs(urlparse.urlparse(self.http_mock.last_url).query)
+    self.assertEqual(["all"], query["state"])
+    self.assertEqual(["2015-03-01T00:00:00Z"], query["since"])
+
+  def testGetComments(self):
+    self.http_mock.results.extend([
+        (self.http_mock.response_success, [{"id": 1}, {"id": 2}]),
+        (self.http_mock.response_success, [{"id": 3}]),
+        (self.http_mock.response_success, []),
+    ])
+    self.assertEqual([{"id": 1}, {"id": 2}, {"id": 3}],
+                     self.github_issue_service.GetComments(1))
+
   def testGetIssueNumber(self):
     issue = {"number": 1347}
     issue_number = self.github_issue_service._GetIssueNumber(issue)
     self.assertEqual(1347, issue_number)
 
+  def testGetIssueUrlPrefix(self):
+    self.assertEqual(
+        "https://github.com/%s/%s/issues/" % (GITHUB_USERNAME, GITHUB_REPO),
+        self.github_issue_service.GetIssueUrlPrefix())
+
   # TODO(chris): Test filtering out issue responses a "pull_request" key.
   def testGetIssues(self):
     fake_github_service = github_services.FakeGitHubService(GITHUB_USERNAME,
                                                             GITHUB_REPO,
                                                             GITHUB_TOKEN)
     github_issue_service = github_services.IssueService(
-        fake_github_service, comment_delay=0)
+        fake_github_service)
     fake_github_service.AddFailureResponse()
     with self.assertRaises(IOError):
       github_issue_service.GetIssues()
 
 
+class _ImportRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Stands in for GitHub's issue import API.
+
+  Each import is reported as pending the first time its status is checked, and
+  as imported (or failed, for issues titled "fail") after that. Issues titled
+  "reject" can't be imported at all.
+  """
+
+  def _Respond(self, content, status=200):
+    body = json.dumps(content)
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def _GetPath(self):
+    server = self.server
+    url = urlparse.urlparse(self.path)
+    server.requests.append((self.command, url.path,
+                            urlparse.parse_qs(url.query),
+                            self.headers.get("Accept")))
+    return url.path
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    path = self._GetPath()
+    if path != "/repos/%s/%s/import/issues" % (GITHUB_USERNAME, GITHUB_REPO):
+      self._Respond({"message": "Not Found"}, 404)
+      return
+
+    server = self.server
+    body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+    if body["issue"]["title"] == "reject":
+      self._Respond({"message": "Validation Failed"}, 422)
+      return
+
+    server.imports.append({
+        "id": len(server.imports) + 100,
+        "status": "pending",
+        "created_at": "2015-03-0%dT00:00:00Z" % (len(server.imports) + 1),
+        "body": body,
+        "checked": False,
+    })
+    self._Respond(dict((key, value) for key, value in server.imports[-1].items()
+                       if key in ("id", "status", "created_at")), 202)
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    path = self._GetPath()
+    if path == "/rate_limit":
+      self._Respond({"rate": {"remaining": 5000}})
+      return
+    if path != "/repos/%s/%s/import/issues" % (GITHUB_USERNAME, GITHUB_REPO):
+      self._Respond({"message": "Not Found"}, 404)
+      return
+
+    since = urlparse.parse_qs(urlparse.urlparse(self.path).query).get(
+        "since", [""])[0]
+    statuses = []
+    for index, issue_import in enumerate(self.server.imports):
+      if issue_import["created_at"] < since:
+        continue
+      if issue_import["checked"]:
+        if issue_import["body"]["issue"]["title"] == "fail":
+          issue_import["status"] = "failed"
+        else:
+          issue_import["status"] = "imported"
+          issue_import["issue_url"] = (
+              "http://127.0.0.1/repos/%s/%s/issues/%d" %
+              (GITHUB_USERNAME, GITHUB_REPO, index + 1))
+      issue_import["checked"] = True
+      statuses.append(dict(
+          (key, value) for key, value in issue_import.items()
+          if key in ("id", "status", "created_at", "issue_url")))
+    self._Respond(statuses)
+
+  def log_message(self, *unused_args):  # pylint: disable=arguments-differ
+    pass
+
+
+class TestIssueImportService(unittest.TestCase):
+  """Tests for the IssueImportService, against a local stub server."""
+
+  def setUp(self):
+    self.server = BaseHTTPServer.HTTPServer(
+        ("127.0.0.1", 0), _ImportRequestHandler)
+    self.server.imports = []
+    self.server.requests = []
+    self.server_thread = threading.Thread(target=self.server.serve_forever)
+    self.server_thread.daemon = True
+    self.server_thread.start()
+
+    self.github_service = github_services.GitHubService(
+        GITHUB_USERNAME, GITHUB_REPO, GITHUB_TOKEN,
+        rate_limit=False,
+        http_instance=httplib2.Http(proxy_info=None),
+        api_url="http://127.0.0.1:%d" % self.server.server_port)
+    self.github_import_service = github_services.IssueImportService(
+        self.github_service, batch_size=2, check_time=0)
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.server_thread.join()
+
+  def _MakeIssue(self, issue_id, **fields):
+    issue = dict(SINGLE_ISSUE._issue, id=issue_id, **fields)
+    return issues.GoogleCodeIssue(issue, REPO, SINGLE_ISSUE.GetUserMap())
+
+  def testImportIssue(self):
+    self.assertTrue(self.github_import_service.ImportIssue(
+        SINGLE_ISSUE, SINGLE_ISSUE.GetComments()))
+    self.assertEqual({1: 1}, self.github_import_service.WaitForImports())
+    # Each import is only returned once.
+    self.assertEqual({}, self.github_import_service.WaitForImports())
+
+    body = self.server.imports[0]["body"]
+    self.assertEqual("issue_title", body["issue"]["title"])
+    self.assertEqual("default_username", body["issue"]["assignee"])
+    self.assertEqual(["awesome", "great", "Status-Fixed"],
+                     body["issue"]["labels"])
+    self.assertTrue(body["issue"]["closed"])
+    self.assertTrue(body["issue"]["body"].startswith(
+        "Originally reported on Google Code with ID 1\n"))
+    self.assertEqual(
+        [issues.GoogleCodeComment(SINGLE_ISSUE, comment).GetDescription()
+         for comment in SINGLE_ISSUE.GetComments()],
+        [comment["body"] for comment in body["comments"]])
+
+    # Every request asked for the import API preview.
+    for _, _, _, accept in self.server.requests:
+      self.assertEqual(github_services.ISSUE_IMPORT_MEDIA_TYPE, accept)
+
+  def testImportIssueTimestamps(self):
+    self.github_import_service.ImportIssue(
+        self._MakeIssue(1, published="2014-01-02T03:04:05.678Z", state="open"),
+        [{"id": 1, "content": "one", "published": "2014-01-02T03:04:05.678Z"},
+         {"id": 2, "content": "two", "published": "2014-02-03T04:05:06.000Z"}])
+
+    body = self.server.imports[0]["body"]
+    self.assertFalse(body["issue"]["closed"])
+    # Fractions of seconds aren't accepted by the import API.
+    self.assertEqual("2014-01-02T03:04:05Z", body["issue"]["created_at"])
+    self.assertEqual(["2014-01-02T03:04:05Z", "2014-02-03T04:05:06Z"],
+                     [comment["created_at"] for comment in body["comments"]])
+
+  def testImportIssueBatches(self):
+    for issue_id in range(1, 4):
+      self.github_import_service.ImportIssue(self._MakeIssue(issue_id), [])
+    # The first two imports were waited for once the batch was full.
+    self.assertEqual(1, len(self.github_import_service._pending_imports))
+    self.assertEqual({1: 1, 2: 2, 3: 3},
+                     self.github_import_service.WaitForImports())
+
+    # Each check covers all pending imports, from the oldest one on.
+    checks = [query.get("since") for method, _, query, _ in
+              self.server.requests if method == "GET"]
+    self.assertEqual(
+        [["2015-03-01T00:00:00Z"], ["2015-03-01T00:00:00Z"],
+         ["2015-03-03T00:00:00Z"], ["2015-03-03T00:00:00Z"]], checks)
+
+  def testImportIssueFailed(self):
+    self.github_import_service.ImportIssue(self._MakeIssue(1, title="fail"), [])
+    with self.assertRaises(issues.ServiceError):
+      self.github_import_service.WaitForImports()
+
+  def testImportIssueRejected(self):
+    with self.assertRaises(issues.ServiceError):
+      self.github_import_service.ImportIssue(
+          self._MakeIssue(1, title="reject"), [])
+
+
 if __name__ == "__main__":
   unittest.main(buffer=True)
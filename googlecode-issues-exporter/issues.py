@@ -17,12 +17,20 @@
 
 import collections
 import datetime
+import errno
 import json
+import multiprocessing.pool
+import os
 import re
+import struct
 import sys
+import threading
+import time
 
 import HTMLParser
 
+import takeout_store
+
 
 # Regular expression used by Google Code for auto-linking issue references,
 # e.g. "issue #8" or "bug5".
@@ -37,6 +45,26 @@ GC_ISSUE_REF_RE = re.compile(r"""
 EX_ISSUE_REF_RE = re.compile(
     r"- \*\*(?P<tag>([^\*]+))\*\*: #(?P<issues>([^\n]+))")
 
+# The magic string at the start of an issue map file. See WriteIssueMap(...).
+# wiki2gfm, which reads the files, is a separate tool with its own copy in
+# wiki_to_md/impl/issue_map.py, which must match.
+ISSUE_MAP_MAGIC = "gcissuemap1"
+
+# The URL of Google's mirror of the attachments of Google Code issues.
+ATTACHMENT_URL = "https://storage.googleapis.com/google-code-attachments"
+
+# The extensions of attachments to show inline as images.
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".gif")
+
+# How far (in seconds) the issue service's clock may be behind ours, when
+# asking it for the issues updated since the last sync.
+SYNC_CLOCK_SKEW = 60 * 5
+
+# Regular expression to match the header at the start of the body of every
+# exported issue, giving the Google Code issue ID. See GetDescription().
+ORIGINAL_ID_RE = re.compile(
+    r"Originally reported on Google Code with ID (?P<issue_id>\d+)\n")
+
 def RemapIssueIds(comment, id_mapping):
   """Rewrite a comment's text based on an ID mapping.
 
@@ -171,17 +199,21 @@ class GoogleCodeIssue(object):
   Handles parsing and viewing a Google Code issue.
   """
 
-  def __init__(self, issue, project_name, user_map):
+  def __init__(self, issue, project_name, user_map, attachment_links=None):
     """Initialize the GoogleCodeIssue.
 
     Args:
       issue: The Google Code Issue as a dictionary.
       project_name: The name of the project the issue belongs to.
       user_map: A map from Google Code usernames to issue service names.
+      attachment_links: A map from the path of each mirrored attachment, see
+          GoogleCodeComment.GetAttachmentPaths(), to the URL to link to it
+          with. Other attachments are linked to on ATTACHMENT_URL.
     """
     self._issue = issue
     self._project_name = project_name
     self._user_map = user_map
+    self._attachment_links = attachment_links or {}
 
   def GetProjectName(self):
     """Returns the project name."""
@@ -191,6 +223,13 @@ class GoogleCodeIssue(object):
     """Returns the user map."""
     return self._user_map
 
+  def GetAttachmentLink(self, attachment_path):
+    """Returns the URL to link to an attachment with, given its path."""
+    link = self._attachment_links.get(attachment_path)
+    if link:
+      return link
+    return "%s/%s" % (ATTACHMENT_URL, attachment_path)
+
   def GetOwner(self):
     """Get the owner username of a Google Code issue.
 
@@ -228,7 +267,7 @@ class GoogleCodeIssue(object):
     Returns:
       A list of the labels of this issue.
     """
-    labels = self._issue.get("labels", [])
+    labels = list(self._issue.get("labels", []))
     # Add status as a label.
     if "status" in self._issue:
       labels.append("Status-" + self._issue["status"])
@@ -320,14 +359,16 @@ class GoogleCodeIssue(object):
     """
     return "state" in self._issue and self._issue["state"] == "open"
 
+  def GetDescriptionComment(self):
+    """Returns the GoogleCodeComment of comment #0, the issue's description."""
+    return GoogleCodeComment(self, self._issue["comments"]["items"][0])
+
   def GetDescription(self):
     """Returns the Description of the issue."""
     # Just return the description of the underlying comment. However,
     # we fudge a few things since metadata is stored differently for
     # "the issue" (i.e. comment #0) and other comments.
-    comment_0_data = self._issue["comments"]["items"][0]
-    googlecode_comment = GoogleCodeComment(self, comment_0_data)
-    issue_description = googlecode_comment.GetDescription()
+    issue_description = self.GetDescriptionComment().GetDescription()
     # Be careful not to run afoul of issue reference rewriting...
     issue_header = "Originally reported on Google Code with ID %s\n" % (
         self.GetId())
@@ -497,32 +538,36 @@ class GoogleCodeComment(object):
                     ", #".join(removed) + "\n")
     return ref_info
 
-  def _GetAttachmentInfo(self):
-    """Returns Markdown text for a comment's attachments as appropriate."""
-    attachmentLines = []
+  def GetAttachmentPaths(self):
+    """Get the attachments of a Google Code comment.
+
+    Deleted attachments are left out, since they can't be found on the issue
+    mirror.
 
-    attachments = self._comment["attachments"] if "attachments" in self._comment else []
-    for attachment in attachments:
+    Returns:
+      A list of tuples of the file name of each attachment, and its path on
+      the issue mirror, relative to ATTACHMENT_URL.
+    """
+    attachment_paths = []
+    for attachment in self._comment.get("attachments", []):
       if "isDeleted" in attachment:
-        # Deleted attachments won't be found on the issue mirror.
         continue
+      attachment_paths.append((
+          attachment["fileName"], "%s/issue-%d/comment-%d/%s" % (
+              self.GetIssue().GetProjectName(), self.GetIssue().GetId(),
+              self.GetId(), attachment["fileName"])))
+    return attachment_paths
 
-      link = "https://storage.googleapis.com/google-code-attachments/%s/issue-%d/comment-%d/%s" % (
-          self.GetIssue().GetProjectName(), self.GetIssue().GetId(),
-          self.GetId(), attachment["fileName"])
-
-      def has_extension(extension):
-        return attachment["fileName"].lower().endswith(extension)
-
-      is_image_attachment = False
-      for extension in [".png", ".jpg", ".jpeg", ".bmp", ".tif", ".gif"]:
-        is_image_attachment |= has_extension(".png")
+  def _GetAttachmentInfo(self):
+    """Returns Markdown text for a comment's attachments as appropriate."""
+    attachmentLines = []
 
-      if is_image_attachment:
-        line = " * *Attachment: %s<br>![%s](%s)*" % (
-            attachment["fileName"], attachment["fileName"], link)
+    for file_name, attachment_path in self.GetAttachmentPaths():
+      link = self.GetIssue().GetAttachmentLink(attachment_path)
+      if file_name.lower().endswith(IMAGE_EXTENSIONS):
+        line = " * *Attachment: %s<br>![%s](%s)*" % (file_name, file_name, link)
       else:
-        line = " * *Attachment: [%s](%s)*" % (attachment["fileName"], link)
+        line = " * *Attachment: [%s](%s)*" % (file_name, link)
       attachmentLines.append(line)
 
     if len(attachmentLines) > 0:
@@ -536,11 +581,14 @@ class IssueService(object):
   Handles creating and updating issues and comments on an user API.
   """
 
-  def GetIssues(self, state="open"):
+  def GetIssues(self, state="open", since=None):
     """Gets all of the issue for the repository with the given state.
 
     Args:
-      state: The state of the repository can be either 'open' or 'closed'.
+      state: The state of the repository can be either 'open', 'closed' or
+          'all'.
+      since: Only get the issues updated at or after this ISO 8601 time
+          stamp, if given.
 
     Returns:
       The list of all of the issues with the given state.
@@ -586,6 +634,10 @@ class IssueService(object):
     Args:
       issue_number: The issue number.
       googlecode_comment: An instance of GoogleCodeComment
+
+    Returns:
+      The ISO 8601 time stamp the service gave the comment, if comments are
+      shown in the order of their time stamps, or None.
     """
     raise NotImplementedError()
 
@@ -593,12 +645,38 @@ class IssueService(object):
     """Edits an existing comment."""
     raise NotImplementedError()
 
+  def ImportIssue(self, googlecode_issue, comments):
+    """Starts importing an issue with all of its comments, if supported.
+
+    Services that import issues whole do so asynchronously, and the issue
+    number is only known once WaitForImports returns.
+
+    Args:
+      googlecode_issue: An instance of GoogleCodeIssue
+      comments: The list of comments of the issue, as dictionaries.
+
+    Returns:
+      False if the service can't import issues whole, and the issue must be
+      created, commented on and closed with separate calls instead.
+    """
+    return False
+
+  def WaitForImports(self):
+    """Waits for all issue imports started by ImportIssue to finish.
+
+    Returns:
+      A dictionary from Google Code issue ID to the issue number, for each
+      issue imported since the last call.
+    """
+    return {}
+
 
 def LoadIssueData(issue_file_path, project_name):
   """Loads issue data from a file.
 
   Args:
-    issue_file_path: path to the file to load
+    issue_file_path: path to the file to load, either a Takeout file, which
+        may be compressed, or a store created from one by takeout_store.py
     project_name: name of the project to load
 
   Returns:
@@ -607,15 +685,80 @@ def LoadIssueData(issue_file_path, project_name):
   Raises:
     ProjectNotFoundError: the project_name was not found in the file.
   """
-  with open(issue_file_path) as user_file:
-    user_data = json.load(user_file)
-    user_projects = user_data["projects"]
+  return LoadIssueDataForProjects(issue_file_path, [project_name])[project_name]
+
+
+def LoadIssueDataForProjects(issue_file_path, project_names):
+  """Loads the issue data of several projects, reading the file once.
+
+  Args:
+    issue_file_path: path to the file to load, see LoadIssueData
+    project_names: names of the projects to load
+
+  Returns:
+    A dictionary of the issue data of each project, by project name.
+
+  Raises:
+    ProjectNotFoundError: one of the project_names was not found in the file.
+  """
+  project_issue_data = {}
+  if takeout_store.IsTakeoutStore(issue_file_path):
+    store = takeout_store.TakeoutStore(issue_file_path)
+    try:
+      for project_name in project_names:
+        issue_data = store.GetIssues(project_name)
+        if issue_data is not None:
+          project_issue_data[project_name] = issue_data
+    finally:
+      store.Close()
+  else:
+    with takeout_store.OpenTakeoutFile(issue_file_path) as user_file:
+      user_data = json.load(user_file)
+      user_projects = user_data["projects"]
+
+      for project in user_projects:
+        if project["name"] in project_names:
+          project_issue_data[project["name"]] = project["issues"]["items"]
+
+  for project_name in project_names:
+    if project_name not in project_issue_data:
+      raise ProjectNotFoundError("Project %s not found" % project_name)
+  return project_issue_data
+
+
+def LoadSyncState(sync_state_file_path):
+  """Loads the state recorded by the last sync of a project.
+
+  Args:
+    sync_state_file_path: path to the file to load
+
+  Returns:
+    The sync state, or an empty one if the project wasn't synced before. See
+    IssueExporter.GetSyncState().
+  """
+  try:
+    with open(sync_state_file_path) as sync_state_file:
+      return json.load(sync_state_file)
+  except IOError, e:
+    if e.errno == errno.ENOENT:
+      return {}
+    raise
+
 
-    for project in user_projects:
-      if project_name == project["name"]:
-        return project["issues"]["items"]
+def WriteSyncState(sync_state_file_path, sync_state):
+  """Writes the state of a sync to a file, for the next sync.
 
-  raise ProjectNotFoundError("Project %s not found" % project_name)
+  The file is replaced all at once, so that it still holds the last state if
+  writing is interrupted.
+
+  Args:
+    sync_state_file_path: path to the file to write
+    sync_state: the sync state, see IssueExporter.GetSyncState()
+  """
+  temp_file_path = sync_state_file_path + ".tmp"
+  with open(temp_file_path, "w") as sync_state_file:
+    json.dump(sync_state, sync_state_file, sort_keys=True)
+  os.rename(temp_file_path, sync_state_file_path)
 
 
 def LoadUserData(user_file_path, user_service):
@@ -638,8 +781,32 @@ def LoadUserData(user_file_path, user_service):
     if not user_service.IsUser(username):
       raise InvalidUserError("%s is not a User" % username)
 
-  result.update(user_map)
-  return result
+  identity_dict.update(user_map)
+  return identity_dict
+
+
+def WriteIssueMap(issue_map_file_path, issue_numbers, issue_url_prefix):
+  """Writes a map from Google Code issue ID to exported issue URL to a file.
+
+  The map is meant to be loaded by wiki2gfm, to link the issues mentioned on
+  wiki pages to the exported issues. The file is a header line with the magic
+  string and the URL prefix of the exported issues, followed by an array of
+  little-endian 32-bit unsigned integers. The integer at index N is the
+  exported issue number of Google Code issue N, or 0 if it was not exported.
+
+  Args:
+    issue_map_file_path: path to the file to write
+    issue_numbers: map from Google Code issue ID to exported issue number
+    issue_url_prefix: the URL of an exported issue, minus its number
+  """
+  table_size = max(issue_numbers.keys()) + 1 if issue_numbers else 0
+  table = [0] * table_size
+  for googlecode_id, exported_id in issue_numbers.items():
+    table[googlecode_id] = exported_id
+
+  with open(issue_map_file_path, "wb") as issue_map_file:
+    issue_map_file.write("%s %s\n" % (ISSUE_MAP_MAGIC, issue_url_prefix))
+    issue_map_file.write(struct.pack("<%dI" % table_size, *table))
 
 
 class IssueExporter(object):
@@ -649,7 +816,9 @@ class IssueExporter(object):
   """
 
   def __init__(self, issue_service, user_service, issue_json_data,
-               project_name, user_map):
+               project_name, user_map, comment_workers=1, sync_state=None,
+               comment_pool=None, progress_method=None,
+               attachment_links=None):
     """Initialize the IssueExporter.
 
     Args:
@@ -658,20 +827,47 @@ class IssueExporter(object):
       project_name: The name of the project to export to.
       issue_json_data: A data object of issues from Google Code.
       user_map: A map from user email addresses to service usernames.
+      comment_workers: The number of issues to post comments to at once. The
+          comments of each issue are always posted one at a time.
+      sync_state: The state recorded by the last sync, from LoadSyncState(),
+          to only check the issues changed since. None to check every issue.
+      comment_pool: A ThreadPool shared with other exporters to post comments
+          with, instead of a pool of comment_workers threads of its own.
+      progress_method: A function to call to show the progress of the export,
+          given the issue number, issue total, comment number and comment
+          total, instead of the progress bar.
+      attachment_links: A map from attachment paths to the URLs of their
+          mirrors, see GoogleCodeIssue.
     """
     self._issue_service = issue_service
     self._user_service = user_service
     self._issue_json_data = issue_json_data
     self._project_name = project_name
     self._user_map = user_map
+    self._comment_workers = comment_workers
+    self._comment_pool = comment_pool
+    self._progress_method = progress_method
+    self._attachment_links = attachment_links
+    self._sync_state = sync_state or {}
+    # When this sync started, minus SYNC_CLOCK_SKEW. See Init(...).
+    self._sync_started_at = None
+    # The issue numbers of exported issues updated since the last sync.
+    self._touched_issue_numbers = set()
 
     # Specialized index of issues to quickly check what has been migrated to
     # GitHub and if so, determine it's new issue ID. See Init(...).
     self._issue_index = {}
+    # The same issue metadata, by Google Code issue ID as a string.
+    self._googlecode_index = {}
 
     self._prefix = ""  # Output only.
     self._issue_total = 0
     self._issue_number = 0
+    # The comment progress last shown, and the Google Code issue ID it is
+    # for. Comments are posted to several issues at once, so these are only
+    # changed together, under the lock. See _UpdateProgressBar.
+    self._progress_lock = threading.Lock()
+    self._comment_issue_id = None
     self._comment_number = 0
     self._comment_total = 0
     self._skipped_issues = 0
@@ -688,46 +884,94 @@ class IssueExporter(object):
     """
     print "Building issue index."
     self._issue_index = {}
+    self._googlecode_index = {}
     index = self._issue_index
 
     for issue in self._issue_json_data:
       gc_issue = GoogleCodeIssue(issue, self._project_name, self._user_map)
-      if gc_issue.GetTitle() not in index:
-        index[gc_issue.GetTitle()] = []
-      index[gc_issue.GetTitle()].append({
+      export_metadata = {
         "googlecode_id": gc_issue.GetId(),
         "exported": False,
         "exported_id": -1,
         "comment_count": -1,
-      })
+      }
+      index.setdefault(gc_issue.GetTitle(), []).append(export_metadata)
+      self._googlecode_index[str(gc_issue.GetId())] = export_metadata
 
     print "Determining which issues have already been exported."
-    open_issues = self._issue_service.GetIssues("open")
-    closed_issues = self._issue_service.GetIssues("closed")
-    all_exported_issues = open_issues + closed_issues
+    self._sync_started_at = time.strftime(
+        "%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - SYNC_CLOCK_SKEW))
+    # Exported issues recorded by the last sync, by exported issue number.
+    synced_issues = {}
+    synced_at = self._sync_state.get("synced_at")
+    if synced_at:
+      # The issues exported by the last sync are still exported, and only those
+      # updated since can have changed.
+      for googlecode_id, synced_issue in self._sync_state["issues"].items():
+        export_metadata = self._googlecode_index.get(googlecode_id)
+        if export_metadata is not None:
+          export_metadata["exported"] = True
+          export_metadata["exported_id"] = synced_issue["exported_id"]
+          export_metadata["comment_count"] = synced_issue["comment_count"]
+          synced_issues[synced_issue["exported_id"]] = export_metadata
+      all_exported_issues = self._issue_service.GetIssues(
+          "all", since=synced_at)
+    else:
+      open_issues = self._issue_service.GetIssues("open")
+      closed_issues = self._issue_service.GetIssues("closed")
+      all_exported_issues = open_issues + closed_issues
+    self._touched_issue_numbers = set(
+        exported_issue["number"] for exported_issue in all_exported_issues)
     # Sort issues by GitHub ID, since Google Code issues will be exported in
     # order we can use the exported issue's chronology to resolve ambiguities
     # for issues with the same title. Yes, GitHub number == ID.
     all_exported_issues = sorted(all_exported_issues,
                                  key=lambda issue: issue["number"])
+
+    # Exported issues start with the ID of the Google Code issue, so match
+    # those exactly. Titles can be duplicated or edited, so they are only used
+    # for issues exported without the ID.
+    unmatched_issues = []
     for exported_issue in all_exported_issues:
+      export_metadata = synced_issues.get(exported_issue["number"])
+      if export_metadata is not None:
+        # Only its comments may have changed since the last sync.
+        export_metadata["comment_count"] = exported_issue["comments"]
+        continue
+
+      match = ORIGINAL_ID_RE.match(exported_issue.get("body") or "")
+      if not match:
+        unmatched_issues.append(exported_issue)
+        continue
+
+      googlecode_id = match.group("issue_id")
+      export_metadata = self._googlecode_index.get(googlecode_id)
+      if export_metadata is None:
+        print ("Warning: GitHub issue #%s is Google Code issue #%s, which is "
+               "not in Google Takeout dump." % (
+                   exported_issue["number"], googlecode_id))
+      elif export_metadata["exported"]:
+        print ("Warning: GitHub issue #%s duplicates #%s, Google Code issue "
+               "#%s." % (exported_issue["number"],
+                         export_metadata["exported_id"], googlecode_id))
+      else:
+        self._MarkExported(export_metadata, exported_issue)
+
+    for exported_issue in unmatched_issues:
       exported_issue_id = exported_issue["number"]
       exported_issue_title = exported_issue["title"]
       if exported_issue_title not in index:
         print "Warning: GitHub issue #%s '%s' not in Google Takeout dump." % (
             exported_issue_id, exported_issue_title)
         continue
-      # Mark of the issue as exported.
-      for idx in range(0, len(index[exported_issue_title])):
-        if not index[exported_issue_title][idx]["exported"]:
-          index[exported_issue_title][idx]["exported"] = True
-          index[exported_issue_title][idx]["exported_id"] = exported_issue_id
-          index[exported_issue_title][idx]["comment_count"] = (
-              exported_issue["comments"])
+      # Mark of the first issue with the title not yet exported.
+      for export_metadata in index[exported_issue_title]:
+        if not export_metadata["exported"]:
+          self._MarkExported(export_metadata, exported_issue)
           break
-      if idx >= len(index[exported_issue_title]):
+      else:
         print "Warning: Couldn't find the %sth issue titled '%s'." % (
-            idx, exported_issue_title)
+            len(index[exported_issue_title]) + 1, exported_issue_title)
 
     # Build the ID map based on previously created issue. Only used if
     # rewriting comments.
@@ -740,42 +984,111 @@ class IssueExporter(object):
         if not issue["exported"]:
           raise Exception(
             "Issue #%s '%s' not found. Can't rewrite comments." % (
-                gc_issue.GetId(), gc_issue.GetTitle()))
+                issue["googlecode_id"], title))
 
     print "len(id_map) = %s, with %s total issues" % (
         len(self._id_mapping), len(self._issue_json_data))
     if len(self._id_mapping) < len(self._issue_json_data):
       raise Exception("Not all issues have been exported.")
 
+  def _MarkExported(self, export_metadata, exported_issue):
+    """Mark a Google Code issue as exported.
+
+    Args:
+      export_metadata: The metadata of the issue, from the issue index.
+      exported_issue: The exported issue, as returned by the issue service.
+    """
+    export_metadata["exported"] = True
+    export_metadata["exported_id"] = exported_issue["number"]
+    export_metadata["comment_count"] = exported_issue["comments"]
+
   def _GetExportedIssue(self, googlecode_issue):
     """Return metadata about the exported Google Code issue."""
-    index = self._issue_index
-    issue_title = googlecode_issue.GetTitle()
     issue_id = googlecode_issue.GetId()
-
-    if issue_title not in index:
-      raise Exception("Google Code issue '%s' not expected to be exported." % (
-          issue_title))
-    for idx in range(0, len(index[issue_title])):
-      if index[issue_title][idx]["googlecode_id"] == issue_id:
-        return index[issue_title][idx]
-    raise Exception("Unable to find Google Code issue #%s." % (issue_id))
+    export_metadata = self._googlecode_index.get(str(issue_id))
+    if export_metadata is None:
+      raise Exception("Unable to find Google Code issue #%s." % (issue_id))
+    return export_metadata
 
   def _HasIssueBeenExported(self, googlecode_issue):
     """Returns whether or not a Google Code issue has been exported."""
     export_metadata = self._GetExportedIssue(googlecode_issue)
     return export_metadata["exported"]
 
-  def _UpdateProgressBar(self):
+  def _GetSyncedIssue(self, googlecode_issue):
+    """Returns what the last sync recorded about an issue, or None."""
+    return self._sync_state.get("issues", {}).get(str(googlecode_issue.GetId()))
+
+  def _IsIssueSynced(self, googlecode_issue):
+    """Returns whether an issue changed on neither side since the last sync."""
+    synced_issue = self._GetSyncedIssue(googlecode_issue)
+    if synced_issue is None:
+      return False
+    return (
+        synced_issue["updated"] == googlecode_issue.GetContentUpdatedOn() and
+        synced_issue["comment_count"] == len(googlecode_issue.GetComments()) and
+        synced_issue["exported_id"] not in self._touched_issue_numbers)
+
+  def GetSyncState(self):
+    """Returns the state to record for the next sync, after Init() and Start().
+
+    The state is a dictionary with the time stamp the next sync should look for
+    updated issues from under "synced_at", and a dictionary under "issues"
+    with the "updated" time stamp, "comment_count" and "exported_id" of each
+    exported issue, by Google Code issue ID.
+    """
+    synced_issues = {}
+    for issue in self._issue_json_data:
+      googlecode_issue = GoogleCodeIssue(
+          issue, self._project_name, self._user_map)
+      export_metadata = self._GetExportedIssue(googlecode_issue)
+      if export_metadata["exported"]:
+        synced_issues[str(googlecode_issue.GetId())] = {
+            "updated": googlecode_issue.GetContentUpdatedOn(),
+            "comment_count": len(googlecode_issue.GetComments()),
+            "exported_id": export_metadata["exported_id"],
+        }
+    return {"synced_at": self._sync_started_at, "issues": synced_issues}
+
+  def GetExportedIssueNumbers(self):
+    """Returns a map from Google Code issue ID to exported issue number.
+
+    Only issues known to be exported are included, so call this after Init()
+    and Start().
+    """
+    issue_numbers = {}
+    for issue_list in self._issue_index.values():
+      for issue in issue_list:
+        if issue["exported"]:
+          issue_numbers[int(issue["googlecode_id"])] = int(issue["exported_id"])
+    return issue_numbers
+
+  def _UpdateProgressBar(self, comment_progress=None):
     """Update issue count 'feed'.
 
-    This displays the current status of the script to the user.
+    This displays the current status of the script to the user. It may be
+    called from several threads at once.
+
+    Args:
+      comment_progress: A tuple of the Google Code issue ID, comment number
+          and comment total of the issue a comment is being posted to, or None
+          to keep showing the last comment progress.
     """
-    feed_string = ("\r%sIssue: %d/%d -> Comment: %d/%d        " %
-                   (self._prefix, self._issue_number, self._issue_total,
-                    self._comment_number, self._comment_total))
-    sys.stdout.write(feed_string)
-    sys.stdout.flush()
+    with self._progress_lock:
+      if comment_progress:
+        (self._comment_issue_id, self._comment_number,
+         self._comment_total) = comment_progress
+      if self._progress_method:
+        self._progress_method(self._issue_number, self._issue_total,
+                              self._comment_number, self._comment_total)
+        return
+      feed_string = "\r%sIssue: %d/%d" % (
+          self._prefix, self._issue_number, self._issue_total)
+      if self._comment_issue_id is not None:
+        feed_string += " -> Comment: %d/%d of issue %s" % (
+            self._comment_number, self._comment_total, self._comment_issue_id)
+      sys.stdout.write(feed_string + "        ")
+      sys.stdout.flush()
 
   def _CreateIssue(self, googlecode_issue):
     """Converts an issue from Google Code to an issue service.
@@ -798,19 +1111,97 @@ class IssueExporter(object):
     This will take a list of Google Code issue comments and create
     corresponding comments on an issue service for the given issue number.
 
+    Each comment is only posted once the one before it has been, so that the
+    service can't receive them out of order. It can still give them time
+    stamps out of order though, which is checked.
+
     Args:
       comments: A list of comments (each comment is just a string).
       issue_number: The issue number.
       source_issue_id: The Google Code issue id.
+
+    Returns:
+      False if the service gave any comment an earlier time stamp than the one
+      before it, so that they are shown out of order.
     """
-    self._comment_total = len(comments)
-    self._comment_number = 0
+    in_order = True
+    last_created_on = None
 
-    for comment in comments:
+    for comment_number, comment in enumerate(comments, 1):
       googlecode_comment = GoogleCodeComment(googlecode_issue, comment)
-      self._comment_number += 1
-      self._UpdateProgressBar()
-      self._issue_service.CreateComment(issue_number, googlecode_comment)
+      self._UpdateProgressBar(
+          (googlecode_issue.GetId(), comment_number, len(comments)))
+      created_on = self._issue_service.CreateComment(
+          issue_number, googlecode_comment)
+      if created_on and last_created_on and created_on < last_created_on:
+        in_order = False
+      last_created_on = created_on or last_created_on
+    return in_order
+
+  def _ExportComments(self, comments, issue_number, googlecode_issue):
+    """Posts the comments of a new issue, then closes it if it was closed.
+
+    Args:
+      comments: A list of comments (each comment is just a string).
+      issue_number: The issue number.
+      googlecode_issue: An instance of GoogleCodeIssue
+
+    Returns:
+      False if the comments are shown out of order. See _CreateComments.
+    """
+    in_order = self._CreateComments(comments, issue_number, googlecode_issue)
+    if not googlecode_issue.IsOpen():
+      self._issue_service.CloseIssue(issue_number)
+    return in_order
+
+  def _CollectCommentExports(self, comment_exports, misordered_issues):
+    """Collects the results of posting comments from other threads.
+
+    Results are collected in the order the issues were created, up to the
+    first one that isn't finished yet. Errors are raised on collection.
+
+    Args:
+      comment_exports: A deque of tuples of a GoogleCodeIssue, its issue
+          number, and the AsyncResult of its _ExportComments.
+      misordered_issues: A list to add a tuple of the GoogleCodeIssue and
+          issue number to, for each issue with comments shown out of order.
+    """
+    while comment_exports and comment_exports[0][2].ready():
+      googlecode_issue, issue_number, result = comment_exports.popleft()
+      if not result.get():
+        misordered_issues.append((googlecode_issue, issue_number))
+
+  def _RepairCommentOrder(self, googlecode_issue, issue_number):
+    """Fixes the order of comments that were shown out of order.
+
+    Comments can't be moved, so each one shown in the wrong place is edited
+    to hold the comment that belongs there instead.
+
+    Args:
+      googlecode_issue: An instance of GoogleCodeIssue
+      issue_number: The issue number.
+    """
+    def NormalizeBody(body):
+      return body.replace("\r\n", "\n").strip()
+
+    comments = [GoogleCodeComment(googlecode_issue, comment)
+                for comment in googlecode_issue.GetComments()]
+    # Comments are shown in the order of their time stamps, then their IDs.
+    existing_comments = sorted(
+        self._issue_service.GetComments(issue_number),
+        key=lambda comment: (comment["created_at"], comment["id"]))
+    if len(existing_comments) != len(comments):
+      print ("\nWarning: Can't reorder the comments of issue #%s, which has "
+             "%s comments instead of %s." % (
+                 issue_number, len(existing_comments), len(comments)))
+      return
+
+    print "\nReordering the comments of issue #%s." % issue_number
+    for comment, existing_comment in zip(comments, existing_comments):
+      if (NormalizeBody(existing_comment["body"]) !=
+          NormalizeBody(comment.GetDescription())):
+        self._issue_service.EditComment(
+            googlecode_issue, comment, existing_comment["id"])
 
   def _RewriteComments(self, googlecode_issue, exported_issue_number):
     """Rewrite all comments in the issue to update issue ID references.
@@ -822,8 +1213,6 @@ class IssueExporter(object):
     id_mapping = self._id_mapping
     comments = googlecode_issue.GetComments()
     self._prefix = "Rewriting "
-    self._comment_total = len(comments)
-    self._comment_number = 0
 
     self._issue_service.EditIssue(googlecode_issue, exported_issue_number)
 
@@ -842,8 +1231,8 @@ class IssueExporter(object):
       comment_number = existing_comments[comment_idx]["id"]
 
       gc_comment = GoogleCodeComment(googlecode_issue, comment, id_mapping)
-      self._comment_number += 1
-      self._UpdateProgressBar()
+      self._UpdateProgressBar(
+          (googlecode_issue.GetId(), comment_idx + 1, len(comments)))
       self._issue_service.EditComment(
           exported_issue_number, gc_comment, comment_number)
 
@@ -935,17 +1324,29 @@ class IssueExporter(object):
     """
     print "Starting issue export for '%s'" % (self._project_name)
     self._issue_total = len(self._issue_json_data)
-    self._comment_total = 0
     self._issue_number = 0
+    self._comment_issue_id = None
     self._comment_number = 0
+    self._comment_total = 0
     self._skipped_issues = 0
 
     last_issue_skipped = False  # Only used for formatting output.
+    # Issues imported whole, by Google Code issue ID.
+    imported_issues = {}
+    # Issues with comments shown out of order, see _CollectCommentExports.
+    misordered_issues = []
+
+    # Comments are posted to several issues at once by other threads, if
+    # enabled. Issues are always created in order, by this thread.
+    comment_pool = self._comment_pool
+    comment_exports = collections.deque()
+    if not comment_pool and self._comment_workers > 1:
+      comment_pool = multiprocessing.pool.ThreadPool(self._comment_workers)
 
     for issue in self._issue_json_data:
       self._FixBlockingBlockedOn(issue)
       googlecode_issue = GoogleCodeIssue(
-          issue, self._project_name, self._user_map)
+          issue, self._project_name, self._user_map, self._attachment_links)
       issue_title = googlecode_issue.GetTitle()
       short_issue_title = (
           issue_title[:16] + '...') if len(issue_title) > 18 else issue_title
@@ -954,6 +1355,10 @@ class IssueExporter(object):
 
       # Check if the issue has already been posted.
       if self._HasIssueBeenExported(googlecode_issue):
+        if not rewrite_comments and self._IsIssueSynced(googlecode_issue):
+          self._skipped_issues = self._skipped_issues + 1
+          continue
+
         export_metadata = self._GetExportedIssue(googlecode_issue)
         print "%sGoogle Code issue #%s already exported with ID #%s." % (
             ("\n" if not last_issue_skipped else ""),
@@ -974,6 +1379,15 @@ class IssueExporter(object):
                 export_metadata["exported_id"], googlecode_comment)
             print "  Added missing comment #%d" % (idx + 1)
 
+        synced_issue = self._GetSyncedIssue(googlecode_issue)
+        if (synced_issue and synced_issue["updated"] !=
+            googlecode_issue.GetContentUpdatedOn()):
+          self._issue_service.EditIssue(
+              googlecode_issue, export_metadata["exported_id"])
+          if not googlecode_issue.IsOpen():
+            self._issue_service.CloseIssue(export_metadata["exported_id"])
+          print "  Updated the issue"
+
         if rewrite_comments:
           self._RewriteComments(googlecode_issue, export_metadata["exported_id"])
           print ""  # Advanced past the "progress bar" line.
@@ -983,11 +1397,44 @@ class IssueExporter(object):
       # Post the issue for the first time.
       self._UpdateProgressBar()
       last_issue_skipped = False
-      posted_issue_id = self._CreateIssue(googlecode_issue)
       comments = googlecode_issue.GetComments()
-      self._CreateComments(comments, posted_issue_id, googlecode_issue)
+      if self._issue_service.ImportIssue(googlecode_issue, comments):
+        # Imported whole, and numbered once all imports have finished.
+        imported_issues[googlecode_issue.GetId()] = googlecode_issue
+        continue
 
-      if not googlecode_issue.IsOpen():
-        self._issue_service.CloseIssue(posted_issue_id)
+      posted_issue_id = self._CreateIssue(googlecode_issue)
+      export_metadata = self._GetExportedIssue(googlecode_issue)
+      export_metadata["exported"] = True
+      export_metadata["exported_id"] = posted_issue_id
+
+      if comment_pool:
+        comment_exports.append((
+            googlecode_issue, posted_issue_id, comment_pool.apply_async(
+                self._ExportComments,
+                (comments, posted_issue_id, googlecode_issue))))
+        self._CollectCommentExports(comment_exports, misordered_issues)
+      elif not self._ExportComments(
+          comments, posted_issue_id, googlecode_issue):
+        misordered_issues.append((googlecode_issue, posted_issue_id))
+
+    if comment_pool:
+      for _, _, result in comment_exports:
+        result.wait()
+      self._CollectCommentExports(comment_exports, misordered_issues)
+      if comment_pool is not self._comment_pool:
+        comment_pool.close()
+        comment_pool.join()
+
+    for googlecode_issue, issue_number in misordered_issues:
+      self._RepairCommentOrder(googlecode_issue, issue_number)
+
+    if imported_issues:
+      print "\nWaiting for %d issue imports to finish." % len(imported_issues)
+    issue_numbers = self._issue_service.WaitForImports()
+    for googlecode_id, issue_number in issue_numbers.items():
+      export_metadata = self._GetExportedIssue(imported_issues[googlecode_id])
+      export_metadata["exported"] = True
+      export_metadata["exported_id"] = issue_number
 
     print "Finished!"
@@ -18,6 +18,10 @@
 
 import collections
 import copy
+import os
+import shutil
+import struct
+import tempfile
 import unittest
 
 import issues
@@ -121,7 +125,27 @@ class GoogleCodeIssueTest(unittest.TestCase):
         "- **Labels removed**: removed-label\n",
         SINGLE_COMMENT.GetDescription())
 
-  # TODO(chris): Test GetCommentDescription for something with attachments.
+  def testGetCommentDescription_Attachments(self):
+    attachments_data = dict(COMMENT_ONE, attachments=[
+        {"fileName": "photo.JPG"},
+        {"fileName": "log.txt"},
+        {"fileName": "deleted.png", "isDeleted": True},
+    ])
+    issue = issues.GoogleCodeIssue(
+        ISSUE_JSON, REPO, USER_MAP,
+        {REPO + "/issue-1/comment-1/log.txt": "https://example.com/log.txt"})
+    comment = issues.GoogleCodeComment(issue, attachments_data)
+    self.assertEqual(
+        [("photo.JPG", REPO + "/issue-1/comment-1/photo.JPG"),
+         ("log.txt", REPO + "/issue-1/comment-1/log.txt")],
+        comment.GetAttachmentPaths())
+    self.assertTrue(comment.GetDescription().endswith(
+        "\n<hr>\n"
+        " * *Attachment: photo.JPG<br>![photo.JPG](%s/%s/issue-1/comment-1/"
+        "photo.JPG)*\n"
+        " * *Attachment: [log.txt](https://example.com/log.txt)*" % (
+            issues.ATTACHMENT_URL, REPO)))
+
   def testGetCommentDescription_BlockingBlockedOn(self):
     blocking_data = {
         "content": "???",
@@ -299,6 +323,39 @@ class GoogleCodeIssueTest(unittest.TestCase):
     user_data_dict = issues.LoadUserData(None, None)
     self.assertEqual(user_data_dict["chrs...@goog.com"], "chrs...@goog.com")
 
+  def testWriteIssueMap(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      issue_map_path = os.path.join(temp_dir, "issue_map")
+      issues.WriteIssueMap(issue_map_path, {1: 7, 3: 12},
+                           "https://github.com/owner/repo/issues/")
+      with open(issue_map_path, "rb") as issue_map_file:
+        contents = issue_map_file.read()
+    finally:
+      shutil.rmtree(temp_dir)
+
+    header, table = contents.split("\n", 1)
+    self.assertEqual("gcissuemap1 https://github.com/owner/repo/issues/",
+                     header)
+    self.assertEqual((0, 7, 0, 12), struct.unpack("<4I", table))
+
+  def testSyncState(self):
+    sync_state = {
+        "synced_at": "2015-03-01T00:00:00Z",
+        "issues": {"1": {"updated": "2015-01-01T00:00:00.000Z",
+                         "comment_count": 2, "exported_id": 7}},
+    }
+    temp_dir = tempfile.mkdtemp()
+    try:
+      sync_state_path = os.path.join(temp_dir, "sync_state")
+      # There was no sync before.
+      self.assertEqual({}, issues.LoadSyncState(sync_state_path))
+      issues.WriteSyncState(sync_state_path, sync_state)
+      self.assertEqual(sync_state, issues.LoadSyncState(sync_state_path))
+      self.assertEqual(["sync_state"], os.listdir(temp_dir))
+    finally:
+      shutil.rmtree(temp_dir)
+
 
 if __name__ == "__main__":
   unittest.main(buffer=True)
@@ -0,0 +1,508 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Indexed local store of the issues in a Google Takeout file.
+
+Parsing a whole Takeout file takes a long time for big projects, and only
+allows going through the issues in order. Ingesting it once into a store
+allows loading the issues of a project without parsing any JSON, and looking
+up single issues, or comments by an author, right away.
+
+The store is an SQLite database with a table each for projects, issues,
+comments, labels and attachments. Issues and comments are kept as
+marshalled dictionaries, like they are in the Takeout file, along with
+indexed columns to look them up by.
+
+Usage:
+    python takeout_store.py --issue_file_path=GoogleCodeProjectHosting.json \\
+        --store_path=takeout.db
+
+The store can then be used as the issue file of the other tools.
+
+Takeout files can be read compressed with gzip, bzip2 or xz, or from inside a
+zip archive, without decompressing them to disk first, see OpenTakeoutFile.
+Reading xz files needs the lzma module, from Python 3 or backports.lzma.
+"""
+
+import argparse
+import bz2
+import json
+import marshal
+import os
+import Queue
+import sqlite3
+import sys
+import threading
+import zipfile
+import zlib
+
+try:
+  import lzma  # pylint: disable=import-error
+except ImportError:
+  try:
+    from backports import lzma  # pylint: disable=import-error
+  except ImportError:
+    lzma = None
+
+# The version of the store format, stored in the metadata table. Stores in
+# another format need to be ingested again.
+STORE_FORMAT_VERSION = "1"
+# The version of the marshal format used for issues and comments.
+_MARSHAL_VERSION = 2
+# The header at the start of every SQLite database file.
+_SQLITE_HEADER = "SQLite format 3\x00"
+
+# The headers at the start of compressed files.
+_GZIP_HEADER = "\x1f\x8b"
+_BZIP2_HEADER = "BZh"
+_XZ_HEADER = "\xfd7zXZ\x00"
+_ZIP_HEADER = "PK\x03\x04"
+# How much compressed data to read at a time.
+_DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+# How many decompressed chunks to keep ahead of the reader.
+_DECOMPRESS_QUEUE_SIZE = 16
+# Marks the end of the decompressed data in the queue.
+_END_OF_DATA = None
+
+_SCHEMA = """
+CREATE TABLE metadata (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL);
+
+CREATE TABLE projects (
+  name TEXT PRIMARY KEY,
+  position INTEGER NOT NULL);
+
+-- The data of each issue is the issue without its comment items.
+CREATE TABLE issues (
+  project TEXT NOT NULL,
+  id INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  author TEXT,
+  updated TEXT,
+  data BLOB NOT NULL,
+  PRIMARY KEY (project, id));
+CREATE INDEX issues_by_position ON issues (project, position);
+CREATE INDEX issues_by_author ON issues (author);
+CREATE INDEX issues_by_updated ON issues (project, updated);
+
+CREATE TABLE comments (
+  project TEXT NOT NULL,
+  issue_id INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  id INTEGER,
+  author TEXT,
+  published TEXT,
+  data BLOB NOT NULL,
+  PRIMARY KEY (project, issue_id, position));
+CREATE INDEX comments_by_author ON comments (author);
+
+CREATE TABLE labels (
+  project TEXT NOT NULL,
+  issue_id INTEGER NOT NULL,
+  label TEXT NOT NULL);
+CREATE INDEX labels_by_issue ON labels (project, issue_id);
+CREATE INDEX labels_by_label ON labels (project, label);
+
+CREATE TABLE attachments (
+  project TEXT NOT NULL,
+  issue_id INTEGER NOT NULL,
+  comment_id INTEGER,
+  file_name TEXT NOT NULL,
+  deleted INTEGER NOT NULL);
+CREATE INDEX attachments_by_issue ON attachments (project, issue_id);
+"""
+
+
+def _GetAuthorName(item):
+  """Returns the author name of an issue or comment, or None."""
+  return item.get("author", {}).get("name")
+
+
+def IsTakeoutStore(path):
+  """Returns whether a file is a Takeout store, rather than a Takeout file."""
+  with open(path, "rb") as store_file:
+    return store_file.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
+
+
+class _DecompressingReader(object):
+  """Reads a file that is decompressed on a background thread.
+
+  Decompressing a chunk releases the interpreter lock, so the file is
+  decompressed while the reader is busy with the data read so far. Only a
+  few chunks are decompressed ahead of the reader, so memory use does not
+  depend on the size of the file.
+  """
+
+  def __init__(self, compressed_file, decompressor_factory):
+    """Starts decompressing a file.
+
+    Args:
+      compressed_file: The open file to decompress, closed once it is read.
+      decompressor_factory: A function that returns a new decompressor for
+          each compressed stream in the file, or None to read the file as is.
+    """
+    self._queue = Queue.Queue(_DECOMPRESS_QUEUE_SIZE)
+    self._buffer = ""
+    self._finished = False
+    self._closed = False
+    thread = threading.Thread(target=self._Decompress,
+                              args=(compressed_file, decompressor_factory))
+    thread.daemon = True
+    thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    self.close()
+
+  def _Decompress(self, compressed_file, decompressor_factory):
+    """Decompresses a file into the queue, on the background thread."""
+    try:
+      decompressor = decompressor_factory and decompressor_factory()
+      while not self._closed:
+        chunk = compressed_file.read(_DECOMPRESS_CHUNK_SIZE)
+        if not chunk:
+          break
+        while chunk and not self._closed:
+          if decompressor is None:
+            data, chunk = chunk, ""
+          else:
+            data = decompressor.decompress(chunk)
+            # Data after the end of a stream starts another stream.
+            chunk = decompressor.unused_data
+            if chunk:
+              decompressor = decompressor_factory()
+          if data:
+            self._queue.put(data)
+      self._queue.put(_END_OF_DATA)
+    except Exception as e:  # pylint: disable=broad-except
+      self._queue.put(e)
+    finally:
+      compressed_file.close()
+
+  def read(self, size=-1):
+    """Implements the file interface."""
+    chunks = [self._buffer]
+    length = len(self._buffer)
+    while not self._finished and (size < 0 or length < size):
+      data = self._queue.get()
+      if data is _END_OF_DATA or isinstance(data, Exception):
+        self._finished = True
+        if data is not _END_OF_DATA:
+          raise IOError("Failed to decompress: %s" % data)
+        break
+      chunks.append(data)
+      length += len(data)
+
+    data = "".join(chunks)
+    if size < 0:
+      self._buffer = ""
+      return data
+    self._buffer = data[size:]
+    return data[:size]
+
+  def close(self):
+    """Implements the file interface, stopping the background thread."""
+    self._closed = True
+    # Make room for the background thread in case it waits on the queue.
+    try:
+      while True:
+        self._queue.get_nowait()
+    except Queue.Empty:
+      pass
+
+
+def _GetZipMember(zip_file):
+  """Returns the name of the Takeout file in a zip archive."""
+  names = [name for name in zip_file.namelist() if not name.endswith("/")]
+  json_names = [name for name in names if name.endswith(".json")]
+  if len(json_names) == 1:
+    return json_names[0]
+  if len(names) == 1:
+    return names[0]
+  raise IOError("Expected a single JSON file in the zip archive, found %s" %
+                ", ".join(json_names or names))
+
+
+def OpenTakeoutFile(issue_file_path):
+  """Opens a Takeout file for reading, decompressing it if needed.
+
+  Compressed files are recognized by their header, whatever their name.
+
+  Args:
+    issue_file_path: The path to the Takeout file, either plain JSON,
+        compressed with gzip, bzip2 or xz, or a zip archive containing it.
+
+  Returns:
+    A file-like object with the JSON of the Takeout file.
+
+  Raises:
+    IOError: The file is compressed with xz but lzma is not available, or a
+        zip archive does not contain a single JSON file.
+  """
+  issue_file = open(issue_file_path, "rb")
+  header = issue_file.read(max(len(_GZIP_HEADER), len(_BZIP2_HEADER),
+                               len(_XZ_HEADER), len(_ZIP_HEADER)))
+  issue_file.seek(0)
+
+  if header.startswith(_GZIP_HEADER):
+    # Adding 16 to the window bits makes zlib expect a gzip header.
+    return _DecompressingReader(
+        issue_file, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+  if header.startswith(_BZIP2_HEADER):
+    return _DecompressingReader(issue_file, bz2.BZ2Decompressor)
+  if header.startswith(_XZ_HEADER):
+    if lzma is None:
+      issue_file.close()
+      raise IOError("Reading %s needs the lzma module, install "
+                    "backports.lzma" % issue_file_path)
+    return _DecompressingReader(issue_file, lzma.LZMADecompressor)
+  if header.startswith(_ZIP_HEADER):
+    issue_file.close()
+    # The member of an archive opened by path reads from its own file, so
+    # the archive can be closed right away.
+    with zipfile.ZipFile(issue_file_path) as zip_file:
+      member_file = zip_file.open(_GetZipMember(zip_file))
+    # Zip archives are decompressed as they are read, so only the reading is
+    # moved to the background thread.
+    return _DecompressingReader(member_file, None)
+  return issue_file
+
+
+def IngestTakeout(issue_file_path, store_path):
+  """Creates a Takeout store from a Takeout file.
+
+  The store is written next to its final path and only moved there once it
+  is complete, replacing any earlier store.
+
+  Args:
+    issue_file_path: The path to the Takeout file.
+    store_path: The path to write the store to.
+  """
+  with OpenTakeoutFile(issue_file_path) as issue_file:
+    takeout_data = json.load(issue_file)
+
+  temp_store_path = store_path + ".tmp"
+  if os.path.exists(temp_store_path):
+    os.remove(temp_store_path)
+  connection = sqlite3.connect(temp_store_path)
+  try:
+    connection.executescript(_SCHEMA)
+    connection.execute("INSERT INTO metadata VALUES ('format', ?)",
+                       (STORE_FORMAT_VERSION,))
+    for project_position, project in enumerate(takeout_data["projects"]):
+      _IngestProject(connection, project, project_position)
+    connection.commit()
+  finally:
+    connection.close()
+  os.rename(temp_store_path, store_path)
+
+
+def _IngestProject(connection, project, project_position):
+  """Adds a project from a Takeout file to a store.
+
+  Args:
+    connection: The SQLite connection to the store.
+    project: The project from the Takeout file.
+    project_position: The position of the project in the Takeout file.
+  """
+  project_name = project["name"]
+  connection.execute("INSERT INTO projects VALUES (?, ?)",
+                     (project_name, project_position))
+
+  issue_rows = []
+  comment_rows = []
+  label_rows = []
+  attachment_rows = []
+  for issue_position, issue in enumerate(project["issues"]["items"]):
+    issue_id = issue["id"]
+    issue = dict(issue)
+    issue_comments = dict(issue.get("comments", {}))
+    comments = issue_comments.pop("items", [])
+    issue["comments"] = issue_comments
+    issue_rows.append((
+        project_name, issue_id, issue_position, _GetAuthorName(issue),
+        issue.get("updated"),
+        buffer(marshal.dumps(issue, _MARSHAL_VERSION))))
+
+    for label in issue.get("labels", []):
+      label_rows.append((project_name, issue_id, label))
+
+    for comment_position, comment in enumerate(comments):
+      comment_rows.append((
+          project_name, issue_id, comment_position, comment.get("id"),
+          _GetAuthorName(comment), comment.get("published"),
+          buffer(marshal.dumps(comment, _MARSHAL_VERSION))))
+      for attachment in comment.get("attachments", []):
+        attachment_rows.append((
+            project_name, issue_id, comment.get("id"), attachment["fileName"],
+            "isDeleted" in attachment))
+
+  connection.executemany("INSERT INTO issues VALUES (?, ?, ?, ?, ?, ?)",
+                         issue_rows)
+  connection.executemany("INSERT INTO comments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         comment_rows)
+  connection.executemany("INSERT INTO labels VALUES (?, ?, ?)", label_rows)
+  connection.executemany("INSERT INTO attachments VALUES (?, ?, ?, ?, ?)",
+                         attachment_rows)
+
+
+class TakeoutStore(object):
+  """Read access to a Takeout store, see IngestTakeout."""
+
+  def __init__(self, store_path):
+    """Opens a Takeout store.
+
+    Args:
+      store_path: The path to the store.
+
+    Raises:
+      IOError: The store is missing, or in another format.
+    """
+    if not os.path.exists(store_path):
+      raise IOError("Takeout store %s not found" % store_path)
+    self._connection = sqlite3.connect(store_path)
+    try:
+      row = self._connection.execute(
+          "SELECT value FROM metadata WHERE key = 'format'").fetchone()
+    except sqlite3.DatabaseError:
+      row = None
+    if row is None or row[0] != STORE_FORMAT_VERSION:
+      self._connection.close()
+      raise IOError("%s is not a Takeout store in the current format, ingest "
+                    "the Takeout file again" % store_path)
+
+  def Close(self):
+    """Closes the store."""
+    self._connection.close()
+
+  def GetProjectNames(self):
+    """Returns the names of the projects, in Takeout file order."""
+    return [name for name, in self._connection.execute(
+        "SELECT name FROM projects ORDER BY position")]
+
+  def GetIssues(self, project_name):
+    """Gets the issues of a project.
+
+    Args:
+      project_name: The name of the project.
+
+    Returns:
+      The list of issues, as in the Takeout file, or None if the project is
+      not in the store.
+    """
+    if not self._connection.execute(
+        "SELECT 1 FROM projects WHERE name = ?", (project_name,)).fetchone():
+      return None
+
+    comments = {}
+    for issue_id, data in self._connection.execute(
+        "SELECT issue_id, data FROM comments WHERE project = ? "
+        "ORDER BY issue_id, position", (project_name,)):
+      comments.setdefault(issue_id, []).append(marshal.loads(data))
+
+    issue_data = []
+    for issue_id, data in self._connection.execute(
+        "SELECT id, data FROM issues WHERE project = ? ORDER BY position",
+        (project_name,)):
+      issue = marshal.loads(data)
+      issue["comments"]["items"] = comments.get(issue_id, [])
+      issue_data.append(issue)
+    return issue_data
+
+  def GetIssue(self, project_name, issue_id):
+    """Gets an issue by ID.
+
+    Args:
+      project_name: The name of the project.
+      issue_id: The Google Code issue ID.
+
+    Returns:
+      The issue, as in the Takeout file, or None if it is not in the store.
+    """
+    row = self._connection.execute(
+        "SELECT data FROM issues WHERE project = ? AND id = ?",
+        (project_name, issue_id)).fetchone()
+    if row is None:
+      return None
+
+    issue = marshal.loads(row[0])
+    issue["comments"]["items"] = [
+        marshal.loads(data) for data, in self._connection.execute(
+            "SELECT data FROM comments WHERE project = ? AND issue_id = ? "
+            "ORDER BY position", (project_name, issue_id))]
+    return issue
+
+  def GetIssueIdsByLabel(self, project_name, label):
+    """Returns the IDs of the issues of a project with a label, in order."""
+    return [issue_id for issue_id, in self._connection.execute(
+        "SELECT issue_id FROM labels WHERE project = ? AND label = ? "
+        "ORDER BY issue_id", (project_name, label))]
+
+  def GetCommentsByAuthor(self, project_name, author):
+    """Gets the comments of an author.
+
+    Args:
+      project_name: The name of the project.
+      author: The Google Code username of the author.
+
+    Returns:
+      A list of tuples of an issue ID and a comment on the issue, in order.
+    """
+    return [(issue_id, marshal.loads(data))
+            for issue_id, data in self._connection.execute(
+                "SELECT issue_id, data FROM comments "
+                "WHERE project = ? AND author = ? "
+                "ORDER BY issue_id, position", (project_name, author))]
+
+  def GetAttachments(self, project_name, issue_id):
+    """Gets the attachments of an issue.
+
+    Args:
+      project_name: The name of the project.
+      issue_id: The Google Code issue ID.
+
+    Returns:
+      A list of tuples of the comment ID, file name and whether the
+      attachment was deleted, in order.
+    """
+    return [(comment_id, file_name, bool(deleted))
+            for comment_id, file_name, deleted in self._connection.execute(
+                "SELECT comment_id, file_name, deleted FROM attachments "
+                "WHERE project = ? AND issue_id = ? ORDER BY rowid",
+                (project_name, issue_id))]
+
+
+def main(args):
+  """The main function.
+
+  Args:
+    args: The command line arguments.
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--issue_file_path", required=True,
+                      help="The path to the file containing the issues from "
+                      "Google Code, which may be compressed.")
+  parser.add_argument("--store_path", required=True,
+                      help="Where to write the Takeout store.")
+  parsed_args, _ = parser.parse_known_args(args)
+
+  IngestTakeout(parsed_args.issue_file_path, parsed_args.store_path)
+  print "\nCreated Takeout store %s.\n" % parsed_args.store_path
+
+
+if __name__ == "__main__":
+  main(sys.argv)
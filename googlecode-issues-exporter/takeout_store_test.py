@@ -0,0 +1,251 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the Takeout store."""
+
+# pylint: disable=missing-docstring,protected-access
+
+import bz2
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+
+import issues
+import takeout_store
+
+from issues_test import COMMENT_ONE
+from issues_test import COMMENT_TWO
+from issues_test import COMMENT_THREE
+from issues_test import REPO
+
+ATTACHMENT_COMMENT = dict(COMMENT_THREE, attachments=[
+    {"fileName": "screenshot.png"},
+    {"fileName": "old.log", "isDeleted": True},
+])
+
+TAKEOUT_DATA = {
+    "projects": [
+        {
+            "name": "other",
+            "issues": {"items": [
+                {"id": 1, "title": "Other", "comments": {"items": []}},
+            ]},
+        },
+        {
+            "name": REPO,
+            "issues": {"items": [
+                {
+                    "id": 2,
+                    "title": "Second",
+                    "author": {"name": "user@email.com"},
+                    "updated": "2015-01-02T00:00:00.000Z",
+                    "labels": ["Type-Defect"],
+                    "comments": {"kind": "projecthosting#issueCommentList",
+                                 "items": [COMMENT_ONE, ATTACHMENT_COMMENT]},
+                },
+                {
+                    "id": 1,
+                    "title": u"First \u2603",
+                    "author": {"name": "user2@gmail.com"},
+                    "updated": "2015-01-01T00:00:00.000Z",
+                    "labels": ["Type-Defect", "Priority-High"],
+                    "comments": {"items": [COMMENT_ONE, COMMENT_TWO]},
+                },
+            ]},
+        },
+    ],
+}
+
+
+class TakeoutStoreTest(unittest.TestCase):
+  """Tests for the TakeoutStore."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.issue_file_path = os.path.join(self.temp_dir, "takeout.json")
+    with open(self.issue_file_path, "w") as issue_file:
+      json.dump(TAKEOUT_DATA, issue_file)
+    # The data as loaded from the Takeout file, with unicode strings.
+    with open(self.issue_file_path) as issue_file:
+      self.takeout_data = json.load(issue_file)
+
+    self.store_path = os.path.join(self.temp_dir, "takeout.db")
+    takeout_store.IngestTakeout(self.issue_file_path, self.store_path)
+    self.store = takeout_store.TakeoutStore(self.store_path)
+
+  def tearDown(self):
+    self.store.Close()
+    shutil.rmtree(self.temp_dir)
+
+  def testIngestTakeout(self):
+    self.assertEqual(["takeout.db", "takeout.json"],
+                     sorted(os.listdir(self.temp_dir)))
+    self.assertTrue(takeout_store.IsTakeoutStore(self.store_path))
+    self.assertFalse(takeout_store.IsTakeoutStore(self.issue_file_path))
+
+  def testGetProjectNames(self):
+    self.assertEqual(["other", REPO], self.store.GetProjectNames())
+
+  def testGetIssues(self):
+    self.assertEqual(self.takeout_data["projects"][1]["issues"]["items"],
+                     self.store.GetIssues(REPO))
+    self.assertIsNone(self.store.GetIssues("missing"))
+
+  def testGetIssue(self):
+    self.assertEqual(self.takeout_data["projects"][1]["issues"]["items"][1],
+                     self.store.GetIssue(REPO, 1))
+    self.assertEqual(self.takeout_data["projects"][0]["issues"]["items"][0],
+                     self.store.GetIssue("other", 1))
+    self.assertIsNone(self.store.GetIssue(REPO, 3))
+
+  def testGetIssueIdsByLabel(self):
+    self.assertEqual([1, 2], self.store.GetIssueIdsByLabel(REPO, "Type-Defect"))
+    self.assertEqual([1], self.store.GetIssueIdsByLabel(REPO, "Priority-High"))
+
+  def testGetCommentsByAuthor(self):
+    comments = self.store.GetCommentsByAuthor(REPO, "user@email.com")
+    self.assertEqual([(1, 1), (2, 1)],
+                     [(issue_id, comment["id"])
+                      for issue_id, comment in comments])
+
+  def testGetAttachments(self):
+    self.assertEqual([(3, "screenshot.png", False), (3, "old.log", True)],
+                     self.store.GetAttachments(REPO, 2))
+    self.assertEqual([], self.store.GetAttachments(REPO, 1))
+
+  def testWrongFormat(self):
+    connection = sqlite3.connect(self.store_path)
+    connection.execute("UPDATE metadata SET value = '0' WHERE key = 'format'")
+    connection.commit()
+    connection.close()
+    with self.assertRaises(IOError):
+      takeout_store.TakeoutStore(self.store_path)
+
+  def testLoadIssueData(self):
+    self.assertEqual(self.store.GetIssues(REPO),
+                     issues.LoadIssueData(self.store_path, REPO))
+    self.assertEqual(issues.LoadIssueData(self.issue_file_path, REPO),
+                     issues.LoadIssueData(self.store_path, REPO))
+    with self.assertRaises(issues.ProjectNotFoundError):
+      issues.LoadIssueData(self.store_path, "missing")
+
+  def testLoadIssueDataForProjects(self):
+    for path in (self.issue_file_path, self.store_path):
+      project_issue_data = issues.LoadIssueDataForProjects(
+          path, [REPO, "other"])
+      self.assertEqual(self.store.GetIssues(REPO), project_issue_data[REPO])
+      self.assertEqual(self.store.GetIssues("other"),
+                       project_issue_data["other"])
+      with self.assertRaises(issues.ProjectNotFoundError):
+        issues.LoadIssueDataForProjects(path, [REPO, "missing"])
+
+
+class OpenTakeoutFileTest(unittest.TestCase):
+  """Tests for reading compressed Takeout files."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.takeout_json = json.dumps(TAKEOUT_DATA)
+    self.path = os.path.join(self.temp_dir, "takeout")
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _Read(self):
+    with takeout_store.OpenTakeoutFile(self.path) as issue_file:
+      return issue_file.read()
+
+  def testPlain(self):
+    with open(self.path, "w") as issue_file:
+      issue_file.write(self.takeout_json)
+    self.assertEqual(self.takeout_json, self._Read())
+
+  def testGzip(self):
+    issue_file = gzip.open(self.path, "wb")
+    issue_file.write(self.takeout_json)
+    issue_file.close()
+    self.assertEqual(self.takeout_json, self._Read())
+    self.assertEqual(json.loads(self.takeout_json)["projects"][1]["issues"][
+        "items"], issues.LoadIssueData(self.path, REPO))
+
+  def testGzipMultipleStreams(self):
+    for part in (self.takeout_json[:100], self.takeout_json[100:]):
+      issue_file = gzip.open(self.path, "ab")
+      issue_file.write(part)
+      issue_file.close()
+    self.assertEqual(self.takeout_json, self._Read())
+
+  def testBzip2(self):
+    with open(self.path, "wb") as issue_file:
+      issue_file.write(bz2.compress(self.takeout_json))
+    self.assertEqual(self.takeout_json, self._Read())
+
+  @unittest.skipIf(takeout_store.lzma is None, "lzma is not available")
+  def testXz(self):
+    with open(self.path, "wb") as issue_file:
+      issue_file.write(takeout_store.lzma.compress(self.takeout_json))
+    self.assertEqual(self.takeout_json, self._Read())
+
+  def testZip(self):
+    with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+      zip_file.writestr("Takeout/README.txt", "Read me")
+      zip_file.writestr("Takeout/GoogleCodeProjectHosting.json",
+                        self.takeout_json)
+    self.assertEqual(self.takeout_json, self._Read())
+
+  def testZipWithoutSingleJsonFile(self):
+    with zipfile.ZipFile(self.path, "w") as zip_file:
+      zip_file.writestr("one.json", self.takeout_json)
+      zip_file.writestr("two.json", self.takeout_json)
+    with self.assertRaises(IOError):
+      self._Read()
+
+  def testReadChunks(self):
+    with open(self.path, "wb") as issue_file:
+      issue_file.write(bz2.compress(self.takeout_json))
+    chunks = []
+    with takeout_store.OpenTakeoutFile(self.path) as issue_file:
+      chunk = issue_file.read(10)
+      while chunk:
+        self.assertLessEqual(len(chunk), 10)
+        chunks.append(chunk)
+        chunk = issue_file.read(10)
+    self.assertEqual(self.takeout_json, "".join(chunks))
+
+  def testCorrupt(self):
+    with open(self.path, "wb") as issue_file:
+      issue_file.write("BZh9" + "corrupt" * 10)
+    with self.assertRaises(IOError):
+      self._Read()
+
+  def testIngestTakeout(self):
+    issue_file = gzip.open(self.path, "wb")
+    issue_file.write(self.takeout_json)
+    issue_file.close()
+    store_path = os.path.join(self.temp_dir, "takeout.db")
+    takeout_store.IngestTakeout(self.path, store_path)
+    store = takeout_store.TakeoutStore(store_path)
+    try:
+      self.assertEqual(["other", REPO], store.GetProjectNames())
+    finally:
+      store.Close()
+
+
+if __name__ == "__main__":
+  unittest.main(buffer=True)
@@ -15,21 +15,49 @@
 import re
 
 
+class _LazyRegex(object):
+  """A regular expression that is compiled the first time it is used.
+
+  wiki2gfm is often run once per page, and compiling every pattern up front
+  is a large part of its startup time, so patterns are compiled on demand.
+  """
+
+  def __init__(self, pattern, flags=0):
+    """Create a lazily compiled regular expression.
+
+    Args:
+        pattern: The regular expression pattern.
+        flags: The flags to compile the pattern with.
+    """
+    self._pattern = pattern
+    self._flags = flags
+    self._regex = None
+
+  def __getattr__(self, name):
+    # Only called for attributes not found on this object. Copy each one over
+    # from the compiled regex, so the next lookup finds it directly.
+    if self._regex is None:
+      self._regex = re.compile(self._pattern, self._flags)
+    value = getattr(self._regex, name)
+    setattr(self, name, value)
+    return value
+
+
 # These are the various different matching possibilities Google Code
 # recognizes. As matches are made, the respective handler class method is
 # is called, which can do what it wishes with the match.
 
 # The pragmas:
 PRAGMA_NAMES = ["summary", "labels", "sidebar"]
-PRAGMA_RE = re.compile(r"^#(" + "|".join(PRAGMA_NAMES) + r")(.*)$")
+PRAGMA_RE = _LazyRegex(r"^#(" + "|".join(PRAGMA_NAMES) + r")(.*)$")
 
 # Whitespace:
-WHITESPACE_RE = re.compile(r"\s+")
-INDENT_RE = re.compile(r"\A\s*")
+WHITESPACE_RE = _LazyRegex(r"\s+")
+INDENT_RE = _LazyRegex(r"\A\s*")
 
-# Code blocks:
-START_CODEBLOCK_RE = re.compile(r"^{{{$")
-END_CODEBLOCK_RE = re.compile(r"^}}}$")
+# Code blocks, which start and end on lines of their own:
+START_CODEBLOCK = "{{{"
+END_CODEBLOCK = "}}}"
 
 # Line rules. These rules consume an entire line:
 LINE_FORMAT_RULES = [
@@ -46,7 +74,7 @@ LINE_FORMAT_RULES = [
          $
         )""",
 ]
-LINE_FORMAT_RE = re.compile("(?x)" + "|".join(LINE_FORMAT_RULES), re.UNICODE)
+LINE_FORMAT_RE = _LazyRegex("(?x)" + "|".join(LINE_FORMAT_RULES), re.UNICODE)
 
 # General formatting rules:
 SIMPLE_FORMAT_RULE = r"""
@@ -92,10 +120,10 @@ PLUGIN_PARAM = r"""({0})\s*=\s*("[^"]*"|'[^']*'|\S+)""".format(PLUGIN_NAME)
 PLUGIN = r"<{0}(?:\s+{1})*\s*/?>".format(PLUGIN_ID, PLUGIN_PARAM)
 PLUGIN_END = r"</{0}>".format(PLUGIN_ID)
 
-PLUGIN_ID_RE = re.compile(PLUGIN_ID, re.UNICODE)
-PLUGIN_PARAM_RE = re.compile(PLUGIN_PARAM, re.UNICODE)
-PLUGIN_RE = re.compile(PLUGIN, re.UNICODE)
-PLUGIN_END_RE = re.compile(PLUGIN_END, re.UNICODE)
+PLUGIN_ID_RE = _LazyRegex(PLUGIN_ID, re.UNICODE)
+PLUGIN_PARAM_RE = _LazyRegex(PLUGIN_PARAM, re.UNICODE)
+PLUGIN_RE = _LazyRegex(PLUGIN, re.UNICODE)
+PLUGIN_END_RE = _LazyRegex(PLUGIN_END, re.UNICODE)
 
 TEXT_FORMAT_RULES = [
     SIMPLE_FORMAT_RULE.format("Bold", r"\*"),
@@ -173,10 +201,29 @@ TEXT_FORMAT_RULES = [
     r"""# Matches a variable being used, defined in a plugin or globally.
         %%(?P<Variable>[\w|_|\-]+)%%"""
 ]
-TEXT_FORMAT_RE = re.compile("(?x)" + "|".join(TEXT_FORMAT_RULES), re.UNICODE)
+TEXT_FORMAT_RE = _LazyRegex("(?x)" + "|".join(TEXT_FORMAT_RULES), re.UNICODE)
+
+# The names of the rules in LINE_FORMAT_RE and TEXT_FORMAT_RE, found without
+# having to compile either of them.
+FORMAT_RULE_NAMES = re.findall(
+    r"\(\?P<(\w+)>", "".join(LINE_FORMAT_RULES + TEXT_FORMAT_RULES))
+
+# Every match of TEXT_FORMAT_RE contains one of these. Text without any of
+# them is plain text, and doesn't need to be run through TEXT_FORMAT_RE.
+TEXT_FORMAT_TRIGGER_RE = _LazyRegex(
+    r"""[*_^`\[<]      # Bold, italic, super, code, brackets and plugins
+        |~~|,,|\{\{\{  # Strikethrough, subscript and inline code
+        |\|\|          # Table cells and row ends
+        |://|mailto:    # URLs
+        |%%             # Variables
+        |[a-z0-9][A-Z]  # WikiWords
+        |(?:[Ii][Ss][Ss][Uu][Ee]|[Bb][Uu][Gg]|
+            [Rr](?:[Ee][Vv][Ii][Ss][Ii][Oo][Nn])?)\s*\#?\d
+                        # Issue and revision links
+    """, re.VERBOSE | re.UNICODE)
 
 # For verification of YouTube video IDs.
-YOUTUBE_VIDEO_ID_RE = re.compile("^[a-zA-Z0-9_-]+$")
+YOUTUBE_VIDEO_ID_RE = _LazyRegex("^[a-zA-Z0-9_-]+$")
 
 # List types:
 LIST_TYPES = {
@@ -12,9 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Handles conversion of Wiki files."""
-import urlparse
-
 from . import constants
+from . import source_index
 
 
 class Converter(object):
@@ -86,22 +85,42 @@ class Converter(object):
       formatting_handler,
       warning_method,
       project,
-      wikipages):
+      wikipages,
+      link_handler=None):
     """Create a converter.
 
     Args:
         pragma_handler: Handler for parsed pragmas.
         formatting_handler: Handler for parsed formatting rules.
-        warning_method: A function to call to display a warning message.
+        warning_method: A function to call to display a warning message,
+            given the line number, the message, a warning code and the
+            SourceSpan of the input.
         project: The name of the Google Code project for the Wiki page.
         wikipages: Wiki pages assumed to exist for auto-linking.
+        link_handler: Handler for every link to a wiki page and every
+            heading, e.g. a link_index.PageLinks, or None.
     """
     self._pragma_handler = pragma_handler
     self._formatting_handler = formatting_handler
+    self._link_handler = link_handler
     self._warning_method = warning_method
     self._wikipages = wikipages
     self._project = project
 
+    # The index of the page being converted, and the offsets of the text
+    # being processed, which warnings and tokens are attributed to.
+    self._source_index = None
+    self._source_offsets = None
+    pragma_handler.SetSourceSpanMethod(self.GetSourceSpan)
+    formatting_handler.SetSourceSpanMethod(self.GetSourceSpan)
+
+    # Resolve the handler for every formatting rule once, so each match can
+    # be dispatched directly on the name of the rule that matched.
+    self._rule_handlers = {}
+    for rulename in constants.FORMAT_RULE_NAMES:
+      self._rule_handlers[rulename] = getattr(
+          self, u"_Handle{0}".format(rulename))
+
   def Convert(self, input_stream, output_stream):
     """Converts a file in Google Code Wiki format to Github-flavored Markdown.
 
@@ -113,6 +132,12 @@ class Converter(object):
     input_lines = input_stream.readlines()
     input_line = 1
 
+    # Index where each line starts, so offsets map back to lines and columns.
+    # The whole text is kept too, to find the end of code blocks quickly.
+    self._source_index = source_index.SourceIndex(input_lines)
+    self._source_offsets = (0, 0)
+    self._source_text = "".join(input_lines)
+
     # First extract pragmas, which must be placed at the top of the file.
     input_line = self._ExtractPragmas(input_line, input_lines, output_stream)
 
@@ -122,13 +147,54 @@ class Converter(object):
     # At the main text, begin processing.
     input_line = self._ProcessBody(input_line, input_lines, output_stream)
 
+    # Write out anything the formatting handler is still holding on to.
+    self._formatting_handler.Flush(output_stream)
+
     # Done, but sanity check the amount of input processed.
     remaining_lines = len(input_lines) - input_line + 1
     if remaining_lines != 0:
-      self._warning_method(
+      self._Warn(
           input_line,
           u"Processing completed, but not all lines were processed. "
-          "Remaining lines: {0}.".format(remaining_lines))
+          "Remaining lines: {0}.".format(remaining_lines),
+          code="unprocessed-lines")
+
+  def GetSourceIndex(self):
+    """Get the index of the page being converted.
+
+    Returns:
+        The SourceIndex, or None before conversion.
+    """
+    return self._source_index
+
+  def GetSourceOffsets(self):
+    """Get the offsets of the text currently being processed.
+
+    Returns:
+        A 2-tuple of the start and end offsets, or None before conversion.
+    """
+    return self._source_offsets
+
+  def GetSourceSpan(self):
+    """Get the span of the text currently being processed.
+
+    Returns:
+        The SourceSpan, or None before conversion.
+    """
+    if self._source_offsets is None:
+      return None
+    return self._source_index.GetSpan(*self._source_offsets)
+
+  def _Warn(self, input_line, message, code):
+    """Display a warning about the text currently being processed.
+
+    Args:
+        input_line: Current line number being processed.
+        message: The warning message.
+        code: The warning code.
+    """
+    self._warning_method(
+        input_line, message, code=code, span=self.GetSourceSpan())
 
   def _ExtractPragmas(self, input_line, input_lines, output_stream):
     """Extracts pragmas from a given input.
@@ -140,12 +206,16 @@ class Converter(object):
     Returns:
         The new value of input_line after processing.
     """
+    offset = self._source_index.GetLineStart(input_line)
     for line in input_lines[input_line - 1:]:
       pragma_match = constants.PRAGMA_RE.match(line)
       if not pragma_match:
         # Found all the pragmas.
         break
 
+      self._source_offsets = (offset, offset + len(line))
+      offset += len(line)
+
       # Found a pragma, strip it and pass it to the handler.
       pragma_type, pragma_value = pragma_match.groups()
 
@@ -194,18 +264,32 @@ class Converter(object):
         The new value of input_line after processing.
     """
     # State tracked during processing:
-    self._code_block_depth = 0  # How many code block openings we've seen.
-    self._code_block_lines = []  # What lines we've collected for a code block.
     self._indents = []  # 2-tuple of indent position and list type.
     self._open_tags = []  # List of open tags, like bold or italic.
-    self._table_columns = []  # Table column sizes, taken from the header row.
+    self._in_table = False  # If a table cell has been seen in this paragraph.
     self._table_column = 0  # Current column in the table body, or zero if none.
     self._plugin_stack = []  # Current stack of plugins and their parameters.
 
     first_line = True
-    for line in input_lines[input_line - 1:]:
+    line_count = len(input_lines)
+    offset = self._source_index.GetLineStart(input_line)
+    while input_line <= line_count:
+      line = input_lines[input_line - 1]
       stripped_line = line.strip()
 
+      if stripped_line == constants.START_CODEBLOCK:
+        # Code blocks are handled whole, skipping past their lines.
+        input_line = self._ProcessCodeBlock(
+            input_line,
+            input_lines,
+            output_stream)
+        offset = self._source_index.GetLineStart(input_line)
+        first_line = False
+        continue
+
+      self._source_offsets = (offset, offset + len(line))
+      offset += len(line)
+
       self._ProcessLine(
           first_line,
           input_line,
@@ -217,14 +301,78 @@ class Converter(object):
       input_line += 1
       first_line = False
 
-    if self._code_block_depth:
-      # Forgotten code block ending, close it implicitly.
-      code = "".join(self._code_block_lines)
-      self._formatting_handler.HandleText(input_line, output_stream, code)
-      self._formatting_handler.HandleCodeBlockClose(input_line, output_stream)
-
     return input_line
 
+  def _ProcessCodeBlock(self, input_line, input_lines, output_stream):
+    """Processes a code block, from the line that starts it.
+
+    Code blocks nest, and the block ends on the line that closes the last
+    block still open. Only lines with three braces can start or end a block,
+    so the page text is searched for braces rather than checking every line.
+    A block that never ends runs to the end of the page.
+
+    Args:
+        input_line: The line number that starts the code block.
+        input_lines: Input Wiki file lines.
+        output_stream: Output Markdown file.
+    Returns:
+        The line number after the code block.
+    """
+    source_index = self._source_index
+    text = self._source_text
+    code_start = source_index.GetLineStart(input_line + 1)
+    end_line = len(input_lines) + 1
+    depth = 1
+
+    # The next braces that could start or end a block. Only ends can close
+    # the block, so it is never closed once there are none left.
+    next_start = text.find(constants.START_CODEBLOCK, code_start)
+    next_end = text.find(constants.END_CODEBLOCK, code_start)
+    while next_end != -1:
+      if next_start != -1 and next_start < next_end:
+        line, _ = source_index.GetLineColumn(next_start)
+      else:
+        line, _ = source_index.GetLineColumn(next_end)
+
+      stripped_line = input_lines[line - 1].strip()
+      if stripped_line == constants.START_CODEBLOCK:
+        depth += 1
+      elif stripped_line == constants.END_CODEBLOCK:
+        depth -= 1
+        if not depth:
+          end_line = line
+          break
+
+      # A line only starts or ends one block, so skip the rest of it.
+      position = source_index.GetLineStart(line + 1)
+      if next_start != -1 and next_start < position:
+        next_start = text.find(constants.START_CODEBLOCK, position)
+      if next_end < position:
+        next_end = text.find(constants.END_CODEBLOCK, position)
+
+    # Everything between the lines starting and ending the block is code.
+    code_end = source_index.GetLineStart(end_line)
+    self._source_offsets = (
+        source_index.GetLineStart(input_line),
+        source_index.GetLineStart(end_line + 1))
+
+    last_line = min(end_line, len(input_lines))
+    self._formatting_handler.HandleEscapedText(
+        last_line,
+        output_stream,
+        "\n")
+    self._formatting_handler.HandleCodeBlockOpen(
+        last_line,
+        output_stream,
+        None)
+    self._formatting_handler.HandleText(
+        last_line,
+        output_stream,
+        self._source_text[code_start:code_end])
+    self._formatting_handler.HandleCodeBlockClose(last_line, output_stream)
+
+    return last_line + 1
+
   def _ProcessLine(
       self,
       first_line,
@@ -243,43 +391,7 @@ class Converter(object):
     Returns:
         The new value of input_line after processing.
     """
-    # Check for the start of a code block.
-    if constants.START_CODEBLOCK_RE.match(stripped_line):
-      if self._code_block_depth == 0:
-        # Start a new collection of lines.
-        self._code_block_lines = []
-      else:
-        # Just an embedded code block.
-        self._code_block_lines.append(line)
-      self._code_block_depth += 1
-      return
-
-    # Check for the end of a code block.
-    if constants.END_CODEBLOCK_RE.match(stripped_line):
-      self._code_block_depth -= 1
-      if self._code_block_depth == 0:
-        # Closed the highest-level code block, handle it.
-        self._formatting_handler.HandleEscapedText(
-            input_line,
-            output_stream,
-            "\n")
-        self._formatting_handler.HandleCodeBlockOpen(
-            input_line,
-            output_stream,
-            None)
-        code = "".join(self._code_block_lines)
-        self._formatting_handler.HandleText(input_line, output_stream, code)
-        self._formatting_handler.HandleCodeBlockClose(input_line, output_stream)
-      else:
-        # Just closed an embedded clode block.
-        self._code_block_lines.append(line)
-      return
-
-    # Check if we're in a code block.
-    # If we are, just put the raw text into code_block_lines.
-    if self._code_block_depth != 0:
-      self._code_block_lines.append(line)
-      return
+    raw_length = len(line)
 
     # For empty lines, close all formatting.
     if not stripped_line:
@@ -287,9 +399,9 @@ class Converter(object):
         self._SetCurrentList(input_line, 0, " ", output_stream)
         self._CloseTags(input_line, output_stream)
 
-        if self._table_columns:
+        if self._in_table:
           self._formatting_handler.HandleTableClose(input_line, output_stream)
-        self._table_columns = []
+        self._in_table = False
         self._table_column = 0
 
       self._formatting_handler.HandleParagraphBreak(input_line, output_stream)
@@ -317,11 +429,12 @@ class Converter(object):
           line = line[indent_pos:]
         else:
           if line[indent_pos + 1] != " ":
-            self._warning_method(
+            self._Warn(
                 input_line,
                 u"Missing space after list symbol: {0}, "
                 "'{1}' was removed instead."
-                .format(line[indent_pos], line[indent_pos + 1]))
+                .format(line[indent_pos], line[indent_pos + 1]),
+                code="list-symbol-space")
           line = line[indent_pos + 2:]
 
         stripped_line = line.strip()
@@ -331,18 +444,28 @@ class Converter(object):
 
     # Finally, split the line into formatting primitives.
     # We do so without whitespace so we can catch line breaks across tags.
-    if constants.LINE_FORMAT_RE.match(stripped_line):
+    # The line may have lost its list symbol, but only from its start.
+    offset = self._source_offsets[0] + raw_length - len(line.lstrip())
+    self._source_offsets = (offset, offset + len(stripped_line))
+    # Line rules only match lines starting with one of their delimiters,
+    # and most lines of prose can't match any text rule at all.
+    if (stripped_line.startswith(("-", "=")) and
+        constants.LINE_FORMAT_RE.match(stripped_line)):
       self._ProcessMatch(
           input_line,
           constants.LINE_FORMAT_RE,
           stripped_line,
+          offset,
           output_stream)
-    else:
+    elif constants.TEXT_FORMAT_TRIGGER_RE.search(stripped_line):
       self._ProcessMatch(
           input_line,
           constants.TEXT_FORMAT_RE,
           stripped_line,
+          offset,
           output_stream)
+    elif stripped_line:
+      self._ProcessPlainText(input_line, stripped_line, output_stream)
 
     self._CloseTableRow(input_line, output_stream)
 
@@ -395,9 +518,10 @@ class Converter(object):
             output_stream,
             indentation_level)
       else:
-        self._warning_method(
+        self._Warn(
             input_line,
-            u"Bad list type: '{0}'".format(list_type))
+            u"Bad list type: '{0}'".format(list_type),
+            code="bad-list-type")
 
     return True
 
@@ -414,7 +538,10 @@ class Converter(object):
     if handler:
       handler(input_line, output_stream)
     else:
-      self._warning_method(input_line, u"Bad open tag: '{0}'".format(tag))
+      self._Warn(
+          input_line,
+          u"Bad open tag: '{0}'".format(tag),
+          code="bad-tag")
 
     self._open_tags.append(tag)
 
@@ -431,7 +558,10 @@ class Converter(object):
     if handler:
       handler(input_line, output_stream)
     else:
-      self._warning_method(input_line, u"Bad close tag: '{0}'".format(tag))
+      self._Warn(
+          input_line,
+          u"Bad close tag: '{0}'".format(tag),
+          code="bad-tag")
 
     self._open_tags.remove(tag)
 
@@ -452,16 +582,13 @@ class Converter(object):
       input_line: Current line number being processed.
       output_stream: Output Markdown file.
     """
-    if self._table_columns:
+    if self._in_table:
       if self._table_column != 1:
         self._formatting_handler.HandleTableRowEnd(input_line, output_stream)
 
       # Check if we just finished the header row.
       if not self._table_column:
-        self._formatting_handler.HandleTableHeader(
-            input_line,
-            output_stream,
-            self._table_columns)
+        self._formatting_handler.HandleTableHeader(input_line, output_stream)
 
       # In a table body, set the current column to 1.
       self._table_column = 1
@@ -475,57 +602,83 @@ class Converter(object):
     return (self._plugin_stack and
             self._plugin_stack[-1]["id"] in self._RAW_PLUGINS)
 
-  def _ProcessMatch(self, input_line, match_regex, line, output_stream):
+  def _ProcessMatch(
+      self,
+      input_line,
+      match_regex,
+      line,
+      offset,
+      output_stream):
     """Process text, using a regex to match against.
 
     Args:
       input_line: Current line number being processed.
       match_regex: Regex to match the line against.
       line: The line being processed.
+      offset: The offset of the line in the page.
       output_stream: Output Markdown file.
     """
+    outer_offsets = self._source_offsets
     lastpos = 0
     for fullmatch in match_regex.finditer(line):
-      # Add text before the match as regular text.
-      if lastpos < fullmatch.start():
-        starting_line = line[lastpos:fullmatch.start()]
-        if self._ConsumeTextForPlugin():
-          self._formatting_handler.HandleText(
-              input_line,
-              output_stream,
-              starting_line)
-        else:
-          self._formatting_handler.HandleEscapedText(
-              input_line,
-              output_stream,
-              starting_line)
+      # Raw text consumption only changes when a handler runs.
+      consume_text = self._ConsumeTextForPlugin()
+      start = fullmatch.start()
 
-      for rulename, match in fullmatch.groupdict().items():
-        if match is not None:
-          if self._ConsumeTextForPlugin() and rulename != "PluginEnd":
-            self._formatting_handler.HandleText(
-                input_line,
-                output_stream,
-                match)
-          else:
-            handler = getattr(self, u"_Handle{0}".format(rulename), None)
-            handler(input_line, match, output_stream)
+      # Add text before the match as regular text.
+      if lastpos < start:
+        self._source_offsets = (offset + lastpos, offset + start)
+        self._ProcessPlainText(
+            input_line,
+            line[lastpos:start],
+            output_stream,
+            consume_text)
 
+      # Each rule is its own alternative, so exactly one rule matched.
+      rulename = fullmatch.lastgroup
+      match = fullmatch.group(rulename)
       lastpos = fullmatch.end()
-
-    # Add remainder of the line as regular text.
-    if lastpos < len(line):
-      remaining_line = line[lastpos:]
-      if self._ConsumeTextForPlugin():
+      self._source_offsets = (offset + start, offset + lastpos)
+      if consume_text and rulename != "PluginEnd":
         self._formatting_handler.HandleText(
             input_line,
             output_stream,
-            remaining_line)
+            match)
       else:
-        self._formatting_handler.HandleEscapedText(
-            input_line,
-            output_stream,
-            remaining_line)
+        self._rule_handlers[rulename](input_line, match, output_stream)
+
+    # Add remainder of the line as regular text.
+    if lastpos < len(line):
+      self._source_offsets = (offset + lastpos, offset + len(line))
+      self._ProcessPlainText(input_line, line[lastpos:], output_stream)
+
+    # Nested text was processed in the middle of the enclosing match.
+    self._source_offsets = outer_offsets
+
+  def _ProcessPlainText(
+      self,
+      input_line,
+      text,
+      output_stream,
+      consume_text=None):
+    """Process text that has no formatting.
+
+    Args:
+      input_line: Current line number being processed.
+      text: The text being processed.
+      output_stream: Output Markdown file.
+      consume_text: If the text is consumed raw for a plugin, or None to check.
+    """
+    if consume_text is None:
+      consume_text = self._ConsumeTextForPlugin()
+
+    if consume_text:
+      self._formatting_handler.HandleText(input_line, output_stream, text)
+    else:
+      self._formatting_handler.HandleEscapedText(
+          input_line,
+          output_stream,
+          text)
 
   def _HandleHeading(self, input_line, match, output_stream):
     """Handle a heading formatter.
@@ -535,6 +688,7 @@ class Converter(object):
       match: Matched text.
       output_stream: Output Markdown file.
     """
+    match_offset = self._source_offsets[0] + len(match) - len(match.lstrip())
     match = match.strip()
 
     # Count the equals on the left side.
@@ -564,6 +718,9 @@ class Converter(object):
     # Everything else is the heading text.
     heading_text = match[leftequalcount:-rightequalcount].strip()
 
+    if header_level and self._link_handler:
+      self._link_handler.HandleHeading(heading_text)
+
     if header_level:
       self._formatting_handler.HandleHeaderOpen(
           input_line,
@@ -574,6 +731,7 @@ class Converter(object):
         input_line,
         constants.TEXT_FORMAT_RE,
         heading_text,
+        match_offset + match.find(heading_text),
         output_stream)
 
     if header_level:
@@ -682,56 +840,47 @@ class Converter(object):
 
     span = pipecount / 2
 
-    # Now output the cell, tracking the size of the contents.
+    # Now output the cell, which is padded to the size of the header cell.
+    self._in_table = True
     self._formatting_handler.HandleTableCellBorder(input_line, output_stream)
-
-    starting_pos = output_stream.tell()
+    self._formatting_handler.HandleTableCellStart(input_line, output_stream)
     self._ProcessMatch(
         input_line,
         constants.TEXT_FORMAT_RE,
         match[pipecount:],
+        self._source_offsets[0] + pipecount,
         output_stream)
-    ending_pos = output_stream.tell()
-
-    # Handle the cell width, either tracking or padding.
-    cell_width = ending_pos - starting_pos
-    if not self._table_column:
-      # In the header row, track the column sizes.
-      self._table_columns.append(cell_width)
-    else:
-      # In the table body, pad the cell (for prettier raw text viewing).
-      colIdx = self._table_column - 1
-      if colIdx >= len(self._table_columns):
-        colIdx = len(self._table_columns) - 1
-
-      header_cell_width = self._table_columns[colIdx]
-      remaining_width = header_cell_width - cell_width
-      if remaining_width > 0:
-        padding = " " * remaining_width
-        self._formatting_handler.HandleEscapedText(
-            input_line,
-            output_stream,
-            padding)
-
+    self._formatting_handler.HandleTableCellEnd(
+        input_line,
+        output_stream,
+        self._table_column)
+    if self._table_column:
       self._table_column += 1
 
     if span > 1:
-      self._warning_method(
+      self._Warn(
           input_line,
           "Multi-span cells are not directly supported in GFM. They have been "
           "emulated by adding empty cells. This may give the correct rendered "
           "result, but the plain-text representation may be noisy. Consider "
-          "removing the multi-span cells from your table, or using HTML.")
+          "removing the multi-span cells from your table, or using HTML.",
+          code="multi-span-cell")
       while span > 1:
         # Empty cell.
         self._formatting_handler.HandleTableCellBorder(
             input_line,
             output_stream)
+        self._formatting_handler.HandleTableCellStart(
+            input_line,
+            output_stream)
         self._formatting_handler.HandleEscapedText(
             input_line,
             output_stream,
             " ")
-        self._table_columns.append(1)
+        self._formatting_handler.HandleTableCellEnd(
+            input_line,
+            output_stream,
+            0)
 
         span -= 1
 
@@ -797,7 +946,15 @@ class Converter(object):
           input_line,
           output_stream,
           match[1:])
-    elif match not in self._wikipages:
+      return
+
+    # Recorded whether or not the page exists, so that links to missing
+    # pages can be reported.
+    if self._link_handler:
+      self._link_handler.HandleWikiLink(
+          input_line, match, self.GetSourceSpan())
+
+    if match not in self._wikipages:
       self._formatting_handler.HandleEscapedText(
           input_line,
           output_stream,
@@ -829,6 +986,10 @@ class Converter(object):
       wiki = parts[0]
       description = parts[1]
 
+    if self._link_handler:
+      self._link_handler.HandleWikiLink(
+          input_line, wiki, self.GetSourceSpan())
+
     self._formatting_handler.HandleWiki(
         input_line,
         output_stream,
@@ -843,8 +1004,8 @@ class Converter(object):
       match: Matched text.
       output_stream: Output Markdown file.
     """
-    issue = match[len("issue"):].strip()
-    prefix = match[:-len(issue)]
+    prefix = match.rstrip("0123456789")
+    issue = match[len(prefix):]
 
     self._formatting_handler.HandleIssue(
         input_line,
@@ -936,10 +1097,11 @@ class Converter(object):
     elif plugin_id == "wiki:toc":
       self._HandlePluginWikiToc(input_line, match, output_stream)
     else:
-      self._warning_method(
+      self._Warn(
           input_line,
           u"Unknown plugin was given, outputting "
-          "as plain text:\n\t{0}".format(match))
+          "as plain text:\n\t{0}".format(match),
+          code="unknown-plugin")
       # Wiki syntax put this class of error on its own line.
       self._formatting_handler.HandleEscapedText(
           input_line,
@@ -975,11 +1137,12 @@ class Converter(object):
       if name in allowed_parameters:
         filtered_params[name] = value
       else:
-        self._warning_method(
+        self._Warn(
             input_line,
             u"The following parameter was given for the '{0}' tag, "
             "but will not be present in the outputted HTML:\n\t'{1}': '{2}'"
-            .format(plugin_id, name, value))
+            .format(plugin_id, name, value),
+            code="plugin-param")
 
     if plugin_id == "code":
       self._formatting_handler.HandleCodeBlockOpen(
@@ -1013,11 +1176,12 @@ class Converter(object):
       if name in self._PLUSONE_ARGS:
         filtered_params[name] = value
       else:
-        self._warning_method(
+        self._Warn(
             input_line,
             u"The following parameter was given for the '{0}' tag, "
             "but will not be present in the outputted HTML:\n\t'{1}': '{2}'"
-            .format(plugin_id, name, value))
+            .format(plugin_id, name, value),
+            code="plugin-param")
 
     self._formatting_handler.HandleGPlusOpen(
         input_line,
@@ -1039,11 +1203,12 @@ class Converter(object):
       output_stream: Output Markdown file.
     """
     for name, value in params.items():
-      self._warning_method(
+      self._Warn(
           input_line,
           u"The following parameter was given for the '{0}' tag, "
           "but will not be present in the outputted HTML:\n\t'{1}': '{2}'"
-          .format(plugin_id, name, value))
+          .format(plugin_id, name, value),
+          code="plugin-param")
 
     self._formatting_handler.HandleCommentOpen(input_line, output_stream)
 
@@ -1055,11 +1220,12 @@ class Converter(object):
       match: Matched text.
       output_stream: Output Markdown file.
     """
-    self._warning_method(
+    self._Warn(
         input_line,
         u"A wiki gadget was used, but this must be manually converted to a "
         "GFM-supported method, if possible. Outputting as plain text:\n\t{0}"
-        .format(match))
+        .format(match),
+        code="wiki-gadget")
     self._formatting_handler.HandleEscapedText(
         input_line,
         output_stream,
@@ -1084,15 +1250,18 @@ class Converter(object):
       if name in self._VIDEO_ARGS:
         filtered_params[name] = value
       else:
-        self._warning_method(
+        self._Warn(
             input_line,
             u"The following parameter was given for the '{0}' tag, "
             "but will not be present in the outputted HTML:\n\t'{1}': '{2}'"
-            .format(plugin_id, name, value))
+            .format(plugin_id, name, value),
+            code="plugin-param")
 
     if "url" in filtered_params:
       width = filtered_params.get("width", self._VIDEO_DEFAULT_WIDTH)
       height = filtered_params.get("height", self._VIDEO_DEFAULT_HEIGHT)
+      # Only needed for videos, so not imported up front.
+      import urlparse
       extracted = urlparse.urlparse(filtered_params["url"])
       query = urlparse.parse_qs(extracted.query)
       video_id = query.get("v", [""])[0]
@@ -1101,10 +1270,11 @@ class Converter(object):
       if not constants.YOUTUBE_VIDEO_ID_RE.match(video_id):
         output = ("wiki:video: cannot find YouTube "
                   "video id within parameter \"url\".")
-        self._warning_method(
+        self._Warn(
             input_line,
             u"Video plugin has invalid video ID, outputting error:\n\t{0}"
-            .format(output))
+            .format(output),
+            code="video-id")
         # Wiki syntax put this class of error on its own line.
         self._formatting_handler.HandleEscapedText(
             input_line,
@@ -1119,10 +1289,11 @@ class Converter(object):
             height)
     else:
       output = "wiki:video: missing mandatory parameter \"url\"."
-      self._warning_method(
+      self._Warn(
           input_line,
           u"Video plugin is missing 'url' parameter, outputting error:\n\t{0}"
-          .format(output))
+          .format(output),
+          code="video-url")
       # Wiki syntax put this class of error on its own line.
       self._formatting_handler.HandleEscapedText(
           input_line,
@@ -1137,14 +1308,15 @@ class Converter(object):
       match: Matched text.
       output_stream: Output Markdown file.
     """
-    self._warning_method(
+    self._Warn(
         input_line,
         u"A table of contents plugin was used for this wiki:\n"
         "\t{0}\n"
         "The Gollum wiki system supports table of content generation.\n"
         "See https://github.com/gollum/gollum/wiki for more information.\n"
         "It has been removed."
-        .format(match))
+        .format(match),
+        code="wiki-toc")
 
   def _HandlePluginEnd(self, input_line, match, output_stream):
     """Handle a plugin ending tag.
@@ -1186,20 +1358,22 @@ class Converter(object):
         # A warning was already issued on the opening tag.
         pass
       else:
-        self._warning_method(
+        self._Warn(
             input_line,
             u"Unknown but matching plugin end was given, outputting "
-            "as plain text:\n\t{0}".format(match))
+            "as plain text:\n\t{0}".format(match),
+            code="unknown-plugin-end")
         # Wiki syntax put this class of error on its own line.
         self._formatting_handler.HandleEscapedText(
             input_line,
             output_stream,
             u"\n\n{0}\n\n".format(match))
     else:
-      self._warning_method(
+      self._Warn(
           input_line,
           u"Unknown/unmatched plugin end was given, outputting "
-          "as plain text with errors:\n\t{0}".format(match))
+          "as plain text with errors:\n\t{0}".format(match),
+          code="unknown-plugin-end")
       # Wiki syntax put this class of error on its own line,
       # with a prefix error message, and did not display the tag namespace.
       tag_without_ns = plugin_id.split(":", 1)[-1]
@@ -1265,10 +1439,11 @@ class Converter(object):
         output_stream,
         output)
     if instructions:
-      self._warning_method(
+      self._Warn(
           input_line,
           u"A variable substitution was performed with %%{0}%%. {1}"
-          .format(match, instructions))
+          .format(match, instructions),
+          code="variable")
 
   def _HandleTag(self, input_line, tag, output_stream):
     """Handle a tag, which has an opening and closing.
@@ -12,11 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Handles converting of formatting."""
-import cgi
-
 from . import constants
 
 
+def _EscapeHtml(text):
+  """Escape the characters of text that are special in HTML.
+
+  This is cgi.escape, without the cost of importing cgi.
+
+  Args:
+      text: The text to escape.
+  Returns:
+      The escaped text.
+  """
+  return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
 class FormattingHandler(object):
   """Class that handles the conversion of formatting."""
 
@@ -69,13 +80,19 @@ class FormattingHandler(object):
   # How a single indentation is outputted.
   _SINGLE_INDENTATION = " " * 2
 
+  # How many output fragments are buffered before they are written out.
+  _MAX_OUTPUT_CHUNKS = 4096
+
   def __init__(self, warning_method, project, issue_map, symmetric_headers):
     """Create a formatting handler.
 
     Args:
-        warning_method: A function to call to display a warning message.
+        warning_method: A function to call to display a warning message,
+            given the line number, the message, a warning code and the
+            SourceSpan of the input.
         project: The name of the Google Code project for the Wiki page.
-        issue_map: A dictionary of Google Code issues to GitHub issues.
+        issue_map: A mapping of Google Code issues to GitHub issue URLs, or
+            None if there is none.
         symmetric_headers: True if header denotations are symmetric.
     """
     self._warning_method = warning_method
@@ -83,6 +100,9 @@ class FormattingHandler(object):
     self._issue_map = issue_map
     self._symmetric_headers = symmetric_headers
 
+    # Gets the span of the input being handled, for warnings.
+    self._source_span_method = None
+
     # GFM has a quirk with nested blockquotes where a blank line is needed
     # after closing a nested blockquote while continuing into another.
     self._last_blockquote_indent = 0
@@ -92,8 +112,16 @@ class FormattingHandler(object):
     # of text to be outputted, and when the tag is closed we can trim the
     # buffer before applying formatting. If the trimmed buffer is empty, we
     # can omit the formatting altogether to avoid GFM rendering issues.
+    # Each buffer is a list of fragments, only joined when the tag is closed.
     self._format_buffer = []
 
+    # Encoding writers do a lot of work per call, and output is produced in
+    # many small fragments. Fragments are collected here and only written to
+    # the output stream on paragraph breaks, or when Flush is called.
+    self._output_chunks = []
+    self._output_stream = None
+    self._output_length = 0  # Characters outputted so far, for Tell.
+
     # GitHub won't render formatting within HTML tags. Track if this is the
     # case so we can issue a warning and try a work-around.
     self._in_html = 0  # Number of tags currently open.
@@ -102,6 +130,11 @@ class FormattingHandler(object):
     self._list_tags = []  # If writing HTML for lists, the current list tags.
     self._table_status = None  # Where we are in outputting an HTML table.
 
+    # Table column sizes, taken from the header row, are used to pad the cells
+    # of the table body.
+    self._table_columns = []
+    self._table_cell_start = 0  # Output position of the current cell.
+
     # GitHub doesn't support HTML comments, so as a workaround we give
     # a bogus and empty <a> tag, which renders as nothing.
     self._in_comment = False
@@ -273,6 +306,7 @@ class FormattingHandler(object):
         output_stream: Output Markdown file.
     """
     self._Write("\n", output_stream)
+    self.Flush(output_stream)
 
   def HandleBoldOpen(self, input_line, unused_output_stream):
     """Handle the output for starting bold formatting.
@@ -285,7 +319,7 @@ class FormattingHandler(object):
       self._PrintHtmlWarning(input_line, "Bold")
 
     # Open up another buffer.
-    self._format_buffer.append("")
+    self._format_buffer.append([])
 
   def HandleBoldClose(self, input_line, output_stream):
     """Handle the output for ending bold formatting.
@@ -307,7 +341,7 @@ class FormattingHandler(object):
       self._PrintHtmlWarning(input_line, "Italic")
 
     # Open up another buffer.
-    self._format_buffer.append("")
+    self._format_buffer.append([])
 
   def HandleItalicClose(self, input_line, output_stream):
     """Handle the output for ending italic formatting.
@@ -329,7 +363,7 @@ class FormattingHandler(object):
       self._PrintHtmlWarning(input_line, "Strikethrough")
 
     # Open up another buffer.
-    self._format_buffer.append("")
+    self._format_buffer.append([])
 
   def HandleStrikethroughClose(self, input_line, output_stream):
     """Handle the output for ending strikethrough formatting.
@@ -372,7 +406,7 @@ class FormattingHandler(object):
     """
     if self._in_html:
       self.HandleHtmlOpen(input_line, output_stream, "code", {}, False)
-      self.HandleText(input_line, output_stream, cgi.escape(code))
+      self.HandleText(input_line, output_stream, _EscapeHtml(code))
       self.HandleHtmlClose(input_line, output_stream, "code")
     else:
       # To render backticks within inline code, the surrounding tick count
@@ -424,6 +458,39 @@ class FormattingHandler(object):
     else:
       self._Write("|", output_stream)
 
+  def HandleTableCellStart(self, unused_input_line, unused_output_stream):
+    """Handle the start of the contents of a table cell.
+
+    Args:
+        unused_input_line: Current line number being processed.
+        unused_output_stream: Output Markdown file.
+    """
+    self._table_cell_start = self.Tell()
+
+  def HandleTableCellEnd(self, input_line, output_stream, column):
+    """Handle the end of the contents of a table cell.
+
+    In the header row, the size of the cell is taken as the column size. In the
+    table body, the cell is padded to the column size (for prettier raw text
+    viewing).
+
+    Args:
+        input_line: Current line number being processed.
+        output_stream: Output Markdown file.
+        column: The column of the cell in the table body, counting from 1, or
+                0 if the cell adds a column to the header row.
+    """
+    cell_width = self.Tell() - self._table_cell_start
+    if not column:
+      self._table_columns.append(cell_width)
+      return
+
+    header_cell_width = self._table_columns[
+        min(column, len(self._table_columns)) - 1]
+    remaining_width = header_cell_width - cell_width
+    if remaining_width > 0:
+      self.HandleEscapedText(input_line, output_stream, " " * remaining_width)
+
   def HandleTableRowEnd(self, input_line, output_stream):
     """Handle the output for a table row end.
 
@@ -452,6 +519,7 @@ class FormattingHandler(object):
         input_line: Current line number being processed.
         output_stream: Output Markdown file.
     """
+    self._table_columns = []
     if self._in_html:
       # HandleTableRowEnd will have been called by this point.
       # All we need to do is close the body and table.
@@ -459,20 +527,19 @@ class FormattingHandler(object):
       self.HandleHtmlClose(input_line, output_stream, "table")
       self._table_status = None
 
-  def HandleTableHeader(self, input_line, output_stream, columns):
+  def HandleTableHeader(self, input_line, output_stream):
     """Handle the output for starting a table header.
 
     Args:
         input_line: Current line number being processed.
         output_stream: Output Markdown file.
-        columns: Column sizes.
     """
     if self._in_html:
       return
 
     self.HandleText(input_line, output_stream, "\n")
 
-    for column_width in columns:
+    for column_width in self._table_columns:
       self.HandleTableCellBorder(input_line, output_stream)
 
       # Wiki tables are left-aligned, which takes one character to specify.
@@ -536,7 +603,7 @@ class FormattingHandler(object):
               True)
         else:
           description = description or target
-          self._Write(cgi.escape(description), output_stream)
+          self._Write(_EscapeHtml(description), output_stream)
         self.HandleHtmlClose(input_line, output_stream, "a")
     else:
       # If description is None, this means that only the URL was given. We'd
@@ -592,7 +659,8 @@ class FormattingHandler(object):
     handled = False
 
     # Preferred handler is to map the Google Code issue to a GitHub issue.
-    if self._issue_map and issue in self._issue_map:
+    # An issue map may be empty, e.g. if no issues were migrated yet.
+    if self._issue_map is not None and issue in self._issue_map:
       migrated_issue_url = self._issue_map[issue]
       migrated_issue = migrated_issue_url.rsplit("/", 1)[1]
       self.HandleLink(
@@ -606,17 +674,18 @@ class FormattingHandler(object):
                       "on GitHub: {0}. Please verify this issue on GitHub "
                       "corresponds to the original issue on Google Code. "
                       .format(migrated_issue))
-    elif self._issue_map:
+    elif self._issue_map is not None:
       instructions = ("However, it was not found in the issue migration map; "
                       "please verify that this issue has been correctly "
                       "migrated to GitHub and that the issue mapping is put "
                       "in the issue migration map file. ")
     else:
       instructions = ("However, no issue migration map was specified. You "
-                      "can use issue_migration.py to migrate your Google "
-                      "Code issues to GitHub, and supply the resulting issue "
-                      "migration map file to this converter. Your old issues "
-                      "will be auto-linked to your migrated issues. ")
+                      "can use github_issue_converter.py to migrate your "
+                      "Google Code issues to GitHub, and supply the issue "
+                      "migration map file it writes with --issue_map_file to "
+                      "this converter. Your old issues will be auto-linked "
+                      "to your migrated issues. ")
 
     # If we couldn't handle it in the map, try linking to the old issue.
     if not handled and self._project:
@@ -647,9 +716,10 @@ class FormattingHandler(object):
                        "modified from '{0}{1}' to '{2}'."
                        .format(prefix, issue, output))
 
-    self._warning_method(
+    self._Warn(
         input_line,
-        u"Issue {0} was auto-linked. {1}".format(issue, instructions))
+        u"Issue {0} was auto-linked. {1}".format(issue, instructions),
+        code="issue-link")
 
   def HandleRevision(self, input_line, output_stream, prefix, revision):
     """Handle the output for an auto-linked issue.
@@ -684,11 +754,12 @@ class FormattingHandler(object):
                       "and the text has been modified from '{0}{1}' to '{2}'."
                       .format(prefix, revision, output))
 
-    self._warning_method(
+    self._Warn(
         input_line,
         u"Revision {0} was auto-linked. SVN revision numbers are not sensible "
         "in Git; consider updating this link or removing it altogether. {1}"
-        .format(revision, instructions))
+        .format(revision, instructions),
+        code="revision-link")
 
   def HandleHtmlOpen(
       self,
@@ -739,12 +810,13 @@ class FormattingHandler(object):
         output_stream: Output Markdown file.
         unused_params: The parameters for the tag.
     """
-    self._warning_method(
+    self._Warn(
         input_line,
         "A Google+ +1 button was embedded on this page, but GitHub does not "
         "currently support this. Should it become supported in the future, "
         "see https://developers.google.com/+/web/+1button/ for more "
-        "information.\nIt has been removed.")
+        "information.\nIt has been removed.",
+        code="gplus")
 
   def HandleGPlusClose(self, unused_input_line, unused_output_stream):
     """Handle the output for closing a +1 button.
@@ -762,11 +834,12 @@ class FormattingHandler(object):
         input_line: Current line number being processed.
         output_stream: Output Markdown file.
     """
-    self._warning_method(
+    self._Warn(
         input_line,
         "A comment was used in the wiki file, but GitHub does not currently "
         "support Markdown or HTML comments. As a work-around, the comment will "
-        "be placed in a bogus and empty <a> tag.")
+        "be placed in a bogus and empty <a> tag.",
+        code="comment")
     self._Write("<a href='Hidden comment: ", output_stream)
     self._in_comment = True
 
@@ -790,10 +863,11 @@ class FormattingHandler(object):
         width: Width of the resulting widget.
         height: Height of the resulting widget.
     """
-    self._warning_method(
+    self._Warn(
         input_line,
         "GFM does not support embedding the YouTube player directly. Instead "
-        "an image link to the video is being used, maintaining sizing options.")
+        "an image link to the video is being used, maintaining sizing options.",
+        code="video")
 
     output = self._VIDEO_TEMPLATE.format(video_id, width, height)
     self._Write(output, output_stream)
@@ -833,6 +907,51 @@ class FormattingHandler(object):
     else:
       self.HandleText(input_line, output_stream, self._Escape(text))
 
+  def SetSourceSpanMethod(self, source_span_method):
+    """Set how to find out which input is being handled, for warnings.
+
+    Args:
+        source_span_method: A function that returns the SourceSpan of the
+            input being handled, or None if it is unknown.
+    """
+    self._source_span_method = source_span_method
+
+  def _Warn(self, input_line, message, code):
+    """Display a warning about the input being handled.
+
+    Args:
+        input_line: Current line number being processed.
+        message: The warning message.
+        code: The warning code.
+    """
+    span = None
+    if self._source_span_method:
+      span = self._source_span_method()
+    self._warning_method(input_line, message, code=code, span=span)
+
+  def Flush(self, output_stream):
+    """Write any buffered output to the output stream.
+
+    Args:
+        output_stream: Output Markdown file.
+    """
+    if self._output_chunks:
+      output_stream.write("".join(self._output_chunks))
+      self._output_chunks = []
+
+  def Tell(self):
+    """Get the current position in the output.
+
+    Unlike output_stream.tell(), this counts characters rather than encoded
+    bytes, includes output that hasn't been flushed yet, and doesn't require
+    the output stream to be seekable. Text held in a format buffer is only
+    counted once the formatting is closed.
+
+    Returns:
+        The number of characters outputted so far.
+    """
+    return self._output_length
+
   def _PrintHtmlWarning(self, input_line, kind):
     """Warn about HTML translation being performed.
 
@@ -840,11 +959,12 @@ class FormattingHandler(object):
         input_line: Current line number being processed.
         kind: The kind of tag being changed.
     """
-    self._warning_method(
+    self._Warn(
         input_line,
         u"{0} markup was used within HTML tags. Because GitHub does not "
         "support this, the tags have been translated to HTML. Please verify "
-        "that the formatting is correct.".format(kind))
+        "that the formatting is correct.".format(kind),
+        code="html-translation")
 
   def _HandleHtmlListOpen(
       self,
@@ -916,7 +1036,10 @@ class FormattingHandler(object):
     """
     # Fix index error if list_tags is empty.
     if len(self._list_tags) == 0:
-      self._warning_method(input_line, "HtmlListClose without list_tags?")
+      self._Warn(
+          input_line,
+          "HtmlListClose without list_tags?",
+          code="html-list")
       self._list_tags = [ { "indent": 0, "kind": "Bulleted list" } ]
     top_tag = self._list_tags[-1]
     kind = top_tag["kind"]
@@ -942,8 +1065,7 @@ class FormattingHandler(object):
     """
     if self._format_buffer:
       # End redirection.
-      format_buffer = self._format_buffer[-1]
-      self._format_buffer.pop()
+      format_buffer = "".join(self._format_buffer.pop())
 
       # Don't do anything if we didn't buffer, or it was only whitespace.
       format_buffer = format_buffer.strip()
@@ -960,7 +1082,10 @@ class FormattingHandler(object):
         self._Write(u"{0}{1}{0}".format(tag, format_buffer), output_stream)
 
     else:
-      self._warning_method(input_line, u"Re-closed '{0}', ignoring.".format(tag))
+      self._Warn(
+          input_line,
+          u"Re-closed '{0}', ignoring.".format(tag),
+          code="reclosed-tag")
 
   def _Indent(self, output_stream, indentation_level):
     """Output indentation.
@@ -983,21 +1108,32 @@ class FormattingHandler(object):
     text = text.replace("_", r"\_")
 
     # If we find a plugin-like bit of text, escape the angle-brackets.
-    for plugin_re in [constants.PLUGIN_RE, constants.PLUGIN_END_RE]:
-      while plugin_re.search(text):
-        match = plugin_re.search(text)
-        before_match = text[:match.start()]
-        after_match = text[match.end():]
-        escaped_match = match.group(0).replace("<", "&lt;").replace(">", "&gt;")
-        text = u"{0}{1}{2}".format(before_match, escaped_match, after_match)
+    # Escaped text contains no angle-brackets, so it can never be part of a
+    # later match; a single pass over the text for each pattern is enough.
+    if "<" in text:
+      for plugin_re in [constants.PLUGIN_RE, constants.PLUGIN_END_RE]:
+        text = plugin_re.sub(self._EscapePluginMatch, text)
 
     # In Markdown, if a newline is preceeded by two spaces it breaks the line.
-    # For Wiki text, this is not the case, so we strip such endings off.
-    while text.endswith("  \n"):
-      text = text[:-len("  \n")] + "\n"
+    # For Wiki text, this is not the case, so we strip such endings off
+    # two spaces at a time.
+    if text.endswith("  \n"):
+      stripped_text = text[:-len("\n")].rstrip(" ")
+      space_count = len(text) - len("\n") - len(stripped_text)
+      text = stripped_text + " " * (space_count % 2) + "\n"
 
     return text
 
+  def _EscapePluginMatch(self, match):
+    """Escape the angle-brackets of plugin-like text.
+
+    Args:
+        match: The match for the plugin-like text.
+    Returns:
+        The matched text, with HTML-escaped angle-brackets.
+    """
+    return match.group(0).replace("<", "&lt;").replace(">", "&gt;")
+
   def _SerializeHtmlParams(self, params):
     """Serialize parameters for an HTML tag.
 
@@ -1028,7 +1164,7 @@ class FormattingHandler(object):
 
     if not self._in_comment and self._in_html:
       if self._in_code_block:
-        text = cgi.escape(text)
+        text = _EscapeHtml(text)
 
       if self._in_code_block or self._has_written_text:
         text = text.replace("\n", "<br>\n")
@@ -1038,7 +1174,15 @@ class FormattingHandler(object):
 
     if self._format_buffer:
       # Buffering is occuring, add to buffer.
-      self._format_buffer[-1] += text
+      self._format_buffer[-1].append(text)
     else:
-      # No buffering occuring, just output it.
-      output_stream.write(text)
+      # No buffering occuring, queue it for output.
+      if output_stream is not self._output_stream:
+        if self._output_stream is not None:
+          self.Flush(self._output_stream)
+        self._output_stream = output_stream
+
+      self._output_chunks.append(text)
+      self._output_length += len(text)
+      if len(self._output_chunks) >= self._MAX_OUTPUT_CHUNKS:
+        self.Flush(output_stream)
@@ -0,0 +1,107 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Loads the Google Code to GitHub issue map written by the issue exporter.
+
+An issue map file starts with a header line holding a magic string and the
+URL prefix of the migrated issues, separated by a space. The rest of the file
+is an array of little-endian 32-bit unsigned integers, where the integer at
+index N is the GitHub issue number of Google Code issue N, or 0 if that issue
+was not migrated.
+"""
+import array
+import sys
+
+# The magic string at the start of an issue map file. The issue exporter is a
+# separate tool, so it has its own copy, issues.ISSUE_MAP_MAGIC, which this
+# must match.
+ISSUE_MAP_MAGIC = "gcissuemap1"
+
+# The array typecode of 32-bit unsigned integers, whose size depends on the
+# platform.
+_UINT32_TYPECODE = [typecode for typecode in "IL"
+                    if array.array(typecode).itemsize == 4][0]
+
+
+class IssueMap(object):
+  """Read-only mapping from Google Code issue IDs to migrated issue URLs."""
+
+  def __init__(self, issue_url_prefix, issue_numbers):
+    """Create an issue map.
+
+    Args:
+        issue_url_prefix: The URL of a migrated issue, minus its number.
+        issue_numbers: Array of migrated issue numbers, indexed by Google Code
+                       issue ID, where 0 means the issue was not migrated.
+    """
+    self._issue_url_prefix = issue_url_prefix
+    self._issue_numbers = issue_numbers
+    self._migrated_count = len(issue_numbers) - issue_numbers.count(0)
+
+  def __contains__(self, issue):
+    return self._GetIssueNumber(issue) != 0
+
+  def __getitem__(self, issue):
+    issue_number = self._GetIssueNumber(issue)
+    if not issue_number:
+      raise KeyError(issue)
+
+    return u"{0}{1}".format(self._issue_url_prefix, issue_number)
+
+  def __len__(self):
+    return self._migrated_count
+
+  def _GetIssueNumber(self, issue):
+    """Get the migrated issue number for a Google Code issue.
+
+    Args:
+        issue: The Google Code issue ID, as a number or a string.
+    Returns:
+        The migrated issue number, or 0 if the issue was not migrated.
+    """
+    try:
+      index = int(issue)
+    except ValueError:
+      return 0
+
+    if 0 <= index < len(self._issue_numbers):
+      return self._issue_numbers[index]
+    return 0
+
+
+def LoadIssueMap(issue_map_file_path):
+  """Load an issue map file.
+
+  Args:
+      issue_map_file_path: The path to the issue map file.
+  Returns:
+      The issue map.
+  Raises:
+      IOError: The file is not an issue map file.
+  """
+  with open(issue_map_file_path, "rb") as issue_map_file:
+    magic, _, issue_url_prefix = issue_map_file.readline().rstrip(
+        "\n").partition(" ")
+    if magic != ISSUE_MAP_MAGIC:
+      raise IOError("{0} is not an issue map file".format(issue_map_file_path))
+
+    issue_numbers = array.array(_UINT32_TYPECODE)
+    try:
+      issue_numbers.fromstring(issue_map_file.read())
+    except ValueError:
+      raise IOError("{0} is truncated".format(issue_map_file_path))
+
+  if sys.byteorder != "little":
+    issue_numbers.byteswap()
+
+  return IssueMap(issue_url_prefix.decode("utf-8"), issue_numbers)
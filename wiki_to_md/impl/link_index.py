@@ -0,0 +1,142 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Indexes the links between wiki pages."""
+import collections
+import re
+
+# Runs of whitespace in a heading, which become an underscore in its anchor.
+_ANCHOR_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class PageLinks(object):
+  """Class that records the links and anchors of a page as it is converted.
+
+  The converter calls it for every link to a wiki page, whether or not the
+  page is assumed to exist.
+  """
+
+  def __init__(self, warning_method):
+    """Create the links of a page.
+
+    Args:
+        warning_method: A function to call to display a warning message
+            about the page, given the line number, the message, a warning
+            code and the SourceSpan of the link.
+    """
+    self.warning_method = warning_method
+
+    # The links of the page. Each link is a 3-tuple of the line number,
+    # target and SourceSpan of the link, where the target is a page name,
+    # optionally followed by "#" and an anchor.
+    self.links = []
+
+    # The anchors of the headings of the page.
+    self.anchors = set()
+
+  def HandleWikiLink(self, input_line, target, span):
+    """Record a link to a wiki page.
+
+    Args:
+        input_line: The line number of the link.
+        target: The target of the link, e.g. "Page", "Page#Anchor" or
+            "#Anchor" for a link within the page.
+        span: The SourceSpan of the link, or None if it is unknown.
+    """
+    self.links.append((input_line, target, span))
+
+  def HandleHeading(self, heading_text):
+    """Record a heading, which can be linked to by its anchor.
+
+    Args:
+        heading_text: The text of the heading.
+    """
+    self.anchors.add(_ANCHOR_WHITESPACE_RE.sub(u"_", heading_text.strip()))
+
+
+class LinkIndex(object):
+  """Class that records which wiki pages link to which."""
+
+  def __init__(self, wikipages):
+    """Create a link index.
+
+    Args:
+        wikipages: Wiki pages assumed to exist, besides the indexed pages.
+    """
+    self._wikipages = set(wikipages)
+
+    # Indexed pages in the order they were added, and their PageLinks.
+    self._page_links = collections.OrderedDict()
+
+  def AddPage(self, page, warning_method):
+    """Index the links of a page.
+
+    Args:
+        page: The name of the page.
+        warning_method: A function to call to display a warning message
+            about the page, given the line number, the message, a warning
+            code and the SourceSpan of the link.
+    Returns:
+        The PageLinks to pass as the link handler of the page's converter.
+    """
+    page_links = PageLinks(warning_method)
+    self._page_links[page] = page_links
+    return page_links
+
+  def ReportBrokenLinks(self):
+    """Warn about links to pages or anchors that do not exist.
+
+    A page exists if it was indexed or assumed to exist. Anchors are only
+    checked on indexed pages, whose headings are known. Only call this once
+    every page has been indexed.
+    """
+    for page, page_links in self._page_links.items():
+      for input_line, target, span in page_links.links:
+        target_page, _, anchor = target.partition("#")
+        target_links = self._page_links.get(target_page or page)
+
+        if target_links is None and target_page not in self._wikipages:
+          page_links.warning_method(
+              input_line,
+              u"The page links to {0}, which does not exist.".format(
+                  target_page),
+              code="broken-link",
+              span=span)
+        elif (target_links is not None and anchor and
+              anchor not in target_links.anchors):
+          page_links.warning_method(
+              input_line,
+              u"The page links to {0}, which has no heading {1}.".format(
+                  target_page or page, anchor),
+              code="broken-anchor",
+              span=span)
+
+  def WriteAdjacency(self, stream):
+    """Write out the links of every indexed page.
+
+    Each page gets a line with its name, followed by the distinct targets it
+    links to in the order they first appear, all separated by tabs. A target
+    is a page name, optionally followed by "#" and an anchor; links within a
+    page are just "#" and the anchor.
+
+    Args:
+        stream: Where to write the links.
+    """
+    for page, page_links in self._page_links.items():
+      targets = collections.OrderedDict()
+      for _, target, _ in page_links.links:
+        target_page, _, anchor = target.partition("#")
+        targets[target if anchor else target_page] = True
+
+      stream.write(u"\t".join([page] + targets.keys()))
+      stream.write(u"\n")
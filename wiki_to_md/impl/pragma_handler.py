@@ -21,10 +21,37 @@ class PragmaHandler(object):
     """Create a pragma handler.
 
     Args:
-        warning_method: A function to call to display a warning message.
+        warning_method: A function to call to display a warning message,
+            given the line number, the message, a warning code and the
+            SourceSpan of the input.
     """
     self._warning_method = warning_method
 
+    # Gets the span of the input being handled, for warnings.
+    self._source_span_method = None
+
+  def SetSourceSpanMethod(self, source_span_method):
+    """Set how to find out which input is being handled, for warnings.
+
+    Args:
+        source_span_method: A function that returns the SourceSpan of the
+            input being handled, or None if it is unknown.
+    """
+    self._source_span_method = source_span_method
+
+  def _Warn(self, input_line, message, code):
+    """Display a warning about the input being handled.
+
+    Args:
+        input_line: Current line number being processed.
+        message: The warning message.
+        code: The warning code.
+    """
+    span = None
+    if self._source_span_method:
+      span = self._source_span_method()
+    self._warning_method(input_line, message, code=code, span=span)
+
   def HandlePragma(self,
                    input_line,
                    unused_output_stream,
@@ -42,25 +69,28 @@ class PragmaHandler(object):
     # Google Code supports, so simply notify the user a pragma
     # was matched and that they might want to do something about it.
     if pragma_type == "summary":
-      self._warning_method(
+      self._Warn(
           input_line,
           u"A summary pragma was used for this wiki:\n"
           "\t{0}\n"
           "Consider moving it to an introductory paragraph."
-          .format(pragma_value))
+          .format(pragma_value),
+          code="pragma")
     elif pragma_type == "sidebar":
-      self._warning_method(
+      self._Warn(
           input_line,
           u"A sidebar pragma was used for this wiki:\n"
           "\t{0}\n"
           "The Gollum wiki system supports sidebars, and by converting "
           "{0}.wiki to _Sidebar.md it can be used as a sidebar.\n"
           "See https://github.com/gollum/gollum/wiki for more information."
-          .format(pragma_value))
+          .format(pragma_value),
+          code="pragma")
     else:
-      self._warning_method(
+      self._Warn(
           input_line,
           u"The following pragma has been ignored:\n"
           "\t#{0} {1}\n"
           "Consider expressing the same information in a different manner."
-          .format(pragma_type, pragma_value))
+          .format(pragma_type, pragma_value),
+          code="pragma")
@@ -0,0 +1,101 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Maps between character offsets in a page and line and column numbers."""
+import array
+import bisect
+
+
+class SourceSpan(object):
+  """A span of characters in a page."""
+
+  __slots__ = ("line", "column", "start", "end")
+
+  def __init__(self, line, column, start, end):
+    """Create a source span.
+
+    Args:
+        line: The line the span starts on, counting from 1.
+        column: The column the span starts at, counting from 1.
+        start: The offset of the first character of the span.
+        end: The offset just past the last character of the span.
+    """
+    self.line = line
+    self.column = column
+    self.start = start
+    self.end = end
+
+  def __eq__(self, other):
+    return (isinstance(other, SourceSpan) and
+            (self.line, self.column, self.start, self.end) ==
+            (other.line, other.column, other.start, other.end))
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "SourceSpan({0}, {1}, {2}, {3})".format(
+        self.line, self.column, self.start, self.end)
+
+
+class SourceIndex(object):
+  """Index of where each line of a page starts."""
+
+  def __init__(self, lines):
+    """Create a source index.
+
+    Args:
+        lines: The lines of the page, including their line endings.
+    """
+    # The offset of the start of each line, and of the end of the page.
+    self._line_starts = array.array("L", [0])
+    append = self._line_starts.append
+    offset = 0
+    for line in lines:
+      offset += len(line)
+      append(offset)
+
+  def GetLineStart(self, line):
+    """Get the offset of the start of a line.
+
+    Args:
+        line: The line number, counting from 1.
+    Returns:
+        The offset of the first character of the line.
+    """
+    return self._line_starts[min(line, len(self._line_starts)) - 1]
+
+  def GetLineColumn(self, offset):
+    """Get the line and column of an offset, in O(log n) for n lines.
+
+    Args:
+        offset: The offset of a character in the page.
+    Returns:
+        A 2-tuple of the line and column numbers, counting from 1.
+    """
+    # Leave out the end of the page, so offsets there are on the last line.
+    line = bisect.bisect_right(
+        self._line_starts, offset, hi=max(len(self._line_starts) - 1, 1)) - 1
+    return line + 1, offset - self._line_starts[line] + 1
+
+  def GetSpan(self, start, end):
+    """Get the span between two offsets.
+
+    Args:
+        start: The offset of the first character of the span.
+        end: The offset just past the last character of the span.
+    Returns:
+        The SourceSpan.
+    """
+    line, column = self.GetLineColumn(start)
+    return SourceSpan(line, column, start, end)
@@ -0,0 +1,166 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Splits conversion into parsing a page to tokens, and emitting the tokens.
+
+The converter parses a page into a series of calls to a formatting handler.
+Tokenize records those calls as tokens instead of making them, and Emit
+replays the tokens against a handler. A page's tokens can be kept and emitted
+or analyzed any number of times, without parsing the page again.
+
+Warnings about the Wiki syntax are issued while tokenizing, and warnings about
+the output are issued by the handler while emitting. Each token keeps the
+offsets of the input it was parsed from, so that warnings issued while emitting
+point at the same input as they would without tokenizing.
+"""
+from . import converter
+from . import formatting_handler
+from . import pragma_handler
+
+
+class Token(object):
+  """A call to a formatting handler method."""
+
+  __slots__ = ("input_line", "method", "args", "offsets")
+
+  def __init__(self, input_line, method, args, offsets=None):
+    """Create a token.
+
+    Args:
+        input_line: The line number the token was parsed from.
+        method: The name of the handler method, e.g. "HandleText".
+        args: The arguments to the method, after the line and output stream.
+        offsets: A 2-tuple of the start and end offsets of the input the
+            token was parsed from, or None if they are unknown.
+    """
+    self.input_line = input_line
+    self.method = method
+    self.args = args
+    self.offsets = offsets
+
+  def __getstate__(self):
+    return (self.input_line, self.method, self.args, self.offsets)
+
+  def __setstate__(self, state):
+    self.input_line, self.method, self.args, self.offsets = state
+
+  def __repr__(self):
+    return "Token({0!r}, {1!r}, {2!r}, {3!r})".format(
+        self.input_line, self.method, self.args, self.offsets)
+
+
+class TokenRecorder(object):
+  """Stands in for a formatting handler, recording the calls made to it."""
+
+  def __init__(self):
+    """Create a token recorder."""
+    self.tokens = []
+
+    # Gets the offsets of the input being parsed, for each token.
+    self._source_offsets_method = lambda: None
+
+  def __getattr__(self, name):
+    # Only called the first time each method is used. Like a real handler,
+    # there are no methods beyond those of the FormattingHandler, so that the
+    # converter can still detect unsupported tags.
+    if (not name.startswith("Handle") or
+        not hasattr(formatting_handler.FormattingHandler, name)):
+      raise AttributeError(name)
+
+    tokens = self.tokens
+
+    def RecordToken(input_line, unused_output_stream, *args):
+      tokens.append(
+          Token(input_line, name, args, self._source_offsets_method()))
+
+    setattr(self, name, RecordToken)
+    return RecordToken
+
+  def SetSourceOffsetsMethod(self, source_offsets_method):
+    """Set how to find out which input is being parsed, for each token.
+
+    Args:
+        source_offsets_method: A function that returns a 2-tuple of the start
+            and end offsets of the input being parsed.
+    """
+    self._source_offsets_method = source_offsets_method
+
+  def SetSourceSpanMethod(self, unused_source_span_method):
+    """The recorder issues no warnings, so it needs no source spans."""
+    pass
+
+  def Flush(self, unused_output_stream):
+    """Nothing is written, so there is nothing to flush."""
+    pass
+
+
+def Tokenize(input_stream, warning_method, project, wikipages,
+             link_handler=None):
+  """Parse a wiki page into tokens.
+
+  Args:
+      input_stream: Input Wiki file.
+      warning_method: A function to call to display a warning message,
+          given the line number, the message, a warning code and the
+          SourceSpan of the input.
+      project: The name of the Google Code project for the Wiki page.
+      wikipages: Wiki pages assumed to exist for auto-linking.
+      link_handler: Handler for the links and headings of the page, see
+          converter.Converter, or None.
+  Returns:
+      A 2-tuple of the list of tokens for the page, and the SourceIndex of the
+      page to map the offsets of the tokens to lines and columns.
+  """
+  recorder = TokenRecorder()
+  page_converter = converter.Converter(
+      pragma_handler.PragmaHandler(warning_method),
+      recorder,
+      warning_method,
+      project,
+      wikipages,
+      link_handler)
+  recorder.SetSourceOffsetsMethod(page_converter.GetSourceOffsets)
+  page_converter.Convert(input_stream, None)
+  return recorder.tokens, page_converter.GetSourceIndex()
+
+
+def Emit(tokens, handler, output_stream, source_index=None):
+  """Replay tokens against a formatting handler.
+
+  Args:
+      tokens: The tokens of a page.
+      handler: The formatting handler, or any object with its methods.
+      output_stream: Output file passed on to the handler.
+      source_index: The SourceIndex of the page, to give the handler the span
+          of each token for its warnings, or None to leave them out.
+  """
+  # The token being emitted, looked up only when the handler warns.
+  current_token = [None]
+  if source_index is not None:
+    def GetSourceSpan():
+      offsets = current_token[0].offsets
+      if offsets is None:
+        return None
+      return source_index.GetSpan(*offsets)
+
+    handler.SetSourceSpanMethod(GetSourceSpan)
+
+  methods = {}
+  for token in tokens:
+    current_token[0] = token
+    method = methods.get(token.method)
+    if method is None:
+      method = methods[token.method] = getattr(handler, token.method)
+    method(token.input_line, output_stream, *token.args)
+
+  handler.Flush(output_stream)
@@ -0,0 +1,163 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Collects conversion warnings and reports on them."""
+import collections
+
+
+def _SortedByLine(warnings):
+  """Sort warnings by line and column, keeping warnings at a column in order.
+
+  Warnings without a span are sorted before the warnings with one on the same
+  line.
+
+  Args:
+      warnings: The list of (line number, code, message, span) warnings.
+  Returns:
+      The sorted list of warnings.
+  """
+  return sorted(warnings, key=lambda warning: (
+      warning[0], warning[3].column if warning[3] else 0))
+
+
+def _FormatLocation(input_line, span):
+  """Format where a warning occurred, for the report.
+
+  Args:
+      input_line: The line number the warning occurred on.
+      span: The SourceSpan the warning occurred on, or None.
+  Returns:
+      The location, e.g. "line 3, column 7".
+  """
+  if span is None:
+    return u"line {0}".format(input_line)
+  return u"line {0}, column {1}".format(input_line, span.column)
+
+
+class WarningCollector(object):
+  """Class that collects warnings, to be reported once conversion is done.
+
+  When converting a stream of pages, write out and clear the warnings after
+  every page, so that they do not pile up. Warnings issued after a page was
+  cleared, such as broken links, are reported with the page again.
+  """
+
+  def __init__(self, suppressed_codes=None):
+    """Create a warning collector.
+
+    Args:
+        suppressed_codes: Warning codes that should not be collected.
+    """
+    self._suppressed_codes = set(suppressed_codes or [])
+
+    # Pages with warnings in the order they were first seen, and their
+    # warnings since they were last cleared. Each warning is a 4-tuple of the
+    # line number, warning code, message and SourceSpan, where the span is
+    # None if it is unknown. Warnings aren't always issued in line order,
+    # e.g. broken links are reported after the page is converted, so they are
+    # sorted by line when written out.
+    self._page_warnings = collections.OrderedDict()
+
+    # How many warnings were seen for each code, including suppressed ones,
+    # and how many pages there were, and had warnings that were not
+    # suppressed. Clearing the warnings keeps these for the summary.
+    self._code_counts = collections.Counter()
+    self._page_count = 0
+    self._pages_with_warnings = 0
+
+  def GetWarningMethod(self, page):
+    """Get a warning method that collects warnings for a page.
+
+    Args:
+        page: The name of the page being converted.
+    Returns:
+        A function to pass as the warning method of the handlers.
+    """
+    self._page_count += 1
+    has_warnings = [False]
+
+    def CollectWarning(input_line, message, code=None, span=None):
+      """Collect a warning.
+
+      Args:
+          input_line: The line number this warning occurred on.
+          message: The warning message.
+          code: The warning code.
+          span: The SourceSpan of the input this warning is about.
+      """
+      self._code_counts[code] += 1
+      if code not in self._suppressed_codes:
+        if not has_warnings[0]:
+          has_warnings[0] = True
+          self._pages_with_warnings += 1
+        self._page_warnings.setdefault(page, []).append(
+            (input_line, code, message, span))
+
+    return CollectWarning
+
+  def ClearWarnings(self):
+    """Drop the collected warnings, keeping the counts for the summary."""
+    self._page_warnings.clear()
+
+  def WriteReport(self, stream):
+    """Write out every collected warning, grouped by page.
+
+    Args:
+        stream: Where to write the report.
+    """
+    for page, warnings in self._page_warnings.items():
+      stream.write(u"Warnings for {0}:\n\n".format(page))
+      for input_line, code, message, span in _SortedByLine(warnings):
+        stream.write(u"Warning ({0} of input file) [{1}]:\n{2}\n\n"
+                     .format(_FormatLocation(input_line, span), code, message))
+
+  def WriteJsonLines(self, stream):
+    """Write out every collected warning as a JSON object per line.
+
+    Warnings with a span also have the column they start at, and the start and
+    end offsets of the span in the page.
+
+    Args:
+        stream: Where to write the warnings.
+    """
+    # Only needed for this report, so not imported up front.
+    import json
+
+    for page, warnings in self._page_warnings.items():
+      for input_line, code, message, span in _SortedByLine(warnings):
+        record = {
+            "page": page,
+            "line": input_line,
+            "code": code,
+            "message": message,
+        }
+        if span is not None:
+          record["column"] = span.column
+          record["start"] = span.start
+          record["end"] = span.end
+        stream.write(u"{0}\n".format(json.dumps(record, sort_keys=True)))
+
+  def WriteSummary(self, stream):
+    """Write out how many warnings were issued, per warning code.
+
+    Args:
+        stream: Where to write the summary.
+    """
+    stream.write(u"{0} warnings on {1} of {2} pages.\n".format(
+        sum(self._code_counts.values()),
+        self._pages_with_warnings,
+        self._page_count))
+
+    for code, count in sorted(self._code_counts.items()):
+      suppressed = " (suppressed)" if code in self._suppressed_codes else ""
+      stream.write(u"  {0}: {1}{2}\n".format(code, count, suppressed))
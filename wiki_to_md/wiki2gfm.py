@@ -27,25 +27,241 @@
 import argparse
 
 import codecs
+import contextlib
+import io
 import os
+import StringIO
 import sys
 
 from impl import converter as converter_mod
 from impl import formatting_handler as formatting_handler_mod
+from impl import issue_map as issue_map_mod
+from impl import link_index as link_index_mod
 from impl import pragma_handler as pragma_handler_mod
+from impl import tokenizer as tokenizer_mod
+from impl import warning_collector as warning_collector_mod
 
 
-def PrintWarning(input_line, message):
-  """Print a warning.
+# How much of a NUL-separated input stream is read at a time.
+_READ_SIZE = 64 * 1024
 
-  When a conversion cannot be done or may be unreliable/inexact,
-  a warning will be printed to stdout notifying the user of this.
+
+def ReadNulRecords(stream):
+  """Read NUL-separated records from a stream.
+
+  Args:
+    stream: The stream to read from.
+  Yields:
+    The contents of each record. The last record need not be terminated.
+  """
+  pending = []
+  for chunk in iter(lambda: stream.read(_READ_SIZE), ""):
+    parts = chunk.split("\0")
+    pending.append(parts[0])
+    for part in parts[1:]:
+      yield "".join(pending)
+      pending = [part]
+
+  remainder = "".join(pending)
+  if remainder:
+    yield remainder
+
+
+def ReadGitBatchRecords(stream):
+  """Read records in the output format of `git cat-file --batch`.
+
+  Each record is a "<object> <type> <size>" header line, followed by that
+  many bytes of contents and a newline. The header line may go on with the
+  rest of the line, e.g. the path of the object with --batch="%(objectname)
+  %(objecttype) %(objectsize) %(rest)". Objects git could not find only
+  have a header line, e.g. "<object> missing".
+
+  Args:
+    stream: The stream to read from.
+  Yields:
+    A 2-tuple of the header fields and the contents, or None if the object
+    has no contents. The header fields are those separated by single spaces,
+    up to the rest of the line, which is kept as it is, so joining the fields
+    with spaces gives back the header line.
+  """
+  for header in iter(stream.readline, ""):
+    if header.endswith("\n"):
+      header = header[:-1]
+    header_fields = header.split(" ", 3)
+    if len(header_fields) < 3 or not header_fields[2].isdigit():
+      yield header_fields, None
+      continue
+
+    contents = stream.read(int(header_fields[2]))
+    stream.read(len("\n"))
+    yield header_fields, contents
+
+
+def ConvertPage(
+    input_stream,
+    output_stream,
+    project,
+    wikipages,
+    issue_map,
+    symmetric_headers,
+    warning_method,
+    keep_tokens=False,
+    link_handler=None):
+  """Convert a single wiki page.
+
+  Args:
+    input_stream: Input Wiki file.
+    output_stream: Output Markdown file.
+    project: The name of the Google Code project for the Wiki page.
+    wikipages: Wiki pages assumed to exist for auto-linking.
+    issue_map: A mapping of Google Code issues to GitHub issue URLs.
+    symmetric_headers: True if header denotations are symmetric.
+    warning_method: A function to call to display a warning message.
+    keep_tokens: True to convert the page by way of its tokens, and keep them
+        for further analysis. Otherwise the page is converted directly,
+        which is faster.
+    link_handler: Handler for the links and headings of the page, e.g. from
+        LinkIndex.AddPage, or None.
+  Returns:
+    A 2-tuple of the tokens of the page and the SourceIndex of the page, or
+    None if the tokens were not kept.
+  """
+  formatting_handler = formatting_handler_mod.FormattingHandler(
+      warning_method,
+      project,
+      issue_map,
+      symmetric_headers)
+
+  if not keep_tokens:
+    converter = converter_mod.Converter(
+        pragma_handler_mod.PragmaHandler(warning_method),
+        formatting_handler,
+        warning_method,
+        project,
+        wikipages,
+        link_handler)
+    converter.Convert(input_stream, output_stream)
+    return None
+
+  tokens, source_index = tokenizer_mod.Tokenize(
+      input_stream,
+      warning_method,
+      project,
+      wikipages,
+      link_handler)
+  tokenizer_mod.Emit(tokens, formatting_handler, output_stream, source_index)
+  return tokens, source_index
+
+
+def _PageName(path):
+  """Get the name of a wiki page from its path, e.g. "wiki/Page.wiki".
+
+  Args:
+    path: The path of the page.
+  Returns:
+    The name of the page.
+  """
+  page = os.path.basename(path)
+  if page.endswith(".wiki"):
+    page = page[:-len(".wiki")]
+  return page
+
+
+def ConvertRecords(
+    input_stream,
+    output_stream,
+    framing,
+    warning_collector,
+    link_index=None,
+    write_warnings=None,
+    **kwargs):
+  """Convert a stream of framed wiki pages into a stream of framed pages.
+
+  Pages are named after the path in their git-batch header, if there is one,
+  or else the object in the header or their record number.
 
   Args:
-    input_line: The line number this warning occurred on.
-    message: The warning message.
+    input_stream: Input stream of UTF-8 encoded Wiki pages.
+    output_stream: Output stream of UTF-8 encoded Markdown pages.
+    framing: How pages are framed in the streams, "nul" or "git-batch".
+    warning_collector: Collects the warnings for every page.
+    link_index: If given, indexes the links of every page.
+    write_warnings: If given, a function to call after every page to write
+        out and clear the collected warnings, so that they do not pile up.
+    **kwargs: Passed on to ConvertPage for every page.
   """
-  print u"Warning (line {0} of input file):\n{1}\n".format(input_line, message)
+  if framing == "nul":
+    records = ((None, contents) for contents in ReadNulRecords(input_stream))
+  else:
+    records = ReadGitBatchRecords(input_stream)
+
+  for record_number, (header_fields, contents) in enumerate(records, 1):
+    if contents is not None:
+      if header_fields:
+        page = (header_fields[3] if len(header_fields) > 3
+                else header_fields[0]).decode("utf-8")
+      else:
+        page = u"record {0}".format(record_number)
+
+      # Universal newlines, the same as when reading a single page.
+      page_input = io.StringIO(contents.decode("utf-8"), newline=None)
+      page_output = StringIO.StringIO()
+      warning_method = warning_collector.GetWarningMethod(page)
+      link_handler = None
+      if link_index is not None:
+        link_handler = link_index.AddPage(_PageName(page), warning_method)
+      ConvertPage(
+          page_input,
+          page_output,
+          warning_method=warning_method,
+          link_handler=link_handler,
+          **kwargs)
+      contents = page_output.getvalue().encode("utf-8")
+
+    if framing == "nul":
+      output_stream.write(contents + "\0")
+    elif contents is None:
+      output_stream.write(" ".join(header_fields) + "\n")
+    else:
+      header_fields[2] = str(len(contents))
+      output_stream.write(" ".join(header_fields) + "\n")
+      output_stream.write(contents + "\n")
+
+    # Whoever is on the other end may be waiting for this page.
+    output_stream.flush()
+    if write_warnings:
+      write_warnings()
+
+
+@contextlib.contextmanager
+def _OpenFile(path, mode, encoding=None, standard_stream=None):
+  """Open a file, where "-" is stdin or stdout.
+
+  Args:
+    path: The path of the file, or "-".
+    mode: The mode to open the file with.
+    encoding: The encoding of the file, or None for a binary file.
+    standard_stream: The stream to use for "-", instead of stdin or stdout.
+  Yields:
+    The opened file.
+  """
+  if path != "-":
+    with codecs.open(path, mode, encoding) as stream:
+      yield stream
+  elif "r" in mode:
+    stream = standard_stream or sys.stdin
+    if not encoding:
+      yield stream
+    elif "U" in mode:
+      # Readers from codecs don't translate newlines, so read the whole
+      # input, as the converter does anyway, with universal newlines.
+      yield io.StringIO(codecs.getreader(encoding)(stream).read(),
+                        newline=None)
+    else:
+      yield codecs.getreader(encoding)(stream)
+  else:
+    stream = standard_stream or sys.stdout
+    yield codecs.getwriter(encoding)(stream) if encoding else stream
 
 
 def main(args):
@@ -59,11 +275,42 @@ def main(args):
       "Markdown.")
 
   parser.add_argument("--input_file", required=True,
-                      help="The input Google Code Wiki file")
+                      help="The input Google Code Wiki file, or - for stdin")
   parser.add_argument("--output_file", required=True,
-                      help="The output GitHub-flavored Markdown file")
+                      help="The output GitHub-flavored Markdown file, or - "
+                      "for stdout")
+  parser.add_argument("--framing", choices=["none", "nul", "git-batch"],
+                      default="none",
+                      help="How pages are framed in the input. By default "
+                      "the input is a single page. With 'nul' pages are "
+                      "separated by NUL characters, and with 'git-batch' "
+                      "pages are in the output format of 'git cat-file "
+                      "--batch'. Pages are framed the same way in the output")
+  parser.add_argument("--warnings", choices=["report", "summary", "jsonl"],
+                      default="report",
+                      help="How warnings are reported once conversion is "
+                      "done: every warning grouped by page, only the number "
+                      "of warnings per warning code, or every warning as a "
+                      "line of JSON")
+  parser.add_argument("--warnings_file", required=False,
+                      help="Where to write warnings. Defaults to stdout, or "
+                      "to stderr if the output is written to stdout")
+  parser.add_argument("--suppress_warnings", nargs="*", metavar="CODE",
+                      help="Warning codes to leave out of the warnings, e.g. "
+                      "issue-link or revision-link")
+  parser.add_argument("--link_index_file", required=False,
+                      help="Where to write the links between the converted "
+                      "pages, one line per page with the page name and the "
+                      "pages it links to, separated by tabs. Links to pages "
+                      "that don't exist are reported as warnings. With "
+                      "--framing=git-batch, pages are named after the path "
+                      "at the end of their header, if there is one")
   parser.add_argument("--project", required=False,
                       help="The name of the project for the Wiki")
+  parser.add_argument("--issue_map_file", required=False,
+                      help="The issue map file written by the issue "
+                      "exporter's --issue_map_file flag, used to link "
+                      "Google Code issues to their migrated issues")
   parser.add_argument("--wikipages_list", nargs="*",
                       help="The list of wiki pages that are assumed to exist "
                       "for the purpose of auto-linking to other pages")
@@ -82,39 +329,92 @@ def main(args):
 
   parsed_args, unused_unknown_args = parser.parse_known_args(args)
 
-  with codecs.open(parsed_args.input_file, "rU", "utf-8") as input_stream:
-    with codecs.open(parsed_args.output_file, "wU", "utf-8") as output_stream:
-      # Create the master list of wiki pages assumed to exist.
-      wikipages = parsed_args.wikipages_list or []
-      wikipages.append(parsed_args.input_file)
-
-      if parsed_args.wikipages_path:
-        # Add all the .wiki files in all the given paths.
-        for path in parsed_args.wikipages_path:
-          for f in os.listdir(path):
-            if f.endswith(".wiki"):
-              wikipages.append(f[:-len(".wiki")])
-
-      # Fill this will a mapping from Google Code issue
-      # to GitHub issue to automate that conversion.
-      issue_map = {}
-
-      # Prepare the handlers and converter.
-      pragma_handler = pragma_handler_mod.PragmaHandler(PrintWarning)
-      formatting_handler = formatting_handler_mod.FormattingHandler(
-          PrintWarning,
-          parsed_args.project,
-          issue_map,
-          parsed_args.symmetric_headers)
-      converter = converter_mod.Converter(
-          pragma_handler,
-          formatting_handler,
-          PrintWarning,
-          parsed_args.project,
-          wikipages)
-
-      # And perform the conversion.
-      converter.Convert(input_stream, output_stream)
+  # Create the master list of wiki pages assumed to exist.
+  wikipages = parsed_args.wikipages_list or []
+  if parsed_args.input_file != "-":
+    wikipages.append(parsed_args.input_file)
+
+  if parsed_args.wikipages_path:
+    # Add all the .wiki files in all the given paths.
+    for path in parsed_args.wikipages_path:
+      for f in os.listdir(path):
+        if f.endswith(".wiki"):
+          wikipages.append(f[:-len(".wiki")])
+
+  # Load the issue map once; it is shared by every converted page.
+  if parsed_args.issue_map_file:
+    issue_map = issue_map_mod.LoadIssueMap(parsed_args.issue_map_file)
+  else:
+    issue_map = None
+
+  warning_collector = warning_collector_mod.WarningCollector(
+      parsed_args.suppress_warnings)
+
+  convert_args = {
+      "project": parsed_args.project,
+      "wikipages": wikipages,
+      "issue_map": issue_map,
+      "symmetric_headers": parsed_args.symmetric_headers,
+  }
+
+  if parsed_args.link_index_file:
+    link_index = link_index_mod.LinkIndex(
+        [_PageName(wikipage) for wikipage in wikipages])
+  else:
+    link_index = None
+
+  # Report the warnings, keeping them out of the way of output on stdout.
+  standard_stream = sys.stderr if parsed_args.output_file == "-" else None
+  with _OpenFile(parsed_args.warnings_file or "-", "w", "utf-8",
+                 standard_stream) as warnings_stream:
+
+    def WriteWarnings():
+      """Write out and clear the warnings collected so far."""
+      if parsed_args.warnings == "jsonl":
+        warning_collector.WriteJsonLines(warnings_stream)
+      elif parsed_args.warnings == "report":
+        warning_collector.WriteReport(warnings_stream)
+      # The summary only needs the counts, which clearing keeps.
+      warning_collector.ClearWarnings()
+
+    if parsed_args.framing == "none":
+      page = parsed_args.input_file
+      warning_method = warning_collector.GetWarningMethod(page)
+      link_handler = None
+      if link_index:
+        link_handler = link_index.AddPage(_PageName(page), warning_method)
+      with _OpenFile(parsed_args.input_file, "rU", "utf-8") as input_stream:
+        with _OpenFile(parsed_args.output_file, "wU",
+                       "utf-8") as output_stream:
+          ConvertPage(
+              input_stream,
+              output_stream,
+              warning_method=warning_method,
+              link_handler=link_handler,
+              **convert_args)
+    else:
+      # Warnings are written as each page is done, as there may be no end
+      # to the pages.
+      with _OpenFile(parsed_args.input_file, "rb") as input_stream:
+        with _OpenFile(parsed_args.output_file, "wb") as output_stream:
+          ConvertRecords(
+              input_stream,
+              output_stream,
+              parsed_args.framing,
+              warning_collector,
+              link_index,
+              WriteWarnings,
+              **convert_args)
+
+    if link_index:
+      link_index.ReportBrokenLinks()
+      with _OpenFile(parsed_args.link_index_file, "w",
+                     "utf-8") as link_stream:
+        link_index.WriteAdjacency(link_stream)
+
+    WriteWarnings()
+    if parsed_args.warnings == "summary":
+      warning_collector.WriteSummary(warnings_stream)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,620 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks for wiki2gfm.
+
+Run from this directory, e.g.:
+    python wiki2gfm_benchmark.py --scale=1000
+    python wiki2gfm_benchmark.py --scale=100 --profile
+    python wiki2gfm_benchmark.py --startup=20
+    python wiki2gfm_benchmark.py --corpus=1K,1M,50M --write_baseline=b.json
+    python wiki2gfm_benchmark.py --corpus=1K,1M,50M --baseline=b.json
+
+Startup timings include compiling the sources unless they have been compiled
+already, e.g. by "python -m compileall .".
+
+The corpus benchmark converts generated corpora of pages heavy in tables,
+lists, code blocks, plugins and WikiWords, timing each stage of conversion
+separately. Compared against a baseline written by an earlier run, it exits
+with a non-zero status if any stage got slower, or used more memory, by more
+than the allowed regression.
+"""
+import argparse
+import codecs
+import cProfile
+import json
+import os
+import pickle
+import pstats
+import random
+import shutil
+import StringIO
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from impl import formatting_handler
+from impl import tokenizer
+import wiki2gfm
+
+
+# A line in which nearly every word is matched by a formatting rule.
+_TOKEN_DENSE_LINE = (
+    u"*bold* _italic_ ~~struck~~ ^sup^ ,,sub,, `code` {{{more code}}} "
+    "TestPage [TestPage a page] http://example.com/ [http://example.com/ a "
+    "site] issue 12 r345 <b>html</b> %%project%% *_nested_*\n")
+
+# A paragraph of prose, with no markup at all.
+_PROSE_PARAGRAPH = (
+    u"This page describes how the project is built and released. Most of "
+    "the\nsteps are automated, but a few of them still need a person to "
+    "check the\nresults before moving on. If anything goes wrong, ask on "
+    "the mailing list\nbefore trying again.\n\n")
+
+# Run in a fresh interpreter before importing the module under test. It times
+# every import that loads new modules, and writes one line per import to
+# stderr in the format of Python 3's "-X importtime": the time spent in the
+# import itself and including nested imports, in microseconds, then the import
+# statement indented by nesting depth. Nested imports are written before the
+# import they are nested in.
+_IMPORT_TIMER = """
+import __builtin__
+import sys
+import time
+
+_original_import = __builtin__.__import__
+_nested_seconds = []
+
+def _TimedImport(name, globals=None, locals=None, fromlist=None, level=-1):
+  module_count = len(sys.modules)
+  _nested_seconds.append(0.0)
+  start = time.time()
+  try:
+    return _original_import(name, globals, locals, fromlist, level)
+  finally:
+    seconds = time.time() - start
+    nested_seconds = _nested_seconds.pop()
+    if _nested_seconds:
+      _nested_seconds[-1] += seconds
+    if len(sys.modules) > module_count:
+      if fromlist:
+        statement = "from %s%s import %s" % (
+            "." * max(level, 0), name, ", ".join(fromlist))
+      else:
+        statement = "import %s" % name
+      sys.stderr.write("import time: %9d | %10d | %s%s\\n" % (
+          (seconds - nested_seconds) * 1e6, seconds * 1e6,
+          "  " * len(_nested_seconds), statement))
+
+__builtin__.__import__ = _TimedImport
+"""
+
+# Words that generated pages are made of. WikiWords are made of pairs of them.
+_WORDS = [
+    u"build", u"release", u"client", u"server", u"cache", u"index", u"query",
+    u"page", u"table", u"stream", u"parser", u"token", u"option", u"plugin",
+    u"config", u"format", u"error", u"report", u"thread", u"socket",
+]
+
+# The kinds of blocks generated pages are made of.
+_BLOCK_KINDS = ["table", "list", "code", "plugin", "wikiword"]
+
+# How large each generated page is, in characters, unless the corpus is
+# smaller than that.
+_CORPUS_PAGE_SIZE = 4000
+
+# The stages of conversion timed by the corpus benchmark.
+_CORPUS_STAGES = ["tokenize", "emit", "convert"]
+
+# Each stage is repeated until it has run for at least this long, and the
+# fastest run is reported, so that small corpora are timed accurately.
+_CORPUS_MIN_SECONDS = 1.0
+
+# Peak memory regressions smaller than this are ignored, as timing noise is
+# for throughput.
+_PEAK_MEMORY_SLACK_MB = 2.0
+
+
+def _IgnoreWarning(unused_input_line, unused_message, code=None, span=None):
+  """Discard a warning, so that printing does not skew the timings."""
+  pass
+
+
+def _Convert(wiki_text, output_stream):
+  """Convert wiki text to the given output stream, as wiki2gfm does.
+
+  Args:
+    wiki_text: The Google Code Wiki text to convert.
+    output_stream: Output Markdown file.
+  """
+  wiki2gfm.ConvertPage(
+      StringIO.StringIO(wiki_text),
+      output_stream,
+      project="test",
+      wikipages=["TestPage"],
+      issue_map={},
+      symmetric_headers=False,
+      warning_method=_IgnoreWarning)
+
+
+def _Report(name, input_size, seconds):
+  """Print the result of a benchmark.
+
+  Args:
+    name: The name of the benchmark.
+    input_size: The size of the converted input, in characters.
+    seconds: How long the conversion took.
+  """
+  print u"{0}: {1:.3f}s, {2:.2f} MB/s".format(
+      name, seconds, input_size / seconds / 1e6)
+
+
+def BenchmarkExamplePage(scale):
+  """Convert example.wiki, repeated many times, into an encoded file.
+
+  Args:
+    scale: How many times example.wiki is repeated in the input.
+  """
+  with codecs.open("example.wiki", "rU", "utf-8") as example_input:
+    wiki_text = example_input.read() * scale
+
+  temp_dir = tempfile.mkdtemp()
+  try:
+    output_path = os.path.join(temp_dir, "example.md")
+    with codecs.open(output_path, "wU", "utf-8") as output_stream:
+      start = time.time()
+      _Convert(wiki_text, output_stream)
+      seconds = time.time() - start
+  finally:
+    shutil.rmtree(temp_dir)
+
+  _Report(u"example.wiki x{0}".format(scale), len(wiki_text), seconds)
+
+
+def BenchmarkTokenDensePage(scale):
+  """Convert a page in which nearly every word is markup.
+
+  Args:
+    scale: How many hundreds of token-dense lines are in the input.
+  """
+  wiki_text = _TOKEN_DENSE_LINE * 100 * scale
+
+  start = time.time()
+  _Convert(wiki_text, StringIO.StringIO())
+  seconds = time.time() - start
+
+  _Report(u"token-dense x{0}".format(scale), len(wiki_text), seconds)
+
+
+def BenchmarkProsePage(scale):
+  """Convert a page of prose paragraphs, with no markup.
+
+  Args:
+    scale: How many hundreds of paragraphs are in the input.
+  """
+  wiki_text = _PROSE_PARAGRAPH * 100 * scale
+
+  start = time.time()
+  _Convert(wiki_text, StringIO.StringIO())
+  seconds = time.time() - start
+
+  _Report(u"prose x{0}".format(scale), len(wiki_text), seconds)
+
+
+def _TimeImport(module_name):
+  """Import a module in a fresh interpreter, timing every import.
+
+  Args:
+    module_name: The name of the module to import.
+  Returns:
+    A list of (self microseconds, cumulative microseconds, statement) tuples,
+    with the import statement indented by nesting depth, in the order the
+    imports finished.
+  """
+  process = subprocess.Popen(
+      [sys.executable, "-c", u"{0}\nimport {1}\n".format(
+          _IMPORT_TIMER, module_name)],
+      stderr=subprocess.PIPE)
+  _, import_times = process.communicate()
+
+  timings = []
+  for line in import_times.splitlines():
+    if line.startswith("import time:"):
+      self_us, cumulative_us, statement = line[len("import time:"):].split(
+          "|")
+      timings.append((int(self_us), int(cumulative_us), statement.rstrip()[1:]))
+  return timings
+
+
+def BenchmarkStartup(module_name, runs):
+  """Import a module in fresh interpreters, like running it as a script.
+
+  Args:
+    module_name: The name of the module to import.
+    runs: How many interpreters to time the import in.
+  """
+  import_times = [_TimeImport(module_name) for _ in xrange(runs)]
+  totals = sorted(timings[-1][1] for timings in import_times)
+  print u"import {0}: {1:.1f}ms median, {2:.1f}ms best of {3}".format(
+      module_name, totals[len(totals) / 2] / 1e3, totals[0] / 1e3, runs)
+
+  # The slowest imports of the median run, by time spent in the import itself.
+  median_timings = sorted(import_times, key=lambda t: t[-1][1])[runs / 2]
+  for self_us, cumulative_us, statement in sorted(
+      median_timings, reverse=True)[:10]:
+    print u"  {0:>8.1f}ms {1:>8.1f}ms  {2}".format(
+        self_us / 1e3, cumulative_us / 1e3, statement)
+
+
+def _ParseSize(size):
+  """Parse a corpus size, e.g. "1K", "2.5M" or "300".
+
+  Args:
+    size: The size, in characters, with an optional K or M suffix for
+        thousands or millions.
+  Returns:
+    The size in characters.
+  """
+  multipliers = {"K": 1000, "M": 1000 * 1000}
+  multiplier = multipliers.get(size[-1:].upper())
+  if multiplier:
+    return int(float(size[:-1]) * multiplier)
+  return int(size)
+
+
+def _WikiWord(rng):
+  """Generate a WikiWord from two random words."""
+  return rng.choice(_WORDS).capitalize() + rng.choice(_WORDS).capitalize()
+
+
+def _Sentence(rng, word_count):
+  """Generate a sentence of random words, with some of them formatted."""
+  words = []
+  for _ in xrange(word_count):
+    word = rng.choice(_WORDS)
+    roll = rng.random()
+    if roll < 0.05:
+      word = u"*{0}*".format(word)
+    elif roll < 0.1:
+      word = u"_{0}_".format(word)
+    elif roll < 0.15:
+      word = u"`{0}`".format(word)
+    words.append(word)
+  return u" ".join(words).capitalize() + u"."
+
+
+def _GenerateBlock(rng, kind):
+  """Generate a block of wiki text.
+
+  Args:
+    rng: The random number generator.
+    kind: The kind of block, one of _BLOCK_KINDS.
+  Returns:
+    The wiki text of the block, ending in a blank line.
+  """
+  lines = []
+  if kind == "table":
+    lines.append(u"|| *{0}* || *{1}* || *{2}* ||".format(
+        rng.choice(_WORDS), rng.choice(_WORDS), rng.choice(_WORDS)))
+    for _ in xrange(rng.randint(3, 10)):
+      lines.append(u"|| {0} || `{1}` || {2} ||".format(
+          _WikiWord(rng), rng.choice(_WORDS), _Sentence(rng, 4)))
+  elif kind == "list":
+    for _ in xrange(rng.randint(3, 10)):
+      depth = rng.randint(1, 3)
+      lines.append(u"{0}{1} {2}".format(
+          u"  " * depth, rng.choice(u"*#"), _Sentence(rng, 6)))
+  elif kind == "code":
+    lines.append(u"{{{")
+    for _ in xrange(rng.randint(3, 12)):
+      lines.append(u"{0}{1}({2}, {3});".format(
+          u"  " * rng.randint(0, 3), rng.choice(_WORDS), rng.choice(_WORDS),
+          rng.randint(0, 1000)))
+    lines.append(u"}}}")
+  elif kind == "plugin":
+    lines.append(u"<wiki:comment>")
+    lines.append(_Sentence(rng, 8))
+    lines.append(u"</wiki:comment>")
+    lines.append(u'<g:plusone size="medium"></g:plusone>')
+    lines.append(u'<wiki:video url="http://www.youtube.com/watch?v={0}"/>'
+                 .format(rng.randint(0, 1000000)))
+    lines.append(u"<wiki:toc>")
+  else:
+    for _ in xrange(rng.randint(2, 5)):
+      lines.append(u"{0} links to {1}, and [{2} the {3} page] to issue {4} "
+                   "and r{5}.".format(
+                       _WikiWord(rng), _WikiWord(rng), _WikiWord(rng),
+                       rng.choice(_WORDS), rng.randint(1, 500),
+                       rng.randint(1, 5000)))
+  return u"\n".join(lines) + u"\n\n"
+
+
+def GenerateCorpus(size, seed=0):
+  """Generate a corpus of wiki pages, in the style of example.wiki.
+
+  Each page is mostly made of one kind of block, such as tables or code
+  blocks, going through every kind in turn.
+
+  Args:
+    size: The total size of the pages, in characters. The last page is cut
+        short at the end of a block, so the corpus may be a little larger.
+    seed: The seed of the random number generator, so that the same corpus
+        is generated every time.
+  Returns:
+    The list of pages.
+  """
+  rng = random.Random(seed)
+  page_size = min(size, _CORPUS_PAGE_SIZE)
+  pages = []
+  corpus_size = 0
+  while corpus_size < size:
+    main_kind = _BLOCK_KINDS[len(pages) % len(_BLOCK_KINDS)]
+    blocks = [u"#summary A {0} page.\n\n= {1} =\n\n".format(
+        main_kind, _WikiWord(rng))]
+    page_length = len(blocks[0])
+    while page_length < page_size and corpus_size + page_length < size:
+      kind = main_kind if rng.random() < 0.7 else rng.choice(_BLOCK_KINDS)
+      blocks.append(u"== {0} ==\n\n".format(_Sentence(rng, 3)))
+      blocks.append(_GenerateBlock(rng, kind))
+      page_length += len(blocks[-2]) + len(blocks[-1])
+
+    pages.append(u"".join(blocks))
+    corpus_size += page_length
+  return pages
+
+
+def _PeakMemoryMb():
+  """Get the peak memory use of this process so far, in megabytes."""
+  # Only used by the corpus benchmark, and not available on every platform.
+  import resource
+
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, but OS X reports bytes.
+  if sys.platform == "darwin":
+    peak /= 1024
+  return peak / 1024.0
+
+
+def _RunInChild(function, *args):
+  """Call a function in a forked child process, where there is fork.
+
+  This gives each call its own peak memory use.
+
+  Args:
+    function: The function to call. Its result must be picklable.
+    *args: The arguments to the function.
+  Returns:
+    The result of the function.
+  Raises:
+    RuntimeError: The function failed in the child process.
+  """
+  if not hasattr(os, "fork"):
+    return function(*args)
+
+  read_fd, write_fd = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    os.close(read_fd)
+    exit_status = 1
+    try:
+      with os.fdopen(write_fd, "wb") as result_stream:
+        pickle.dump(function(*args), result_stream, 2)
+      exit_status = 0
+    except:  # pylint: disable=bare-except
+      traceback.print_exc()
+    finally:
+      os._exit(exit_status)  # pylint: disable=protected-access
+
+  os.close(write_fd)
+  with os.fdopen(read_fd, "rb") as result_stream:
+    result = result_stream.read()
+  _, exit_status = os.waitpid(pid, 0)
+  if exit_status:
+    raise RuntimeError("The benchmark failed in a child process.")
+  return pickle.loads(result)
+
+
+def _TimeStage(stage, pages, wikipages):
+  """Time one stage of converting every page of a corpus.
+
+  The pages are converted over and over until it has taken at least
+  _CORPUS_MIN_SECONDS. Only the stage itself is timed, but the peak memory
+  includes the stages before it, which produce its input.
+
+  Args:
+    stage: The stage to time, one of _CORPUS_STAGES.
+    pages: The pages of the corpus.
+    wikipages: Wiki pages assumed to exist for auto-linking.
+  Returns:
+    A 2-tuple of the seconds spent in the stage by the fastest conversion of
+    the corpus, and the growth in peak memory use in megabytes.
+  """
+  start_peak_mb = _PeakMemoryMb()
+  total_seconds = 0.0
+  best_seconds = None
+  while total_seconds < _CORPUS_MIN_SECONDS:
+    seconds = 0.0
+    for page in pages:
+      if stage == "convert":
+        start = time.time()
+        wiki2gfm.ConvertPage(
+            StringIO.StringIO(page),
+            StringIO.StringIO(),
+            project="test",
+            wikipages=wikipages,
+            issue_map={},
+            symmetric_headers=False,
+            warning_method=_IgnoreWarning)
+        seconds += time.time() - start
+        continue
+
+      start = time.time()
+      tokens, source_index = tokenizer.Tokenize(
+          StringIO.StringIO(page), _IgnoreWarning, "test", wikipages)
+      if stage == "tokenize":
+        seconds += time.time() - start
+        continue
+
+      handler = formatting_handler.FormattingHandler(
+          _IgnoreWarning, "test", {}, False)
+      start = time.time()
+      tokenizer.Emit(tokens, handler, StringIO.StringIO(), source_index)
+      seconds += time.time() - start
+
+    total_seconds += seconds
+    best_seconds = min(seconds, best_seconds or seconds)
+
+  return best_seconds, _PeakMemoryMb() - start_peak_mb
+
+
+def BenchmarkCorpus(size):
+  """Convert a generated corpus, timing each stage of conversion.
+
+  Args:
+    size: The size of the corpus, in characters.
+  Returns:
+    A dictionary from each stage to a dictionary of its "pages_per_second",
+    "mb_per_second" and "peak_mb" (the growth in peak memory use).
+  """
+  pages = GenerateCorpus(size)
+  corpus_size = sum(len(page) for page in pages)
+  # Link most WikiWords to existing pages, the way a real wiki would.
+  rng = random.Random(1)
+  wikipages = [_WikiWord(rng) for _ in xrange(len(_WORDS) ** 2)]
+
+  print u"corpus of {0} pages, {1:.3f} MB:".format(
+      len(pages), corpus_size / 1e6)
+  results = {}
+  for stage in _CORPUS_STAGES:
+    seconds, peak_mb = _RunInChild(_TimeStage, stage, pages, wikipages)
+    results[stage] = {
+        "pages_per_second": len(pages) / seconds,
+        "mb_per_second": corpus_size / seconds / 1e6,
+        "peak_mb": peak_mb,
+    }
+    print (u"  {0:<8} {1:>10.1f} pages/s {2:>8.3f} MB/s {3:>8.1f} MB peak"
+           .format(stage, results[stage]["pages_per_second"],
+                   results[stage]["mb_per_second"], peak_mb))
+  return results
+
+
+def FindRegressions(results, baseline, max_regression):
+  """Compare corpus benchmark results against a baseline.
+
+  Args:
+    results: Dictionary from corpus size to the results of BenchmarkCorpus.
+    baseline: Results of an earlier run, in the same format. Sizes and stages
+        missing from either are not compared.
+    max_regression: How much worse a stage may do, as a fraction, e.g. 0.2
+        for 20%.
+  Returns:
+    A list of messages, one for each regression.
+  """
+  regressions = []
+  for size, stages in sorted(results.items()):
+    for stage, result in sorted(stages.items()):
+      baseline_result = baseline.get(size, {}).get(stage)
+      if not baseline_result:
+        continue
+
+      min_mb_per_second = baseline_result["mb_per_second"] * (
+          1 - max_regression)
+      if result["mb_per_second"] < min_mb_per_second:
+        regressions.append(
+            u"{0} {1}: {2:.3f} MB/s, below the minimum of {3:.3f} MB/s".format(
+                size, stage, result["mb_per_second"], min_mb_per_second))
+
+      max_peak_mb = (baseline_result["peak_mb"] * (1 + max_regression) +
+                     _PEAK_MEMORY_SLACK_MB)
+      if result["peak_mb"] > max_peak_mb:
+        regressions.append(
+            u"{0} {1}: {2:.1f} MB peak, above the maximum of {3:.1f} MB".format(
+                size, stage, result["peak_mb"], max_peak_mb))
+  return regressions
+
+
+def main(args):
+  """The main function.
+
+  Args:
+     args: The command line arguments.
+  Returns:
+     The exit status.
+  """
+  parser = argparse.ArgumentParser(description="Benchmarks wiki2gfm.")
+  parser.add_argument("--scale", type=int, default=1000,
+                      help="How many times to repeat each benchmark page")
+  parser.add_argument("--profile", action="store_true",
+                      help="Print the functions that took the most time")
+  parser.add_argument("--startup", type=int, metavar="RUNS",
+                      help="Only time how long importing wiki2gfm takes, "
+                      "over this many fresh interpreters")
+  parser.add_argument("--corpus", metavar="SIZES",
+                      help="Only convert generated corpora of these sizes, "
+                      "separated by commas, e.g. 1K,1M,50M")
+  parser.add_argument("--baseline", metavar="FILE",
+                      help="Fail if the corpus benchmark regressed from the "
+                      "results in this file")
+  parser.add_argument("--write_baseline", metavar="FILE",
+                      help="Write the results of the corpus benchmark to "
+                      "this file, to use as a baseline later")
+  parser.add_argument("--max_regression", type=float, default=20.0,
+                      metavar="PERCENT",
+                      help="How much slower a stage of the corpus benchmark "
+                      "may get, or how much more memory it may use, before "
+                      "it is a regression")
+  parsed_args, unused_unknown_args = parser.parse_known_args(args)
+
+  if parsed_args.startup:
+    BenchmarkStartup("wiki2gfm", parsed_args.startup)
+    return 0
+
+  if parsed_args.corpus:
+    results = {}
+    for size in parsed_args.corpus.split(","):
+      results[size] = BenchmarkCorpus(_ParseSize(size))
+
+    if parsed_args.write_baseline:
+      with open(parsed_args.write_baseline, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if parsed_args.baseline:
+      with open(parsed_args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+
+      regressions = FindRegressions(
+          results, baseline, parsed_args.max_regression / 100)
+      for regression in regressions:
+        print u"REGRESSION {0}".format(regression)
+      if regressions:
+        return 1
+    return 0
+
+  profile = cProfile.Profile()
+  if parsed_args.profile:
+    profile.enable()
+
+  BenchmarkExamplePage(parsed_args.scale)
+  BenchmarkTokenDensePage(parsed_args.scale)
+  BenchmarkProsePage(parsed_args.scale)
+
+  if parsed_args.profile:
+    profile.disable()
+    pstats.Stats(profile).sort_stats("tottime").print_stats(15)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
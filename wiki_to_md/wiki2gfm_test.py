@@ -12,13 +12,52 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Tests for wiki2gfm."""
+import array
 import codecs
+import os
+import pickle
+import random
+import shutil
 import StringIO
+import struct
+import sys
+import tempfile
 import unittest
 
+from impl import constants
 from impl import converter
 from impl import formatting_handler
+from impl import issue_map
+from impl import link_index
 from impl import pragma_handler
+from impl import source_index
+from impl import tokenizer
+from impl import warning_collector
+import wiki2gfm
+
+
+class WriteOnlyStream(object):
+  """An output stream that can't tell its position, like a pipe."""
+
+  def __init__(self):
+    """Create a write-only stream."""
+    self._chunks = []
+
+  def write(self, text):
+    """Write text to the stream.
+
+    Args:
+        text: The text to write.
+    """
+    self._chunks.append(text)
+
+  def getvalue(self):
+    """Get everything written to the stream.
+
+    Returns:
+        The written text.
+    """
+    return u"".join(self._chunks)
 
 
 class BaseTest(unittest.TestCase):
@@ -48,9 +87,11 @@ class BaseTest(unittest.TestCase):
     Args:
         expected_output: The expected value of the output.
     """
+    self.formatting_handler.Flush(self.output)
     self.assertEquals(expected_output, self.output.getvalue())
 
   def assertNoOutput(self, expected_output):
+    self.formatting_handler.Flush(self.output)
     self.assertNotEqual(expected_output, self.output.getvalue())
 
   def assertWarning(self, warning_contents, occurrences=1):
@@ -75,14 +116,16 @@ class BaseTest(unittest.TestCase):
     """Assert that no warnings were issued."""
     self.assertListEqual([], self.warnings)
 
-  def _TrackWarning(self, input_line, message):
+  def _TrackWarning(self, input_line, message, code=None, span=None):
     """Track a warning by storing it in memory.
 
     Args:
       input_line: Line the warning was issued on.
       message: The warning message.
+      code: The warning code.
+      span: The SourceSpan the warning was issued on.
     """
-    self.warnings.append((input_line, message))
+    self.warnings.append((input_line, message, code, span))
 
 
 class TestPragmaHandler(BaseTest):
@@ -304,6 +347,14 @@ class TestFormattingHandler(BaseTest):
     self.assertOutput("a\n\nb\n")
     self.assertNoWarnings()
 
+  def testHandleParagraphBreakFlushesOutput(self):
+    self.formatting_handler.HandleText(1, self.output, "a\n")
+    self.assertEquals("", self.output.getvalue())
+
+    self.formatting_handler.HandleParagraphBreak(2, self.output)
+    self.assertEquals("a\n\n", self.output.getvalue())
+    self.assertNoWarnings()
+
   def testHandleParagraphBreakInHtml(self):
     self.formatting_handler._in_html = 1
     self.formatting_handler.HandleText(1, self.output, "a\n")
@@ -321,6 +372,15 @@ class TestFormattingHandler(BaseTest):
     self.assertOutput("**xyz**")
     self.assertNoWarnings()
 
+  def testHandleBoldOnlyWhitespace(self):
+    self.formatting_handler.HandleBoldOpen(1, self.output)
+    self.formatting_handler.HandleText(2, self.output, " ")
+    self.formatting_handler.HandleText(2, self.output, "\n")
+    self.formatting_handler.HandleBoldClose(3, self.output)
+
+    self.assertOutput("")
+    self.assertNoWarnings()
+
   def testHandleBoldInHtml(self):
     self.formatting_handler._in_html = 1
     self.formatting_handler.HandleBoldOpen(1, self.output)
@@ -553,6 +613,15 @@ class TestFormattingHandler(BaseTest):
     self.assertWarning("As a placeholder, the text has been modified to "
                        "link to the original Google Code issue page")
 
+  def testHandleIssueEmptyMap(self):
+    self.formatting_handler._issue_map = issue_map.IssueMap(
+        u"https://github.com/a/b/issues/", array.array("I"))
+    self.formatting_handler.HandleIssue(1, self.output, "issue ", 456)
+
+    self.assertOutput("[issue 456](https://code.google.com/p/"
+                      "test/issues/detail?id=456)")
+    self.assertWarning("However, it was not found in the issue migration map")
+
   def testHandleIssueNoMap(self):
     self.formatting_handler._issue_map = None
     self.formatting_handler.HandleIssue(1, self.output, "issue ", 456)
@@ -629,6 +698,16 @@ class TestFormattingHandler(BaseTest):
                        "Code issue page.")
     self.assertWarning("The auto-link has been removed")
 
+  def testHandleIssueInLoadedIssueMap(self):
+    self.formatting_handler._issue_map = issue_map.IssueMap(
+        u"https://github.com/abcxyz/test/issues/",
+        array.array("I", [0, 0, 789]))
+    self.formatting_handler.HandleIssue(1, self.output, "issue ", u"2")
+
+    self.assertOutput("[issue 789](https://github.com/abcxyz/test/issues/789)")
+    self.assertWarning("Issue 2 was auto-linked")
+    self.assertWarning("it has been linked to the migrated issue on GitHub")
+
   def testHandleRevision(self):
     self.formatting_handler.HandleRevision(1, self.output, "revision ", 7)
 
@@ -787,6 +866,37 @@ class TestFormattingHandler(BaseTest):
     self.assertOutput("**_xyz_** <a>")
     self.assertNoWarnings()
 
+  def testEscapeMatchesReference(self):
+    # Differential test against the original, quadratic implementation.
+    def ReferenceEscape(text):
+      text = text.replace("*", r"\*")
+      text = text.replace("_", r"\_")
+
+      for plugin_re in [constants.PLUGIN_RE, constants.PLUGIN_END_RE]:
+        while plugin_re.search(text):
+          match = plugin_re.search(text)
+          before_match = text[:match.start()]
+          after_match = text[match.end():]
+          escaped_match = (match.group(0).replace("<", "&lt;")
+                           .replace(">", "&gt;"))
+          text = u"{0}{1}{2}".format(before_match, escaped_match, after_match)
+
+      while text.endswith("  \n"):
+        text = text[:-len("  \n")] + "\n"
+
+      return text
+
+    fragments = ["<", ">", "</", "/>", "a", "b:c", "x", "=", "\"", "'", " ",
+                 "  ", "\n", "*", "_", "-", "<a>", "</a>", "<b x=1>", "&"]
+    rng = random.Random(1234)
+    for _ in xrange(5000):
+      text = u"".join(rng.choice(fragments)
+                      for _ in xrange(rng.randint(0, 30)))
+      if rng.randint(0, 2) == 0:
+        text += " " * rng.randint(0, 5) + "\n"
+      self.assertEquals(ReferenceEscape(text),
+                        self.formatting_handler._Escape(text))
+
 
 class TestConverter(BaseTest):
   """Tests the converter."""
@@ -798,6 +908,488 @@ class TestConverter(BaseTest):
 
         self.assertOutput(example_output.read())
 
+  def testTextFormatTriggerCoversAllRules(self):
+    # Lines without a trigger skip TEXT_FORMAT_RE, so it must never match.
+    fragments = ["a", "b", "A", "Ab", "1", " ", "!", "#", ":", "/", "-", "=",
+                 "*", "_", "~", "^", ",", "`", "{", "}", "|", "[", "]", "<",
+                 ">", "%", "x=1", "issue", "Bug", "r", "Revision", "http",
+                 "mailto", "TestPage", "\t"]
+    rng = random.Random(1234)
+    for _ in xrange(20000):
+      text = u"".join(rng.choice(fragments)
+                      for _ in xrange(rng.randint(1, 12)))
+      if constants.TEXT_FORMAT_RE.search(text):
+        self.assertTrue(constants.TEXT_FORMAT_TRIGGER_RE.search(text), text)
+
+  def testFormatRuleNamesMatchRegexes(self):
+    self.assertItemsEqual(
+        constants.FORMAT_RULE_NAMES,
+        constants.LINE_FORMAT_RE.groupindex.keys() +
+        constants.TEXT_FORMAT_RE.groupindex.keys())
+
+  def testNestedCodeBlocks(self):
+    wiki_input = StringIO.StringIO(
+        "a\n{{{\n*x* {{{y}}}\n  {{{\n}}}\n  }}}\nb\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("a\n```\n*x* {{{y}}}\n  {{{\n}}}\n```\nb")
+    self.assertNoWarnings()
+
+  def testUnclosedCodeBlock(self):
+    wiki_input = StringIO.StringIO("a\n{{{\n{{{\nx\n}}}\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("a\n```\n{{{\nx\n}}}\n```")
+    self.assertNoWarnings()
+
+  def testUnclosedCodeBlockAtEnd(self):
+    wiki_input = StringIO.StringIO("{{{\nabc\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("\n```\nabc\n```")
+    self.assertNoWarnings()
+
+  def testCodeBlockEndWithoutStart(self):
+    wiki_input = StringIO.StringIO("a\n}}}\n*b*\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("a\n}}}\n**b**")
+
+  def testCodeBlockInHtml(self):
+    wiki_input = StringIO.StringIO("<span>\n{{{\nx < y\n}}}\n</span>\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("<span>\n<pre><code>x &lt; y<br>\n</code></pre>\n"
+                      "</span>")
+    self.assertWarning("Code markup was used within HTML tags")
+
+  def testPlainTextLine(self):
+    wiki_input = StringIO.StringIO("Just some text, with no markup.\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("Just some text, with no markup.")
+    self.assertNoWarnings()
+
+  def testIssueLinkNumbers(self):
+    self.formatting_handler._issue_map = issue_map.IssueMap(
+        u"https://github.com/abcxyz/test/issues/",
+        array.array("I", [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 7]))
+    wiki_input = StringIO.StringIO("bug 12 and issue #12\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("[bug 7](https://github.com/abcxyz/test/issues/7) and "
+                      "[issue #7](https://github.com/abcxyz/test/issues/7)")
+
+  def testTableCellWidthsAreInCharacters(self):
+    self.output = WriteOnlyStream()
+    wiki_input = StringIO.StringIO(u"||\u0b95\u0b95||ab||\n||x||y||\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput(u"|\u0b95\u0b95|ab|\n|:-|:-|\n|x |y |")
+    self.assertNoWarnings()
+
+  def testLargeUnclosedBoldParagraph(self):
+    # About 1 MB of text, bolded until the paragraph ends.
+    line = "abcdefghijklmno\n"
+    line_count = (1024 * 1024) / len(line)
+    wiki_input = StringIO.StringIO("*" + line * line_count + "\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertOutput("**" + line * (line_count - 1) + line.strip() + "**\n")
+    self.assertNoWarnings()
+
+  def testWarningSpansInNestedText(self):
+    wiki_input = StringIO.StringIO("x\n== see issue 5 ==\n||a||issue 6||\n")
+
+    self.converter.Convert(wiki_input, self.output)
+
+    self.assertEquals(
+        [(2, "issue-link", source_index.SourceSpan(2, 8, 9, 16)),
+         (3, "issue-link", source_index.SourceSpan(3, 6, 25, 32))],
+        [(line, code, span) for line, _, code, span in self.warnings])
+
+
+class TestSourceIndex(unittest.TestCase):
+  """Tests mapping offsets to lines and columns."""
+
+  def testGetLineColumn(self):
+    index = source_index.SourceIndex(["ab\n", "\n", "cde"])
+
+    self.assertEquals((1, 1), index.GetLineColumn(0))
+    self.assertEquals((1, 3), index.GetLineColumn(2))
+    self.assertEquals((2, 1), index.GetLineColumn(3))
+    self.assertEquals((3, 1), index.GetLineColumn(4))
+    self.assertEquals((3, 4), index.GetLineColumn(7))
+
+  def testGetLineStart(self):
+    index = source_index.SourceIndex(["ab\n", "\n", "cde"])
+
+    self.assertEquals([0, 3, 4, 7],
+                      [index.GetLineStart(line) for line in range(1, 5)])
+
+  def testEmptyPage(self):
+    index = source_index.SourceIndex([])
+
+    self.assertEquals(0, index.GetLineStart(1))
+    self.assertEquals(source_index.SourceSpan(1, 1, 0, 0), index.GetSpan(0, 0))
+
+
+class TestTokenizer(BaseTest):
+  """Tests tokenizing pages, and emitting the tokens."""
+
+  def testExamplePage(self):
+    with codecs.open("example.wiki", "rU", "utf-8") as example_input:
+      tokens, _ = tokenizer.Tokenize(
+          example_input, self._TrackWarning, "test", ["TestPage"])
+
+    with codecs.open("example.md", "rU", "utf-8") as example_output:
+      tokenizer.Emit(tokens, self.formatting_handler, self.output)
+
+      self.assertOutput(example_output.read())
+
+  def testEmitTokensAgain(self):
+    tokens, _ = tokenizer.Tokenize(
+        StringIO.StringIO("*bold* and TestPage\n\n||aa||bb||\n||c||d||\n"),
+        self._TrackWarning, "test", ["TestPage"])
+    tokenizer.Emit(tokens, self.formatting_handler, self.output)
+
+    self.setUp()
+    tokenizer.Emit(pickle.loads(pickle.dumps(tokens, 2)),
+                   self.formatting_handler, self.output)
+
+    self.assertOutput("**bold** and [TestPage](TestPage.md)\n\n"
+                      "|aa|bb|\n|:-|:-|\n|c |d |")
+
+  def testTokens(self):
+    tokens, index = tokenizer.Tokenize(
+        StringIO.StringIO("#summary s\n`code`\n"),
+        self._TrackWarning, "test", [])
+
+    self.assertEquals(
+        [(2, "HandleInlineCode", (u"code",), (11, 17))],
+        [(token.input_line, token.method, token.args, token.offsets)
+         for token in tokens])
+    self.assertEquals(source_index.SourceSpan(2, 1, 11, 17),
+                      index.GetSpan(*tokens[0].offsets))
+    self.assertEquals(
+        [(1, "pragma", source_index.SourceSpan(1, 1, 0, 11))],
+        [(line, code, span) for line, _, code, span in self.warnings])
+
+  def testEmitWarningSpans(self):
+    tokens, index = tokenizer.Tokenize(
+        StringIO.StringIO("a\n  * x <b>*c*</b> and issue 5\n"),
+        self._TrackWarning, "test", [])
+    tokenizer.Emit(tokens, self.formatting_handler, self.output, index)
+
+    self.assertEquals(
+        [(2, "html-translation", source_index.SourceSpan(2, 10, 11, 12)),
+         (2, "issue-link", source_index.SourceSpan(2, 22, 23, 30))],
+        sorted((line, code, span) for line, _, code, span in self.warnings))
+
+  def testBadTag(self):
+    recorder = tokenizer.TokenRecorder()
+
+    self.assertTrue(hasattr(recorder, "HandleBoldOpen"))
+    self.assertFalse(hasattr(recorder, "HandleBogusOpen"))
+    self.assertFalse(hasattr(recorder, "_Write"))
+
+
+class TestWiki2Gfm(BaseTest):
+  """Tests the command line tool."""
+
+  def setUp(self):
+    """Create a command line tool test."""
+    super(TestWiki2Gfm, self).setUp()
+    self.warning_collector = warning_collector.WarningCollector(["pragma"])
+
+  def _ConvertRecords(self, records, framing):
+    """Convert framed records, returning the framed output.
+
+    Args:
+        records: The framed input records.
+        framing: How the records are framed.
+    Returns:
+        The framed output records.
+    """
+    output = StringIO.StringIO()
+    wiki2gfm.ConvertRecords(
+        StringIO.StringIO(records),
+        output,
+        framing,
+        self.warning_collector,
+        project="test",
+        wikipages=["TestPage"],
+        issue_map={},
+        symmetric_headers=False)
+    return output.getvalue()
+
+  def testConvertPageWithAndWithoutTokens(self):
+    with codecs.open("example.wiki", "rU", "utf-8") as example_input:
+      page = example_input.read()
+
+    results = []
+    for keep_tokens in (False, True):
+      self.warnings = []
+      output = StringIO.StringIO()
+      converted = wiki2gfm.ConvertPage(
+          StringIO.StringIO(page),
+          output,
+          project="test",
+          wikipages=["TestPage"],
+          issue_map={},
+          symmetric_headers=False,
+          warning_method=self._TrackWarning,
+          keep_tokens=keep_tokens)
+      self.assertEquals(keep_tokens, converted is not None)
+      results.append((output.getvalue(), self.warnings))
+
+    # Tokenizing issues the warnings about the input before those about the
+    # output, but they are the same warnings.
+    self.assertEquals(results[0][0], results[1][0])
+    self.assertEquals(sorted(results[0][1], key=repr),
+                      sorted(results[1][1], key=repr))
+
+  def testReadNulRecords(self):
+    stream = StringIO.StringIO("a\0\0b\nc\0d")
+
+    self.assertListEqual(["a", "", "b\nc", "d"],
+                         list(wiki2gfm.ReadNulRecords(stream)))
+
+  def testReadGitBatchRecords(self):
+    stream = StringIO.StringIO("abc blob 4\na\0\nb\nabd missing\n")
+
+    self.assertListEqual([(["abc", "blob", "4"], "a\0\nb"),
+                          (["abd", "missing"], None)],
+                         list(wiki2gfm.ReadGitBatchRecords(stream)))
+
+  def testReadGitBatchRecordsWithPaths(self):
+    stream = StringIO.StringIO("abc blob 1 A.wiki\na\nabd missing\n")
+
+    self.assertListEqual([(["abc", "blob", "1", "A.wiki"], "a"),
+                          (["abd", "missing"], None)],
+                         list(wiki2gfm.ReadGitBatchRecords(stream)))
+
+  def testReadGitBatchRecordsKeepsRestOfHeader(self):
+    stream = StringIO.StringIO("abc blob 1 my  page\tA.wiki \na\n")
+
+    self.assertListEqual([(["abc", "blob", "1", "my  page\tA.wiki "], "a")],
+                         list(wiki2gfm.ReadGitBatchRecords(stream)))
+
+  def testConvertGitBatchRecordsKeepsPaths(self):
+    index = link_index.LinkIndex([])
+    records = "abc blob 3 wiki/My  Page.wiki\n*a*\nabd missing\n"
+    output = StringIO.StringIO()
+    wiki2gfm.ConvertRecords(
+        StringIO.StringIO(records),
+        output,
+        "git-batch",
+        self.warning_collector,
+        index,
+        project="test",
+        wikipages=[],
+        issue_map={},
+        symmetric_headers=False)
+
+    self.assertEquals("abc blob 5 wiki/My  Page.wiki\n**a**\nabd missing\n",
+                      output.getvalue())
+    adjacency = StringIO.StringIO()
+    index.WriteAdjacency(adjacency)
+    self.assertEquals(u"My  Page\n", adjacency.getvalue())
+
+  def testOpenStdinWithUniversalNewlines(self):
+    stdin = StringIO.StringIO("a\r\nb\rc\n\xc3\xa9")
+    with wiki2gfm._OpenFile("-", "rU", "utf-8", stdin) as stream:
+      self.assertEquals([u"a\n", u"b\n", u"c\n", u"\xe9"], stream.readlines())
+
+  def testLoadIssueMap(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      issue_map_path = os.path.join(temp_dir, "issue_map")
+      with open(issue_map_path, "wb") as issue_map_file:
+        issue_map_file.write("gcissuemap1 https://github.com/a/b/issues/\n")
+        issue_map_file.write(struct.pack("<4I", 0, 7, 0, 12))
+
+      loaded_map = issue_map.LoadIssueMap(issue_map_path)
+    finally:
+      shutil.rmtree(temp_dir)
+
+    self.assertEquals(2, len(loaded_map))
+    self.assertIn("1", loaded_map)
+    self.assertIn(3, loaded_map)
+    self.assertNotIn("2", loaded_map)
+    self.assertNotIn("4", loaded_map)
+    self.assertNotIn("x", loaded_map)
+    self.assertEquals(u"https://github.com/a/b/issues/12", loaded_map["3"])
+    with self.assertRaises(KeyError):
+      loaded_map["2"]
+
+  def testLoadIssueMapWrittenByExporter(self):
+    exporter_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..",
+        "googlecode-issues-exporter")
+    sys.path.insert(0, exporter_dir)
+    try:
+      import issues
+    finally:
+      sys.path.remove(exporter_dir)
+    self.assertEquals(issues.ISSUE_MAP_MAGIC, issue_map.ISSUE_MAP_MAGIC)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+      issue_map_path = os.path.join(temp_dir, "issue_map")
+      issues.WriteIssueMap(issue_map_path, {1: 7, 70000: 4000000000},
+                           "https://github.com/a/b/issues/")
+      loaded_map = issue_map.LoadIssueMap(issue_map_path)
+    finally:
+      shutil.rmtree(temp_dir)
+
+    self.assertEquals(2, len(loaded_map))
+    self.assertEquals(u"https://github.com/a/b/issues/7", loaded_map[1])
+    self.assertEquals(u"https://github.com/a/b/issues/4000000000",
+                      loaded_map[70000])
+
+  def testLoadIssueMapTruncated(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      issue_map_path = os.path.join(temp_dir, "issue_map")
+      with open(issue_map_path, "wb") as issue_map_file:
+        issue_map_file.write("gcissuemap1 https://github.com/a/b/issues/\n")
+        issue_map_file.write(struct.pack("<2I", 0, 7)[:-1])
+
+      with self.assertRaises(IOError):
+        issue_map.LoadIssueMap(issue_map_path)
+    finally:
+      shutil.rmtree(temp_dir)
+
+  def testLoadIssueMapNotAnIssueMap(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      issue_map_path = os.path.join(temp_dir, "issue_map")
+      with open(issue_map_path, "wb") as issue_map_file:
+        issue_map_file.write('{"1": 7}\n')
+
+      with self.assertRaises(IOError):
+        issue_map.LoadIssueMap(issue_map_path)
+    finally:
+      shutil.rmtree(temp_dir)
+
+  def testConvertNulRecords(self):
+    output = self._ConvertRecords("*a*\0TestPage\r\n\0", "nul")
+
+    self.assertEquals("**a**\0[TestPage](TestPage.md)\0", output)
+
+  def testConvertGitBatchRecords(self):
+    records = "abc blob 14\n*\xc3\xa9*\r\nTestPage\nabd missing\n"
+    output = self._ConvertRecords(records, "git-batch")
+
+    self.assertEquals("abc blob 30\n**\xc3\xa9**\n[TestPage](TestPage.md)\n"
+                      "abd missing\n", output)
+
+  def testConvertRecordsIndexesLinks(self):
+    index = link_index.LinkIndex(["TestPage"])
+    # MissingPage is autolinked, but not converted to a link as it is not
+    # assumed to exist.
+    records = ("a blob 43 wiki/A.wiki\n[B#Intro] [TestPage#x] [C] [#y] "
+               "MissingPage\n"
+               "b blob 22 wiki/B.wiki\n= Intro =\n[A] [#Intro]\n")
+    output = StringIO.StringIO()
+    wiki2gfm.ConvertRecords(
+        StringIO.StringIO(records),
+        output,
+        "git-batch",
+        self.warning_collector,
+        index,
+        project="test",
+        wikipages=["TestPage"],
+        issue_map={},
+        symmetric_headers=False)
+    index.ReportBrokenLinks()
+
+    self.assertTrue(output.getvalue().startswith("a blob 83 wiki/A.wiki\n"))
+
+    adjacency = StringIO.StringIO()
+    index.WriteAdjacency(adjacency)
+    self.assertEquals(
+        u"A\tB#Intro\tTestPage#x\tC\t#y\tMissingPage\nB\tA\t#Intro\n",
+        adjacency.getvalue())
+
+    json_lines = StringIO.StringIO()
+    self.warning_collector.WriteJsonLines(json_lines)
+    self.assertEquals(
+        u'{"code": "broken-link", "column": 24, "end": 26, "line": 1, '
+        '"message": "The page links to C, which does not exist.", '
+        '"page": "wiki/A.wiki", "start": 23}\n'
+        '{"code": "broken-anchor", "column": 28, "end": 31, "line": 1, '
+        '"message": "The page links to A, which has no heading y.", '
+        '"page": "wiki/A.wiki", "start": 27}\n'
+        '{"code": "broken-link", "column": 33, "end": 43, "line": 1, '
+        '"message": "The page links to MissingPage, which does not exist.", '
+        '"page": "wiki/A.wiki", "start": 32}\n',
+        json_lines.getvalue())
+
+  def testConvertRecordsWritesWarningsPerPage(self):
+    written = []
+
+    def WriteWarnings():
+      json_lines = StringIO.StringIO()
+      self.warning_collector.WriteJsonLines(json_lines)
+      self.warning_collector.ClearWarnings()
+      written.append(len(json_lines.getvalue().splitlines()))
+
+    wiki2gfm.ConvertRecords(
+        StringIO.StringIO("r1\0\0<wiki:toc> r2\0"),
+        StringIO.StringIO(),
+        "nul",
+        self.warning_collector,
+        write_warnings=WriteWarnings,
+        project="test",
+        wikipages=["TestPage"],
+        issue_map={},
+        symmetric_headers=False)
+
+    # Each page's warnings are written once, and not kept after that.
+    self.assertEquals([1, 0, 2], written)
+    summary = StringIO.StringIO()
+    self.warning_collector.WriteSummary(summary)
+    self.assertTrue(
+        summary.getvalue().startswith(u"3 warnings on 2 of 3 pages.\n"))
+
+  def testConvertRecordsCollectsWarningsPerPage(self):
+    self._ConvertRecords("#summary a\nr1\0\0<wiki:toc>\0", "nul")
+
+    report = StringIO.StringIO()
+    self.warning_collector.WriteReport(report)
+    self.assertIn(u"Warnings for record 1:\n\n"
+                  "Warning (line 2, column 1 of input file) [revision-link]:"
+                  "\n",
+                  report.getvalue())
+    self.assertNotIn(u"[pragma]", report.getvalue())
+    self.assertIn(u"Warnings for record 3:\n\n"
+                  "Warning (line 1, column 1 of input file) [wiki-toc]:\n",
+                  report.getvalue())
+
+    json_lines = StringIO.StringIO()
+    self.warning_collector.WriteJsonLines(json_lines)
+    self.assertEquals(2, len(json_lines.getvalue().splitlines()))
+    self.assertIn(u'"code": "wiki-toc", "column": 1, "end": 10, "line": 1, ',
+                  json_lines.getvalue())
+
+    summary = StringIO.StringIO()
+    self.warning_collector.WriteSummary(summary)
+    self.assertEquals(u"3 warnings on 2 of 3 pages.\n"
+                      "  pragma: 1 (suppressed)\n"
+                      "  revision-link: 1\n"
+                      "  wiki-toc: 1\n", summary.getvalue())
+
 
 if __name__ == "__main__":
   unittest.main()